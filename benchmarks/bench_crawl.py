@@ -0,0 +1,91 @@
+# End to end benchmark of the extraction modes against the local mock API.
+# Each mode crawls the same categories in a new process, and reports its throughput, the peak memory of the
+# process and of its workers, the requests received by the server (by endpoint and status) and the retries.
+# The mock can add latency, random 5xx errors and a rate limit (see mock_api.MockAPIServer).
+#
+# Usage:
+#     python -m benchmarks.bench_crawl --categories 6 --products 300 --latency 0.01
+#     python -m benchmarks.bench_crawl --modes sequential pages --error-rate 0.02 --rate-limit 200
+
+import time
+import argparse
+import resource
+import tempfile
+import multiprocessing
+from benchmarks.mock_api import MockCatalog, MockAPIServer
+
+MODES = {
+    'sequential': {'parallel': False},
+    'pages': {'parallel': True, 'schedule': 'pages'},
+    'categories': {'parallel': True, 'schedule': 'categories'},
+    'async': {}
+}
+
+def crawl(mode, url, args, results):
+    """
+    Extracts the categories with one of the MODES, and reports its metrics and peak memory.
+    """
+    from src.retrieve import meliRetriever
+    from src.async_retrieve import asyncMeliRetriever
+    with tempfile.TemporaryDirectory() as folder:
+        options = {'folder': folder, 'api_url': url, 'requests_per_second': args.requests_per_second, 'metrics_interval': None}
+        if mode == 'async':
+            retriever = asyncMeliRetriever('Colombia', 'mock', max_in_flight = args.max_in_flight,
+                                           max_pages_in_flight = args.max_pages_in_flight, **options)
+        else:
+            retriever = meliRetriever('Colombia', 'mock', n_jobs = args.n_jobs, **options, **MODES[mode])
+        retriever.available_categories = dict(list(retriever.available_categories.items())[:args.categories])
+        start = time.perf_counter()
+        retriever.create_dataset(products_per_category = args.products)
+        elapsed = time.perf_counter() - start
+    metrics = retriever.metrics.stats()
+    results.put({
+        'seconds': elapsed,
+        'items': metrics['items'],
+        'failed_pages': metrics['failed_pages'],
+        'retries': sum(endpoint_stats['retries'] for endpoint_stats in metrics['endpoints'].values()),
+        'sleep_seconds': metrics['sleep_seconds'],
+        'peak_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024,
+        'workers_peak_mb': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss/1024
+    })
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Throughput, memory and requests of each extraction mode.')
+    parser.add_argument('--data', default = 'data')
+    parser.add_argument('--modes', nargs = '+', default = list(MODES), choices = list(MODES))
+    parser.add_argument('--categories', type = int, default = 6)
+    parser.add_argument('--products', type = int, default = 300, help = 'Products of each category')
+    parser.add_argument('--n-jobs', type = int, default = 4)
+    parser.add_argument('--max-in-flight', type = int, default = 50)
+    parser.add_argument('--max-pages-in-flight', type = int, default = None, help = 'Pages of the async mode at the same time (max_in_flight/25 if not given)')
+    parser.add_argument('--requests-per-second', type = float, default = 1e9, help = 'Target rate of the retriever')
+    parser.add_argument('--latency', type = float, default = 0.01)
+    parser.add_argument('--jitter', type = float, default = 0.0)
+    parser.add_argument('--error-rate', type = float, default = 0.0)
+    parser.add_argument('--rate-limit', type = float, default = None)
+    args = parser.parse_args()
+
+    server = MockAPIServer(MockCatalog(args.data, products_per_category = args.products), latency = args.latency, jitter = args.jitter,
+                           error_rate = args.error_rate, rate_limit = args.rate_limit).start()
+    context = multiprocessing.get_context('spawn') # A new process for each mode, so the peak memory isn't shared
+    print(f'{args.categories} categories of {args.products} products, latency {args.latency*1000:.0f} ms, '
+          f'error rate {args.error_rate}, rate limit {args.rate_limit}')
+    print(f"{'mode':<12}{'seconds':>9}{'products/s':>12}{'requests':>10}{'429':>7}{'5xx':>7}{'retries':>9}{'failed':>8}"
+          f"{'sleep s':>9}{'peak MB':>9}{'workers MB':>12}")
+    for mode in args.modes:
+        server.reset_stats()
+        results = context.Queue()
+        process = context.Process(target = crawl, args = (mode, server.url, args, results))
+        process.start()
+        result = results.get()
+        process.join()
+        stats = server.stats()
+        statuses = stats['responses_by_status']
+        print(f"{mode:<12}{result['seconds']:>9.1f}{result['items']/result['seconds']:>12.1f}{stats['requests']:>10}"
+              f"{statuses.get(429, 0):>7}{statuses.get(500, 0) + statuses.get(503, 0):>7}{result['retries']:>9}"
+              f"{result['failed_pages']:>8}{result['sleep_seconds']:>9.1f}{result['peak_mb']:>9.0f}{result['workers_peak_mb']:>12.0f}")
+    server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+# Percentage breakdowns of sold_quantity of the exploratory notebooks, from the raw products and from the cube.
+# 1. As in the notebooks: all the CSVs are read, and each breakdown groups all the products.
+# 2. With notebooks/model/cube.py: the cube is built (once), loaded from its Parquet file, and each breakdown is
+#    a group by over its counts. Every breakdown must equal the one of the notebooks.
+# 3. Incremental update: the cube of all the files but one is built, then the last file lands and only
+#    that file is read. The result must equal the cube built from all the files.
+#
+# Usage:
+#     python -m benchmarks.bench_cube --data data --repetitions 5
+
+import os
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+import pandas as pd
+from notebooks.model.cube import DIMENSIONS, MEASURE, AggregateCube, cube_columns
+
+EXCLUDED_CATEGORIES = ['Carros, Motos y Otros', 'Inmuebles', 'Servicios'] # df_sin_tres_categorias of EDA_SoldQuantity
+
+BREAKDOWNS = [(dimension, MEASURE, False) for dimension in DIMENSIONS] + [
+    (MEASURE, 'available_quantity', False),
+    ('seller_powerseller', MEASURE, True),
+    ('listing_type_id', MEASURE, True),
+    ('updated_picture', MEASURE, True)
+]
+
+def notebook_percentages(products_df, index, columns):
+    """
+    The breakdown of the notebooks (group_keys = False keeps its shape in every version of pandas).
+    """
+    return products_df.groupby([index, columns]).size().groupby(level = 0, group_keys = False).apply(
+        lambda x: 100 * x / x.sum()
+    ).unstack()
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Percentage breakdowns from the raw products and from the aggregate cube.')
+    parser.add_argument('--data', default = 'data')
+    parser.add_argument('--repetitions', type = int, default = 5)
+    args = parser.parse_args()
+
+    def load_products():
+        files = sorted(file for file in os.listdir(args.data) if file.endswith('.csv'))
+        complete_df = pd.concat([pd.read_csv(os.path.join(args.data, file), sep = ';', dtype = str) for file in files],
+                                axis = 0, ignore_index = True)
+        return cube_columns(complete_df)
+    products_df, load_seconds = timed(load_products)
+    without_excluded = products_df[~products_df.category_name.isin(EXCLUDED_CATEGORIES)]
+    print(f'{len(products_df)} products, {len(BREAKDOWNS)} breakdowns')
+
+    with tempfile.TemporaryDirectory() as cache_folder:
+        cube = AggregateCube(args.data, cache_folder = cache_folder)
+        _, build_seconds = timed(cube.update)
+        updated_files, unchanged_seconds = timed(cube.update)
+        assert updated_files == []
+        loaded_cube = AggregateCube(args.data, cache_folder = cache_folder)
+        _, cube_load_seconds = timed(lambda: loaded_cube.cube)
+        print(f"Cube: {len(cube.cube)} rows, built in {build_seconds:.2f} s, update without changes {unchanged_seconds:.2f} s\n")
+
+        print(f"{'breakdown':<60}{'notebook ms':>12}{'cube ms':>10}")
+        notebook_total, cube_total = load_seconds, cube_load_seconds
+        for index, columns, excluded in BREAKDOWNS:
+            source_df = without_excluded if excluded else products_df
+            where = (lambda cube: ~cube.category_name.isin(EXCLUDED_CATEGORIES)) if excluded else None
+            expected = notebook_percentages(source_df, index, columns)
+            result = cube.percentages(index, columns, where = where)
+            pd.testing.assert_frame_equal(result, expected, check_dtype = False, check_names = False)
+            notebook_seconds = statistics.median(timed(lambda: notebook_percentages(source_df, index, columns))[1] for _ in range(args.repetitions))
+            cube_seconds = statistics.median(timed(lambda: cube.percentages(index, columns, where = where))[1] for _ in range(args.repetitions))
+            notebook_total, cube_total = notebook_total + notebook_seconds, cube_total + cube_seconds
+            name = f"{index} x {columns}{' (without 3 categories)' if excluded else ''}"
+            print(f'{name:<60}{notebook_seconds*1000:>12.1f}{cube_seconds*1000:>10.1f}')
+        print(f"\nLoading and all the breakdowns: notebook {notebook_total:.2f} s (loading {load_seconds:.2f} s), "
+              f"cube {cube_total:.3f} s (loading {cube_load_seconds:.3f} s)")
+        full_cube = cube.cube
+
+    with tempfile.TemporaryDirectory() as data_folder:
+        files = sorted(file for file in os.listdir(args.data) if file.endswith('.csv'))
+        for file in files[:-1]:
+            shutil.copy(os.path.join(args.data, file), data_folder)
+        cube = AggregateCube(data_folder)
+        cube.update()
+        shutil.copy(os.path.join(args.data, files[-1]), data_folder)
+        updated_files, incremental_seconds = timed(cube.update)
+        print(f'Incremental update after {files[-1]} landed: {updated_files} read in {incremental_seconds:.2f} s '
+              f'(full build {build_seconds:.2f} s)')
+        assert updated_files == [files[-1]]
+        sort = lambda cube_df: cube_df.sort_values(cube.columns, na_position = 'first').reset_index(drop = True)
+        pd.testing.assert_frame_equal(sort(cube.cube), sort(full_cube), check_dtype = False)
+    print('The breakdowns of the cube are equal to the ones of the notebooks')
+
+
+if __name__ == '__main__':
+    main()
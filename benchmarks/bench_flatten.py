@@ -0,0 +1,158 @@
+# Microbenchmark of the flattening of the search pages into DataFrames.
+# Compares the previous path of meliRetriever (single_attribute_keys_df, four iterate_and_combine passes and a
+# merge on id), kept here as the baseline, with the declarative PageFlattener, on search and questions payloads
+# synthesized by the mock catalog. The pages built by both paths are checked to write the same CSV. Pages that
+# list a product twice are excluded from the check: the merge on id repeats their rows (n*n rows for n listings),
+# the flattener doesn't.
+#
+# Usage:
+#     python -m benchmarks.bench_flatten --pages 200
+
+import time
+import argparse
+import pandas as pd
+from collections import defaultdict
+from src.retrieve import meliRetriever
+from src.storage import OUTPUT_COLUMNS
+from benchmarks.mock_api import MockCatalog, MockAPIServer
+
+SINGLE_ATTRIBUTE_KEYS = ['id', 'category_id', 'title', 'price', 'available_quantity', 'sold_quantity', 
+                         'buying_mode', 'listing_type_id', 'accepts_mercadopago', 'original_price', 'condition']
+
+def single_attribute_keys_df(product_json):
+    """
+    The single-valued attributes of the products, in a DataFrame.
+    """
+    merge_dictionary = defaultdict(list)
+    for dictionary in product_json: # Combines the values of each key into a list.
+        for key, value in dictionary.items():
+            merge_dictionary[key].append(value)
+    selected_features = {k:v for (k,v) in merge_dictionary.items() if k in SINGLE_ATTRIBUTE_KEYS}
+    return pd.DataFrame.from_dict(selected_features)
+
+def iterate_and_combine(product_json, function):
+    """
+    Applies the extraction function to each product, and combines the values of each key into a list.
+    """
+    merge_dictionary = defaultdict(list)
+    for idx in range(len(product_json)):
+        for key, value in function(product_json, idx).items():
+            merge_dictionary[key].append(value)
+    return merge_dictionary
+
+def extract_seller_attributes(product_json, idx):
+    """
+    Extract information about the reputation of the seller in the Marketplace
+    """
+    seller_reputation = product_json[idx]['seller'].get('seller_reputation', {})
+    ratings = seller_reputation.get('transactions', {}).get('ratings', {})
+    return {
+        'seller_level_id': seller_reputation.get('level_id'),
+        'seller_powerseller': seller_reputation.get('power_seller_status'),
+        'positive_rating': ratings.get('positive'),
+        'negative_rating': ratings.get('negative'),
+        'neutral_rating': ratings.get('neutral')
+    }
+
+def extract_nested_product_info(product_json, idx):
+    """
+    Extracts additional information of the product, such as shipping and tags.
+    """
+    product_info = product_json[idx]
+    return {
+        'id' : product_info['id'],
+        'free_shipping' : product_info['shipping']['free_shipping'], 
+        'store_pickup' : product_info['shipping']['store_pick_up'],
+        'number_of_tags' : len(product_info['tags']),
+        'is_official_store': (product_info['official_store_id'] is not None)
+    }
+
+def date_information(product_json, idx):
+    """
+    Extract the last time of product updating based on thumbnail information
+    """
+    thumbnail_info = product_json[idx].get('thumbnail')
+    if thumbnail_info is not None:
+        thumbnail_date = thumbnail_info.split('_')[-1]
+        month_update, year_update = thumbnail_date[:2], thumbnail_date[2:6]
+    else:
+        month_update, year_update = None, None
+    return {'month_update' : month_update, 'year_update' : year_update}
+
+def question_information(question_json, idx):
+    """
+    The number of questions made about a product, and the date of the first one.
+    """
+    questions = question_json[idx].get('questions', [])
+    if questions:
+        year_created, month_created = questions[0]['date_created'].split('-')[:2]
+    else:
+        year_created, month_created = None, None
+    return {'year_created' : year_created, 'month_created' : month_created, 'total_questions': question_json[idx].get('total')}
+
+def merged_page_df(product_json, question_json):
+    """
+    The page DataFrame as it was built before PageFlattener.
+    """
+    nested_info = iterate_and_combine(product_json, extract_seller_attributes)
+    for information in [iterate_and_combine(product_json, extract_nested_product_info), 
+                        iterate_and_combine(product_json, date_information),
+                        iterate_and_combine(question_json, question_information)]:
+        nested_info.update(information)
+    return single_attribute_keys_df(product_json).merge(pd.DataFrame.from_dict(nested_info), on = 'id')
+
+def page_csv(page_df):
+    return page_df.reindex(columns = OUTPUT_COLUMNS[:-1]).to_csv(sep = ';', index = False, header = False)
+
+def cpu_time_per_page(build, pages, repeat):
+    """
+    Milliseconds of CPU time needed to build a page, taking the best of `repeat` rounds.
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.process_time()
+        for product_json, question_json in pages:
+            build(product_json, question_json)
+        best = min(best, time.process_time() - start)
+    return 1000*best/len(pages)
+
+def main():
+    parser = argparse.ArgumentParser(description = 'CPU time per page of the page flattening.')
+    parser.add_argument('--data', default = 'data')
+    parser.add_argument('--pages', type = int, default = 200)
+    parser.add_argument('--repeat', type = int, default = 3)
+    args = parser.parse_args()
+
+    catalog = MockCatalog(args.data)
+    server = MockAPIServer(catalog).start()
+    retriever = meliRetriever('Colombia', token = 'mock', api_url = server.url, parallel = False)
+    server.stop()
+
+    pages = []
+    for category_id, category in catalog.categories.items():
+        for offset in range(0, len(category['ids']), 50):
+            product_json = catalog.search(category_id, offset)['results']
+            question_json = [catalog.questions(product['id']) for product in product_json]
+            pages.append((product_json, question_json))
+    pages = pages[:args.pages]
+
+    modes = {
+        'merge': merged_page_df,
+        'flattener': retriever.build_page_df
+    }
+    repeated_ids = 0
+    for product_json, question_json in pages:
+        if len({product['id'] for product in product_json}) < len(product_json):
+            repeated_ids += 1
+            continue
+        assert page_csv(modes['merge'](product_json, question_json)) == page_csv(modes['flattener'](product_json, question_json))
+
+    print(f'{len(pages)} pages of {sum(len(product_json) for product_json, _ in pages)} products, same CSV in both modes '
+          f'({repeated_ids} pages with repeated products excluded)')
+    print(f"{'mode':<12}{'ms/page':>10}")
+    for mode, build in modes.items():
+        print(f'{mode:<12}{cpu_time_per_page(build, pages, args.repeat):>10.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+# Extraction of products listed by several categories, with and without the index of the retrieved products.
+# Some products of the CSVs are listed in more than one category (and a few twice in the same one), so without
+# src/item_index.py their questions are requested, and the products written, once for each listing. With the
+# index, each id must be stored only once, and the questions requests must drop by the requests saved by the
+# metrics. Each extraction mode is run with the index. Finally, an extraction whose pages fail is resumed with the
+# same index: the ids of the failed pages must not be lost.
+#
+# Usage:
+#     python -m benchmarks.bench_item_index --products 200 --modes pages async
+
+import os
+import time
+import argparse
+import tempfile
+import pandas as pd
+from collections import Counter
+from benchmarks.mock_api import MockCatalog, MockAPIServer
+
+MODES = {
+    'sequential': {'parallel': False},
+    'pages': {'parallel': True, 'schedule': 'pages'},
+    'categories': {'parallel': True, 'schedule': 'categories'},
+    'async': {}
+}
+
+def crawl(server, args, mode, indexed):
+    """
+    Extracts the categories in a temporary folder.
+
+    Returns
+    ---------
+        result (dict):
+            The seconds, requests by endpoint and duplicates skipped of the extraction, and the stored ids.
+    """
+    from src.retrieve import meliRetriever
+    from src.async_retrieve import asyncMeliRetriever
+    from src.item_index import ItemIndex
+    with tempfile.TemporaryDirectory() as folder:
+        options = {'folder': folder, 'api_url': server.url, 'requests_per_second': 1e9, 'metrics_interval': None,
+                   'item_index': ItemIndex(os.path.join(folder, '.items.sqlite')) if indexed else None}
+        if mode == 'async':
+            retriever = asyncMeliRetriever('Colombia', 'mock', **options)
+        else:
+            retriever = meliRetriever('Colombia', 'mock', n_jobs = args.n_jobs, **options, **MODES[mode])
+        if args.categories is not None:
+            retriever.available_categories = dict(list(retriever.available_categories.items())[:args.categories])
+        server.reset_stats()
+        start = time.perf_counter()
+        retriever.create_dataset(products_per_category = args.products)
+        elapsed = time.perf_counter() - start
+        stored_ids = [product_id for category_id in retriever.available_categories
+                        for product_id in pd.read_csv(retriever.category_path(category_id), sep = ';', usecols = ['id'], dtype = str)['id']]
+    stats = server.stats()
+    return {
+        'seconds': elapsed,
+        'requests': stats['requests'],
+        'questions': stats['requests_by_endpoint'].get('questions', 0),
+        'duplicates': retriever.metrics.stats()['duplicates'],
+        'saved_requests': retriever.metrics.stats()['saved_requests'],
+        'categories': list(retriever.available_categories),
+        'stored_ids': stored_ids
+    }
+
+def resume_after_failures(server, args, failing_page = 3):
+    """
+    Extracts the categories with the index, failing every failing_page-th page after its products were listed
+    (and their duplicates looked up), and resumes the extraction in the same folder and with the same index.
+
+    Returns
+    ---------
+        stored_ids (list):
+            The ids of the resumed dataset.
+    """
+    from src.retrieve import meliRetriever, PageFetchError
+    from src.item_index import ItemIndex
+
+    class FailingRetriever(meliRetriever):
+        def list_marketplace_products(self, site_id, category_id, offset, shard = None):
+            page_df = super().list_marketplace_products(site_id, category_id, offset, shard)
+            self.listed_pages = getattr(self, 'listed_pages', 0) + 1
+            if self.failing and self.listed_pages % failing_page == 0:
+                raise PageFetchError(f'Page {offset} of {category_id} failed on purpose')
+            return page_df
+
+    with tempfile.TemporaryDirectory() as folder:
+        stored_ids = []
+        for failing in [True, False]:
+            retriever = FailingRetriever('Colombia', 'mock', folder = folder, api_url = server.url, requests_per_second = 1e9,
+                                         metrics_interval = None, parallel = False, max_page_retries = 0,
+                                         item_index = ItemIndex(os.path.join(folder, '.items.sqlite')))
+            retriever.failing = failing
+            if args.categories is not None:
+                retriever.available_categories = dict(list(retriever.available_categories.items())[:args.categories])
+            retriever.create_dataset(products_per_category = args.products)
+        for category_id in retriever.available_categories:
+            stored_ids.extend(pd.read_csv(retriever.category_path(category_id), sep = ';', usecols = ['id'], dtype = str)['id'])
+    return stored_ids
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Requests and stored products with and without the index of retrieved products.')
+    parser.add_argument('--data', default = 'data')
+    parser.add_argument('--modes', nargs = '+', default = list(MODES), choices = list(MODES))
+    parser.add_argument('--categories', type = int, default = None, help = 'Number of categories (all of them if not given)')
+    parser.add_argument('--products', type = int, default = 200, help = 'Products of each category')
+    parser.add_argument('--n-jobs', type = int, default = 4)
+    parser.add_argument('--latency', type = float, default = 0.005)
+    args = parser.parse_args()
+
+    catalog = MockCatalog(args.data, products_per_category = args.products)
+    server = MockAPIServer(catalog, latency = args.latency).start()
+    print(f"{'extraction':<24}{'seconds':>9}{'requests':>10}{'questions':>11}{'skipped':>9}{'rows':>8}{'ids':>8}")
+    runs = [('sequential, no index', 'sequential', False)] + [(f'{mode}, index', mode, True) for mode in args.modes]
+    results = {}
+    for name, mode, indexed in runs:
+        result = results[name] = crawl(server, args, mode, indexed)
+        print(f"{name:<24}{result['seconds']:>9.1f}{result['requests']:>10}{result['questions']:>11}{result['duplicates']:>9}"
+              f"{len(result['stored_ids']):>8}{len(set(result['stored_ids'])):>8}")
+
+    baseline = results['sequential, no index']
+    listed_ids = Counter(product_id for category_id in baseline['categories'] for product_id in catalog.categories[category_id]['ids'])
+    assert Counter(baseline['stored_ids']) == listed_ids
+    for name, mode, indexed in runs[1:]:
+        result = results[name]
+        assert Counter(result['stored_ids']) == Counter(set(listed_ids)), name # Every product, once
+        assert result['duplicates'] == sum(listed_ids.values()) - len(listed_ids), name
+        assert result['questions'] == baseline['questions'] - result['saved_requests'], name
+    print(f'\n{sum(listed_ids.values()) - len(listed_ids)} duplicate listings of {len(listed_ids)} products: '
+          'with the index, each product was stored once')
+
+    resumed_ids = resume_after_failures(server, args)
+    assert Counter(resumed_ids) == Counter(set(listed_ids))
+    print('Resumed after failed pages: every product stored once')
+    server.stop()
+
+
+if __name__ == '__main__':
+    main()
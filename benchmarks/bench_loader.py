@@ -0,0 +1,73 @@
+# Memory of the Colombian dataset loaded as in the notebooks (pandas.read_csv of each file and pd.concat) and
+# with src/loader.py (declared compact types, files read in parallel into preallocated columns).
+# Each load runs in a new process, so its peak memory (max RSS) includes the transient copies. The memory of each
+# column is reported with loader.memory_report, and the values of both loads must be the same.
+#
+# Usage:
+#     python -m benchmarks.bench_loader --data data --n-jobs 4
+
+import os
+import time
+import argparse
+import resource
+import multiprocessing
+import numpy as np
+import pandas as pd
+from src.loader import DatasetLoader, memory_report
+
+def notebook_load(data_folder):
+    """
+    The load of the notebooks: every file with the types inferred by pandas, and their concatenation.
+    """
+    data_by_category = [pd.read_csv(os.path.join(data_folder, file), sep = ';') for file in sorted(os.listdir(data_folder)) if file.endswith('.csv')]
+    return pd.concat(data_by_category, axis = 0, ignore_index = True)
+
+def measure(name, args, results):
+    """
+    Loads the dataset in this process, and reports the seconds and the peak memory.
+    """
+    start = time.perf_counter()
+    products_df = notebook_load(args.data) if name == 'notebooks' else DatasetLoader(args.data, n_jobs = args.n_jobs).load()
+    results.put({'seconds': time.perf_counter() - start, 'rows': len(products_df),
+                 'peak_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024})
+
+def same_values(before, after):
+    """
+    Whether a column loaded by the notebooks has the same values with the types of the loader.
+    """
+    if pd.api.types.is_numeric_dtype(before.dtype) or pd.api.types.is_bool_dtype(before.dtype):
+        before_values = before.to_numpy(dtype = float, na_value = np.nan)
+        after_values = after.to_numpy(dtype = float, na_value = np.nan)
+        return np.allclose(before_values, after_values, rtol = 1e-6, equal_nan = True) # The ratings are float32
+    before_values = pd.to_numeric(before, errors = 'coerce') if pd.api.types.is_numeric_dtype(after.dtype) else before
+    return before_values.astype(object).where(before_values.notna(), None).tolist() == after.astype(object).where(after.notna(), None).tolist()
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Memory of the dataset loaded by the notebooks and by DatasetLoader.')
+    parser.add_argument('--data', default = 'data')
+    parser.add_argument('--n-jobs', type = int, default = 4)
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context('spawn')
+    print(f"{'load':<16}{'seconds':>9}{'rows':>10}{'peak MB':>10}")
+    for name in ['notebooks', 'DatasetLoader']:
+        results = context.Queue()
+        process = context.Process(target = measure, args = (name, args, results))
+        process.start()
+        result = results.get()
+        process.join()
+        print(f"{name:<16}{result['seconds']:>9.2f}{result['rows']:>10}{result['peak_mb']:>10.0f}")
+
+    before_df, after_df = notebook_load(args.data), DatasetLoader(args.data, n_jobs = args.n_jobs).load()
+    report_df = memory_report(before_df, after_df)
+    with pd.option_context('display.width', 200, 'display.float_format', '{:.2f}'.format):
+        print(f'\n{report_df}')
+    assert list(after_df.columns) == list(before_df.columns) and len(after_df) == len(before_df)
+    different_columns = [column for column in before_df.columns if not same_values(before_df[column], after_df[column])]
+    assert not different_columns, different_columns
+    print(f"\n{len(after_df)} products: {report_df.loc['Total', 'mb_before']:.1f} MB -> {report_df.loc['Total', 'mb_after']:.1f} MB "
+          f"({report_df.loc['Total', 'ratio']:.1f}x), with the same values")
+
+
+if __name__ == '__main__':
+    main()
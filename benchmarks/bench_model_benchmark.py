@@ -0,0 +1,115 @@
+# Parity check and timing of the vectorized benchmark model (notebooks/model/benchmark.py).
+# The previous row by row fit/predict (DataFrame.apply with axis = 1) is reproduced here with the row methods
+# of the class, and both versions are checked to build the same lookup table and predictions on the
+# features of the model notebook, including ties between modes, missing ages and unseen groups.
+#
+# Usage:
+#     python -m benchmarks.bench_model_benchmark --rows 5000000
+
+import os
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from src.storage import CSVStorage
+from notebooks.model.benchmark import benchmark
+
+def model_features(complete_df):
+    """
+    The features of the model notebook (MODEL_SoldQuantity.ipynb).
+    """
+    features_df = pd.DataFrame(index = complete_df.index)
+    features_df['golden_categories'] = 1*(complete_df.listing_type_id.isin(['gold_pro', 'gold_special']))
+    features_df['is_new'] = 1*(complete_df.condition=='new')
+    features_df['product_age'] = 12*(2020 - complete_df.year_created) + (12 - complete_df.month_created) + 1
+    return features_df
+
+def row_fit(model, X, y):
+    """
+    benchmark.fit before the vectorization.
+    """
+    concat_df = pd.concat([X, y], axis = 1)
+    concat_df['groupings'] = concat_df.apply(model.create_group_by_months, axis = 1)
+    mode_by_group = concat_df.groupby('groupings').sold_quantity.apply(lambda x: x.mode()).reset_index()
+    model.lookup_model = dict(zip(mode_by_group.groupings, mode_by_group.sold_quantity))
+
+def row_predict(model, X):
+    """
+    benchmark.predict before the vectorization.
+    """
+    X_copy = X.copy()
+    X_copy['groupings'] = X_copy.apply(model.create_group_by_months, axis = 1)
+    X_copy['prediction'] = X_copy.apply(model.lookup, axis = 1)
+    return X_copy.prediction.values
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - start
+
+def check_parity(X, y, grouping):
+    """
+    Fits and predicts with both versions, and checks that they agree.
+    """
+    row_model, vector_model = benchmark(grouping), benchmark(grouping)
+    row_fit(row_model, X, y)
+    vector_model.fit(X, y)
+    assert row_model.lookup_model == vector_model.lookup_model
+    row_predictions, vector_predictions = row_predict(row_model, X), vector_model.predict(X)
+    assert np.array_equal(row_predictions, vector_predictions) and row_predictions.dtype == vector_predictions.dtype
+
+def check_unseen_group(X, y):
+    """
+    Both versions raise a KeyError when a group wasn't seen in fit.
+    """
+    seen = X.product_age.notna()
+    row_model, vector_model = benchmark(), benchmark()
+    row_fit(row_model, X[seen], y[seen])
+    vector_model.fit(X[seen], y[seen])
+    for predict in [lambda X: row_predict(row_model, X), vector_model.predict]:
+        try:
+            predict(X)
+        except KeyError:
+            continue
+        raise AssertionError('Expected a KeyError for the products without age')
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Parity and speed of the vectorized benchmark model.')
+    parser.add_argument('--data', default = 'data')
+    parser.add_argument('--rows', type = int, default = 5000000)
+    args = parser.parse_args()
+
+    category_ids = sorted(file[:-len('.csv')] for file in os.listdir(args.data) if file.endswith('.csv'))
+    complete_df = CSVStorage(args.data).load(category_ids)
+    X, y = model_features(complete_df), complete_df.sold_quantity
+
+    ties_X = pd.DataFrame({'golden_categories': [1, 1, 0, 1, 1, 1], 'is_new': [1, 1, 1, 0, 1, 1],
+                           'product_age': [1, 2, 3, 4, np.nan, 80]})
+    ties_y = pd.Series([5, 1, 1, 5, 7, 2], name = 'sold_quantity')
+    for grouping in [1, 2, 3]:
+        check_parity(ties_X, ties_y, grouping)
+        check_parity(X, y, grouping)
+    check_parity(X, y.to_frame(), 2)
+    check_unseen_group(X, y)
+    print(f'Same lookup table and predictions on {len(X)} products')
+
+    model = benchmark()
+    _, row_fit_time = timed(lambda: row_fit(model, X, y))
+    _, row_predict_time = timed(lambda: row_predict(model, X))
+    _, fit_time = timed(lambda: model.fit(X, y))
+    _, predict_time = timed(lambda: model.predict(X))
+
+    repeats = -(-args.rows//len(X))
+    large_X = pd.concat([X]*repeats, ignore_index = True).iloc[:args.rows]
+    large_y = pd.concat([y]*repeats, ignore_index = True).iloc[:args.rows]
+    _, large_fit_time = timed(lambda: model.fit(large_X, large_y))
+    _, large_predict_time = timed(lambda: model.predict(large_X))
+
+    print(f"{'rows':>10}{'version':>10}{'fit s':>10}{'predict s':>12}")
+    print(f"{len(X):>10}{'rows':>10}{row_fit_time:>10.2f}{row_predict_time:>12.2f}")
+    print(f"{len(X):>10}{'arrays':>10}{fit_time:>10.3f}{predict_time:>12.3f}")
+    print(f"{len(large_X):>10}{'arrays':>10}{large_fit_time:>10.3f}{large_predict_time:>12.3f}")
+
+
+if __name__ == '__main__':
+    main()
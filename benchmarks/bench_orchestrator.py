@@ -0,0 +1,65 @@
+# Benchmark of the multi-site extraction against the local mock API.
+# The mock serves the stored categories as several sites. Compares one meliRetriever per site, each with its own
+# joblib pool (run one after the other), with meliOrchestrator, which schedules the pages of every site on one pool,
+# and checks that both write the same files.
+#
+# Usage:
+#     python -m benchmarks.bench_orchestrator --sites Colombia Argentina Mexico --products 300 --n-jobs 4
+
+import os
+import time
+import filecmp
+import argparse
+import tempfile
+from src.retrieve import meliRetriever
+from src.orchestrator import meliOrchestrator
+from benchmarks.mock_api import MockCatalog, MultiSiteCatalog, MockAPIServer
+
+SITE_IDS = {'Colombia': 'MCO', 'Argentina': 'MLA', 'Mexico': 'MLM', 'Brasil': 'MLB', 'Chile': 'MLC'}
+
+def main():
+    parser = argparse.ArgumentParser(description = 'One pool per site versus one pool for all the sites.')
+    parser.add_argument('--data', default = 'data')
+    parser.add_argument('--sites', nargs = '+', default = ['Colombia', 'Argentina', 'Mexico'])
+    parser.add_argument('--products', type = int, default = 300, help = 'Products of each category served by the mock')
+    parser.add_argument('--categories', type = int, default = None, help = 'Categories of each site. If None, all of them')
+    parser.add_argument('--n-jobs', type = int, default = 4)
+    args = parser.parse_args()
+
+    catalogs = [MockCatalog(args.data, SITE_IDS[site_name], site_name, products_per_category = args.products) for site_name in args.sites]
+    server = MockAPIServer(MultiSiteCatalog(catalogs)).start()
+    options = {'api_url': server.url, 'requests_per_second': 1e9}
+
+    def limit_categories(retriever):
+        retriever.available_categories = dict(list(retriever.available_categories.items())[:args.categories])
+
+    with tempfile.TemporaryDirectory() as per_site_folder, tempfile.TemporaryDirectory() as shared_folder:
+        start = time.perf_counter()
+        for site_name in args.sites:
+            site_id = SITE_IDS[site_name]
+            retriever = meliRetriever(site_name, 'mock', folder = os.path.join(per_site_folder, site_id), n_jobs = args.n_jobs, **options)
+            limit_categories(retriever)
+            retriever.create_dataset(products_per_category = args.products)
+        per_site_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        orchestrator = meliOrchestrator(args.sites, 'mock', folder = shared_folder, n_jobs = args.n_jobs, verbose = False, **options)
+        for retriever in orchestrator.retrievers.values():
+            limit_categories(retriever)
+        category_paths = orchestrator.create_datasets(products_per_category = args.products)
+        shared_time = time.perf_counter() - start
+
+        files = [os.path.relpath(path, shared_folder) for paths in category_paths.values() for path in paths.values()]
+        _, mismatch, errors = filecmp.cmpfiles(per_site_folder, shared_folder, files, shallow = False)
+        assert not mismatch and not errors, mismatch + errors
+
+    server.stop()
+    print(f'{len(args.sites)} sites, {len(files)} categories, {args.n_jobs} workers')
+    print(f"{'extraction':<28}{'seconds':>10}")
+    print(f"{'one pool for each site':<28}{per_site_time:>10.1f}")
+    print(f"{'meliOrchestrator':<28}{shared_time:>10.1f}")
+    print('The files of both extractions are equal')
+
+
+if __name__ == '__main__':
+    main()
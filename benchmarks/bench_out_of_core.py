@@ -0,0 +1,80 @@
+# Benchmark of the out-of-core training of the sold_quantity classifier (notebooks/model/out_of_core.py).
+# Trains the same classifier on the same hash split in memory (all the products loaded at once, as the model
+# notebook) and streaming the category files, each one in a new process, and compares the peak memory, the
+# time and the metrics on the test split. The metrics of both paths must match.
+#
+# Usage:
+#     python -m benchmarks.bench_out_of_core --data data --chunksize 20000 --trees 100
+
+import os
+import time
+import argparse
+import resource
+import tempfile
+import multiprocessing
+import numpy as np
+import xgboost as xgb
+from sklearn.metrics import f1_score, accuracy_score
+from src.storage import CSVStorage
+from notebooks.model.features import FEATURES, RAW_COLUMNS, build_features
+from notebooks.model.out_of_core import DEFAULT_PARAMS, hash_split, train_out_of_core, evaluate_out_of_core
+
+def train_in_memory(storage, category_ids, num_boost_round):
+    products_df = storage.load(category_ids, columns = ['id'] + RAW_COLUMNS + ['sold_quantity'])
+    classes = np.unique(products_df.sold_quantity)
+    splits = hash_split(products_df['id'])
+    features_df, labels = build_features(products_df)[FEATURES], np.searchsorted(classes, products_df.sold_quantity)
+    train = splits == 'train'
+    booster = xgb.train({**DEFAULT_PARAMS, 'num_class': len(classes)}, xgb.DMatrix(features_df[train], label = labels[train]),
+                        num_boost_round = num_boost_round)
+    test = splits == 'test'
+    predictions = booster.predict(xgb.DMatrix(features_df[test])).astype(int)
+    return {'rows': int(test.sum()), 'accuracy': accuracy_score(labels[test], predictions),
+            'f1_macro': f1_score(labels[test], predictions, average = 'macro')}
+
+def train_streaming(storage, category_ids, num_boost_round, chunksize):
+    with tempfile.TemporaryDirectory() as cache_folder:
+        booster, classes = train_out_of_core(storage, category_ids, cache_folder, num_boost_round = num_boost_round, chunksize = chunksize)
+        metrics = evaluate_out_of_core(booster, classes, storage, category_ids, chunksize = chunksize)
+    return {metric: value for metric, value in metrics.items() if metric != 'confusion_matrix'}
+
+def run_mode(mode, args, results):
+    """
+    Trains with one of the paths and reports its metrics, time and peak memory (max RSS of the process).
+    """
+    storage = CSVStorage(args.data)
+    category_ids = sorted(file[:-len('.csv')] for file in os.listdir(args.data) if file.endswith('.csv'))
+    start = time.perf_counter()
+    if mode == 'in memory':
+        metrics = train_in_memory(storage, category_ids, args.trees)
+    else:
+        metrics = train_streaming(storage, category_ids, args.trees, args.chunksize)
+    metrics['seconds'] = time.perf_counter() - start
+    metrics['peak_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024
+    results.put(metrics)
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Peak memory and metrics of the in memory and out-of-core training.')
+    parser.add_argument('--data', default = 'data')
+    parser.add_argument('--chunksize', type = int, default = 20000)
+    parser.add_argument('--trees', type = int, default = 100)
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context('spawn') # A new process for each path, so the peak memory isn't shared
+    metrics = {}
+    for mode in ['in memory', 'out of core']:
+        results = context.Queue()
+        process = context.Process(target = run_mode, args = (mode, args, results))
+        process.start()
+        metrics[mode] = results.get()
+        process.join()
+
+    print(f"{'training':<14}{'test rows':>10}{'accuracy':>10}{'f1 macro':>10}{'seconds':>10}{'peak MB':>10}")
+    for mode, result in metrics.items():
+        print(f"{mode:<14}{result['rows']:>10}{result['accuracy']:>10.4f}{result['f1_macro']:>10.4f}{result['seconds']:>10.1f}{result['peak_mb']:>10.0f}")
+    for metric in ['rows', 'accuracy', 'f1_macro']:
+        assert np.isclose(metrics['in memory'][metric], metrics['out of core'][metric]), metric
+
+
+if __name__ == '__main__':
+    main()
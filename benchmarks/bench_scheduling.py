@@ -0,0 +1,69 @@
+# Benchmark of the parallel scheduling of meliRetriever against the local mock API.
+# The mock serves a few large categories and many small ones, with a fixed latency per request. Compares one
+# joblib task per category (schedule = 'categories') with the shared queue of pages (schedule = 'pages'),
+# against the ideal time (total pages / workers), and checks that both write the same files.
+#
+# Usage:
+#     python -m benchmarks.bench_scheduling --large 2 --large-products 1000 --small-products 100 --n-jobs 4 --latency 0.005
+
+import os
+import time
+import filecmp
+import argparse
+import tempfile
+from src.retrieve import meliRetriever
+from benchmarks.mock_api import MockCatalog, MockAPIServer
+
+def skewed_catalog(data, categories, large, large_products, small_products):
+    """
+    A MockCatalog with `large` categories of large_products and the rest of small_products.
+    """
+    catalog = MockCatalog(data, products_per_category = large_products)
+    for position, category_id in enumerate(list(catalog.categories)):
+        if position >= categories:
+            del catalog.categories[category_id]
+        elif position >= large:
+            catalog.categories[category_id]['ids'] = catalog.categories[category_id]['ids'][:small_products]
+    return catalog
+
+def main():
+    parser = argparse.ArgumentParser(description = 'One task per category versus a shared queue of pages.')
+    parser.add_argument('--data', default = 'data')
+    parser.add_argument('--categories', type = int, default = 12)
+    parser.add_argument('--large', type = int, default = 2)
+    parser.add_argument('--large-products', type = int, default = 1000)
+    parser.add_argument('--small-products', type = int, default = 100)
+    parser.add_argument('--n-jobs', type = int, default = 4)
+    parser.add_argument('--latency', type = float, default = 0.005, help = 'Seconds added to each response of the mock')
+    args = parser.parse_args()
+
+    catalog = skewed_catalog(args.data, args.categories, args.large, args.large_products, args.small_products)
+    server = MockAPIServer(catalog, latency = args.latency).start()
+    pages = sum(-(-len(category['ids'])//50) for category in catalog.categories.values())
+    print(f'{len(catalog.categories)} categories, {pages} pages, {args.n_jobs} workers, {args.latency*1000:.0f} ms per request')
+
+    folders, times = {}, {}
+    for schedule in ['categories', 'pages']:
+        folders[schedule] = tempfile.mkdtemp()
+        retriever = meliRetriever('Colombia', 'mock', folder = folders[schedule], n_jobs = args.n_jobs, api_url = server.url,
+                                  requests_per_second = 1e9, schedule = schedule)
+        start = time.perf_counter()
+        retriever.create_dataset(products_per_category = args.large_products)
+        times[schedule] = time.perf_counter() - start
+    server.stop()
+
+    files = sorted(file for file in os.listdir(folders['pages']) if file.endswith('.csv'))
+    _, mismatch, errors = filecmp.cmpfiles(folders['categories'], folders['pages'], files, shallow = False)
+    assert len(files) == len(catalog.categories) and not mismatch and not errors, mismatch + errors
+
+    # Each category costs a /categories request, and each page a search request and a questions request for each product.
+    requests = len(catalog.categories) + pages + sum(len(category['ids']) for category in catalog.categories.values())
+    print(f"{'schedule':<14}{'seconds':>10}")
+    for schedule, elapsed in times.items():
+        print(f'{schedule:<14}{elapsed:>10.1f}')
+    print(f"{'ideal':<14}{requests*args.latency/args.n_jobs:>10.1f}  (requests x latency / workers)")
+    print('The files of both schedules are equal')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+# Benchmark of the hyperparameter search of the model notebook.
+# Compares the wall time of GridSearchXGBClassifier (one model per n_estimators and fold, sequential folds)
+# with HalvingSearchXGBClassifier on the same data and folds, first over the same grid and then over a wider
+# grid of max_depth and learning_rate with successive halving.
+#
+# Usage:
+#     python -m benchmarks.bench_search --rows 20000
+#     python -m benchmarks.bench_search --rows 20000 --skip-grid
+
+import os
+import time
+import argparse
+import numpy as np
+from src.storage import CSVStorage
+from notebooks.model.features import FEATURES, RAW_COLUMNS, build_features
+from notebooks.model.xgb_model import GridSearchXGBClassifier, HalvingSearchXGBClassifier
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Wall time of the grid search and the halving search.')
+    parser.add_argument('--data', default = 'data')
+    parser.add_argument('--rows', type = int, default = 20000, help = 'Products sampled from the data. 0 uses all of them')
+    parser.add_argument('--n-jobs', type = int, default = -1)
+    parser.add_argument('--skip-grid', action = 'store_true', help = "Don't run GridSearchXGBClassifier")
+    args = parser.parse_args()
+
+    category_ids = sorted(file[:-len('.csv')] for file in os.listdir(args.data) if file.endswith('.csv'))
+    products_df = CSVStorage(args.data).load(category_ids, columns = RAW_COLUMNS + ['sold_quantity'])
+    if args.rows and args.rows < len(products_df):
+        products_df = products_df.sample(args.rows, random_state = 42)
+    X = build_features(products_df)[FEATURES]
+    # Encoded labels, newer versions of xgboost only accept the classes 0, ..., num_class - 1
+    classes, y = np.unique(products_df.sold_quantity, return_inverse = True)
+    num_class = len(classes)
+    print(f'{len(X)} products, {num_class} classes, {os.cpu_count()} cpus')
+
+    searches = {
+        'halving, same grid': HalvingSearchXGBClassifier(num_class, n_jobs = args.n_jobs, verbose = 0),
+        'halving, depth x learning rate': HalvingSearchXGBClassifier(num_class, n_jobs = args.n_jobs, verbose = 0,
+                                                                    param_grid = {'max_depth': [3, 6, 9], 'learning_rate': [0.05, 0.1, 0.3]}),
+    }
+    if not args.skip_grid:
+        searches = {'grid search': GridSearchXGBClassifier(num_class), **searches}
+
+    print(f"{'search':<34}{'seconds':>10}{'f1 macro':>10}  best params")
+    for name, search in searches.items():
+        if not isinstance(search, HalvingSearchXGBClassifier):
+            search.verbose = 0
+        _, elapsed = timed(lambda: search.fit(X, y))
+        print(f'{name:<34}{elapsed:>10.1f}{search.best_score_:>10.4f}  {search.best_params_}')
+
+
+if __name__ == '__main__':
+    main()
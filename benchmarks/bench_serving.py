@@ -0,0 +1,97 @@
+# Load test of the sold_quantity prediction service (notebooks/model/serving.py).
+# Fits (or loads) the models, then measures the latency percentiles and the throughput of batches of
+# products scored in process and through the HTTP server.
+#
+# Usage:
+#     python -m benchmarks.bench_serving --requests 500 --threads 4 --batch-sizes 1 50 1000
+#     python -m benchmarks.bench_serving --model models/sold_quantity
+
+import os
+import json
+import time
+import argparse
+import tempfile
+import requests
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from xgboost import XGBClassifier
+from src.storage import CSVStorage
+from notebooks.model.benchmark import benchmark
+from notebooks.model.features import RAW_COLUMNS, build_features
+from notebooks.model.serving import save_models, SoldQuantityService, PredictionServer
+
+def fit_models(products_df, path, trees):
+    """
+    Fits the classifier and the benchmark of the model notebook and saves them in path.
+    """
+    features_df = build_features(products_df)
+    classes, labels = np.unique(products_df.sold_quantity, return_inverse = True)
+    xgb_model = XGBClassifier(objective = 'multi:softmax', n_estimators = trees, n_jobs = 3)
+    xgb_model.fit(features_df, labels)
+    benchmark_model = benchmark()
+    benchmark_model.fit(features_df, products_df.sold_quantity)
+    save_models(path, xgb_model, benchmark_model, classes = classes)
+
+def run_load(send, batches, threads):
+    """
+    Sends the batches with `threads` concurrent threads. Returns the latency of each batch and the elapsed time.
+    """
+    def timed_send(batch):
+        start = time.perf_counter()
+        send(batch)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers = threads) as executor:
+        latencies = list(executor.map(timed_send, batches))
+    return np.array(latencies), time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Latency and throughput of the prediction service.')
+    parser.add_argument('--data', default = 'data')
+    parser.add_argument('--model', default = None, help = 'Folder of saved models. If None, quick models are fitted')
+    parser.add_argument('--trees', type = int, default = 100)
+    parser.add_argument('--requests', type = int, default = 500)
+    parser.add_argument('--threads', type = int, default = 4)
+    parser.add_argument('--batch-sizes', type = int, nargs = '+', default = [1, 50, 1000])
+    args = parser.parse_args()
+
+    category_ids = sorted(file[:-len('.csv')] for file in os.listdir(args.data) if file.endswith('.csv'))
+    products_df = CSVStorage(args.data).load(category_ids, columns = RAW_COLUMNS + ['sold_quantity'])
+    model_path = args.model
+    if model_path is None:
+        model_path = tempfile.mkdtemp()
+        fit_models(products_df, model_path, args.trees)
+
+    service = SoldQuantityService(model_path)
+    server = PredictionServer(service, port = 0).start()
+    session = requests.Session()
+    items = json.loads(products_df[RAW_COLUMNS].to_json(orient = 'records'))
+    modes = {
+        'in process': service.predict,
+        'http': lambda batch: session.post(f'{server.url}/predict', json = {'items': batch}).raise_for_status()
+    }
+
+    # A batch with products of an age group unseen by the benchmark is answered, with the mode of all the products for them
+    lookup_model = service.benchmark.lookup_model
+    unseen_group = max(lookup_model)
+    service.benchmark.lookup_model = {group: prediction for group, prediction in lookup_model.items() if group != unseen_group}
+    response = session.post(f'{server.url}/predict', json = {'items': items[:1000]})
+    assert response.status_code == 200 and len(response.json()['benchmark']) == 1000, response.text
+    service.benchmark.lookup_model = lookup_model
+
+    print(f"{'mode':<12}{'batch':>7}{'p50 ms':>9}{'p99 ms':>9}{'items/s':>11}")
+    for batch_size in args.batch_sizes:
+        starts = np.random.RandomState(42).randint(0, len(items) - batch_size, args.requests)
+        batches = [items[start:start + batch_size] for start in starts]
+        for mode, send in modes.items():
+            threads = args.threads if mode == 'http' else 1
+            latencies, elapsed = run_load(send, batches, threads)
+            p50, p99 = 1000*np.percentile(latencies, [50, 99])
+            print(f'{mode:<12}{batch_size:>7}{p50:>9.2f}{p99:>9.2f}{batch_size*len(batches)/elapsed:>11.0f}')
+
+    server.stop()
+
+
+if __name__ == '__main__':
+    main()
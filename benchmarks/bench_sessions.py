@@ -0,0 +1,54 @@
+# Benchmark of the HTTP session layer of meliRetriever against the local mock API.
+# Compares a bare requests.get per request (the previous behaviour) with the connection pooled session,
+# counting the connections opened by the server and the requests per second achieved.
+#
+# Usage:
+#     python -m benchmarks.bench_sessions --requests 2000 --threads 8
+
+import time
+import argparse
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from src.retrieve import meliRetriever
+from benchmarks.mock_api import MockCatalog, MockAPIServer
+
+def run_requests(get_json, urls, threads):
+    """
+    Sends the requests with `threads` concurrent threads and returns the elapsed time.
+    """
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers = threads) as executor:
+        list(executor.map(get_json, urls))
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Connections opened and requests/sec with and without pooled sessions.')
+    parser.add_argument('--data', default = 'data')
+    parser.add_argument('--requests', type = int, default = 2000)
+    parser.add_argument('--threads', type = int, default = 8)
+    args = parser.parse_args()
+
+    server = MockAPIServer(MockCatalog(args.data, products_per_category = args.requests)).start()
+    retriever = meliRetriever('Colombia', token = 'mock', api_url = server.url, parallel = False,
+                              requests_per_second = 1e9, pool_size = args.threads)
+    product_ids = list(server.catalog.products)[:args.requests]
+    urls = [retriever.questions_url(product_id) for product_id in product_ids]
+
+    modes = {
+        'requests.get': lambda url: requests.get(url = url, headers = retriever.authorization_token).json(),
+        'pooled session': retriever.get_json
+    }
+
+    print(f'{len(urls)} requests with {args.threads} threads')
+    print(f"{'mode':<16}{'connections':>12}{'seconds':>10}{'requests/s':>12}")
+    for mode, get_json in modes.items():
+        server.reset_stats()
+        elapsed = run_requests(get_json, urls, args.threads)
+        stats = server.stats()
+        print(f"{mode:<16}{stats['connections']:>12}{elapsed:>10.2f}{stats['requests']/elapsed:>12.1f}")
+
+    server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+# Extraction of categories larger than the offset limit of the search, against the local mock API.
+# The mock answers 400 to the pages beyond --max-offset, like the public search beyond 1000 products.
+# 1. A single stream of offsets (max_search_offset = None) loses every product beyond the limit.
+# 2. The sharded extraction (see src/sharding.py) splits each category by its children and by price ranges,
+#    and must store every product of the mock, with a coverage of 1 in each shard.
+# 3. For reference, the single stream against a mock without the limit.
+# 4. A sharded extraction interrupted after a few pages, and resumed after some products of its first shard are
+#    removed (so the totals, and the plan, change): it must store exactly the remaining products, once.
+#
+# Usage:
+#     python -m benchmarks.bench_sharding --categories 4 --products 2000 --max-offset 200
+
+import os
+import time
+import argparse
+import tempfile
+import pandas as pd
+from collections import Counter
+from src.retrieve import meliRetriever
+from benchmarks.mock_api import MockCatalog, MockAPIServer
+
+def crawl(server, args, max_search_offset):
+    """
+    Extracts the categories in a temporary folder.
+
+    Returns
+    ---------
+        result (dict):
+            The seconds, requests, failed pages and coverage of the extraction, and the ids stored for each category.
+    """
+    with tempfile.TemporaryDirectory() as folder:
+        retriever = meliRetriever('Colombia', 'mock', folder = folder, api_url = server.url, requests_per_second = 1e9,
+                                  n_jobs = args.n_jobs, max_search_offset = max_search_offset, max_page_retries = 0,
+                                  metrics_interval = None)
+        retriever.available_categories = dict(list(retriever.available_categories.items())[:args.categories])
+        server.reset_stats()
+        start = time.perf_counter()
+        retriever.create_dataset(products_per_category = args.products)
+        elapsed = time.perf_counter() - start
+        stored_ids = {}
+        for category_id in retriever.available_categories:
+            checkpoint_path = retriever.category_path(category_id)
+            if os.path.exists(checkpoint_path):
+                stored_ids[category_id] = pd.read_csv(checkpoint_path, sep = ';', usecols = ['id'], dtype = str)['id'].tolist()
+            elif os.path.exists(f'{checkpoint_path}.partial'): # Categories with failed pages keep their partial file
+                stored_ids[category_id] = pd.read_csv(f'{checkpoint_path}.partial', sep = ';', usecols = ['id'], dtype = str)['id'].tolist()
+    stats = server.stats()
+    return {
+        'seconds': elapsed,
+        'requests': stats['requests'],
+        'planning_requests': stats['requests_by_endpoint'].get('category', 0),
+        'rejected': stats['responses_by_status'].get(400, 0),
+        'failed_pages': retriever.metrics.stats()['failed_pages'],
+        'coverage': retriever.coverage_report(),
+        'stored_ids': stored_ids
+    }
+
+def resume_after_change(server, catalog, category_id, args, interrupted_pages = 4, removed = 7):
+    """
+    Writes the first pages of a category, removes products from its first child, and resumes the extraction.
+
+    Returns
+    ---------
+        stored_ids (list):
+            The ids of the final file of the category.
+    """
+    with tempfile.TemporaryDirectory() as folder:
+        retriever = meliRetriever('Colombia', 'mock', folder = folder, api_url = server.url, requests_per_second = 1e9,
+                                  parallel = False, max_search_offset = args.max_offset, max_page_retries = 0,
+                                  metrics_interval = None)
+        retriever.available_categories = {category_id: retriever.available_categories[category_id]}
+        pages = retriever.category_pages(category_id, args.products)
+        checkpoint = retriever.storage.writer(category_id)
+        for key, shard, offset in pages[:interrupted_pages]:
+            checkpoint.write_page(key, retriever.label_page(category_id, retriever.list_marketplace_products(retriever.site_id, category_id, offset, shard)))
+
+        child = next(child for child in catalog.subcategories().values() if child['parent'] == category_id)
+        removed_ids = set(child['ids'][:removed])
+        child['ids'] = child['ids'][removed:]
+        catalog.categories[category_id]['ids'] = [product_id for product_id in catalog.categories[category_id]['ids'] if product_id not in removed_ids]
+        retriever.create_dataset(products_per_category = args.products)
+        return pd.read_csv(retriever.category_path(category_id), sep = ';', usecols = ['id'], dtype = str)['id'].tolist()
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Sharded extraction of categories larger than the offset limit.')
+    parser.add_argument('--data', default = 'data')
+    parser.add_argument('--categories', type = int, default = 4)
+    parser.add_argument('--products', type = int, default = 2000, help = 'Products of each category served by the mock')
+    parser.add_argument('--max-offset', type = int, default = 200, help = 'Offset limit of the search of the mock')
+    parser.add_argument('--n-jobs', type = int, default = 4)
+    parser.add_argument('--latency', type = float, default = 0.005)
+    args = parser.parse_args()
+
+    catalog = MockCatalog(args.data, products_per_category = args.products)
+    server = MockAPIServer(catalog, latency = args.latency, max_offset = args.max_offset).start()
+    print(f'{args.categories} categories of up to {args.products} products, offset limit {args.max_offset}, {args.n_jobs} workers')
+    print(f"{'extraction':<34}{'seconds':>9}{'requests':>10}{'400':>6}{'failed':>8}{'products':>10}{'shards':>8}{'truncated':>11}")
+    runs = [('single stream', args.max_offset, None), ('sharded', args.max_offset, args.max_offset),
+            ('single stream, no offset limit', None, None)]
+    results = {}
+    for name, server_max_offset, max_search_offset in runs:
+        server.max_offset = server_max_offset
+        result = results[name] = crawl(server, args, max_search_offset)
+        coverage = result['coverage']
+        print(f"{name:<34}{result['seconds']:>9.1f}{result['requests']:>10}{result['rejected']:>6}{result['failed_pages']:>8}"
+              f"{sum(len(ids) for ids in result['stored_ids'].values()):>10}{len(coverage):>8}{int(coverage['truncated'].sum()):>11}")
+
+    sharded = results['sharded']
+    print('\nShards of the sharded extraction:')
+    print(sharded['coverage'].groupby('category_id').agg(shards = ('shard', 'size'), total = ('total', 'sum'),
+                                                         retrieved = ('retrieved', 'sum'), min_coverage = ('coverage', 'min')))
+    for category_id, ids in sharded['stored_ids'].items():
+        assert Counter(ids) == Counter(catalog.categories[category_id]['ids']), category_id
+    assert len(sharded['stored_ids']) == args.categories and (sharded['coverage']['coverage'] == 1).all()
+    print('The sharded extraction stored every product of the mock')
+
+    category_id = next(iter(sharded['stored_ids']))
+    stored_ids = resume_after_change(server, catalog, category_id, args)
+    print(f'Resumed after the first shard of {category_id} changed: {len(stored_ids)} products stored '
+          f"({len(catalog.categories[category_id]['ids'])} in the mock)")
+    assert Counter(stored_ids) == Counter(catalog.categories[category_id]['ids'])
+    server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+# Startup cost of the src package: the import time of its entry points and the construction of a retriever.
+# Each measure runs in a new interpreter (so no module is already imported), and the median of the repetitions
+# is reported. The retriever of MELI's API must take the site and its categories from the bundled catalog, without
+# a request (the measure works offline). Then the site of a mock API, which the bundled catalog doesn't describe,
+# is resolved with the requests to the mock once, and read from the cache of the catalog by the next retriever.
+#
+# Usage:
+#     python -m benchmarks.bench_startup --repetitions 5
+
+import sys
+import json
+import argparse
+import tempfile
+import statistics
+import subprocess
+from src.site_catalog import BUNDLED_API_URL
+from benchmarks.mock_api import MockCatalog, MultiSiteCatalog, MockAPIServer
+
+IMPORTS = {
+    'import src': 'import src',
+    'from src import meliRetriever, getAPIkey': 'from src import meliRetriever, getAPIkey',
+    'from src import asyncMeliRetriever': 'from src import asyncMeliRetriever',
+    'from src import meliOrchestrator': 'from src import meliOrchestrator'
+}
+
+def measure(code):
+    """
+    Runs code in a new interpreter. The code prints a JSON with its measures.
+    """
+    result = subprocess.run([sys.executable, '-c', code], capture_output = True, text = True, check = True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def import_code(statement):
+    return f"""
+import sys, time, json
+start = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'ms': elapsed*1000, 'pandas': 'pandas' in sys.modules, 'meli': 'meli' in sys.modules}}))
+"""
+
+def retriever_code(site_name, folder, api_url):
+    return f"""
+import time, json
+from src import meliRetriever
+start = time.perf_counter()
+retriever = meliRetriever({site_name!r}, 'token', folder = {folder!r}, api_url = {api_url!r}, metrics_interval = None)
+constructed = time.perf_counter()
+categories = retriever.available_categories
+resolved = time.perf_counter()
+print(json.dumps({{'construct_ms': (constructed - start)*1000, 'resolve_ms': (resolved - constructed)*1000,
+                  'site_id': retriever.site_id, 'categories': len(categories),
+                  'requests': sum(endpoint['requests'] for endpoint in retriever.metrics.stats()['endpoints'].values())}}))
+"""
+
+def median(measures, key):
+    return statistics.median(measure[key] for measure in measures)
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Import time of src and construction time of a retriever.')
+    parser.add_argument('--data', default = 'data')
+    parser.add_argument('--repetitions', type = int, default = 5)
+    args = parser.parse_args()
+
+    print(f"{'import':<44}{'ms':>8}{'pandas':>8}{'meli':>6}")
+    for name, statement in IMPORTS.items():
+        measures = [measure(import_code(statement)) for _ in range(args.repetitions)]
+        print(f"{name:<44}{median(measures, 'ms'):>8.1f}{str(measures[0]['pandas']):>8}{str(measures[0]['meli']):>6}")
+        if name == 'from src import meliRetriever, getAPIkey':
+            assert not measures[0]['pandas'] and not measures[0]['meli']
+
+    with tempfile.TemporaryDirectory() as folder:
+        measures = [measure(retriever_code('Colombia', folder, BUNDLED_API_URL)) for _ in range(args.repetitions)]
+        print(f"\nRetriever of Colombia: construction {median(measures, 'construct_ms'):.2f} ms, "
+              f"site and categories {median(measures, 'resolve_ms'):.2f} ms, {measures[0]['categories']} categories, "
+              f"{measures[0]['requests']} requests")
+        assert measures[0]['site_id'] == 'MCO' and measures[0]['requests'] == 0
+
+    server = MockAPIServer(MultiSiteCatalog([MockCatalog(args.data, products_per_category = 1),
+                                             MockCatalog(args.data, 'MLA', 'Argentina', products_per_category = 1)])).start()
+    with tempfile.TemporaryDirectory() as folder:
+        first, cached = measure(retriever_code('Argentina', folder, server.url)), measure(retriever_code('Argentina', folder, server.url))
+        print(f"Retriever of the mock: {first['resolve_ms']:.1f} ms and {first['requests']} requests, "
+              f"then {cached['resolve_ms']:.2f} ms and {cached['requests']} requests from the cache")
+        assert first['requests'] == 2 and cached['requests'] == 0 and cached['categories'] == first['categories']
+    server.stop()
+
+
+if __name__ == '__main__':
+    main()
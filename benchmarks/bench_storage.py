@@ -0,0 +1,68 @@
+# Benchmark of the storage backends with the stored data/*.csv files.
+# Converts the CSVs to a Parquet dataset and compares the size on disk and the time to load
+# the complete site and the columns used by the model notebooks. The dataset is written to a temporary
+# folder unless --output is given.
+#
+# Usage:
+#     python -m benchmarks.bench_storage --data data
+#     python -m benchmarks.bench_storage --data data --output data/parquet
+
+import os
+import time
+import tempfile
+import argparse
+from src.storage import CSVStorage, ParquetStorage, MODEL_COLUMNS
+
+def folder_size(folder):
+    """
+    Size in MB of the files of a folder, including its subfolders.
+    """
+    size = sum(os.path.getsize(os.path.join(root, file)) for root, _, files in os.walk(folder) for file in files)
+    return size/1024/1024
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - start
+
+def compare_storages(data, output):
+    """
+    Converts the CSVs of the data folder to a Parquet dataset in output, and prints the load times and sizes.
+    """
+    csv_storage = CSVStorage(data)
+    category_ids = sorted(file[:-len('.csv')] for file in os.listdir(data) if file.endswith('.csv'))
+    parquet_storage = ParquetStorage(output)
+    _, elapsed = timed(lambda: [parquet_storage.convert(category_id, csv_storage.path(category_id)) for category_id in category_ids])
+    print(f'Converted {len(category_ids)} categories in {elapsed:.2f} seconds')
+
+    csv_size = sum(os.path.getsize(csv_storage.path(category_id)) for category_id in category_ids)/1024/1024
+    loads = {
+        'csv, all columns': lambda: csv_storage.load(category_ids),
+        'csv, model columns': lambda: csv_storage.load(category_ids, columns = MODEL_COLUMNS),
+        'parquet, all columns': lambda: parquet_storage.load(),
+        'parquet, model columns': lambda: parquet_storage.load(columns = MODEL_COLUMNS),
+        'parquet, model columns, sold': lambda: parquet_storage.load(columns = MODEL_COLUMNS, filters = [('sold_quantity', '>', 0)]),
+    }
+
+    print(f"{'load':<32}{'rows':>10}{'seconds':>10}{'memory MB':>12}")
+    for load, function in loads.items():
+        products_df, elapsed = timed(function)
+        memory = products_df.memory_usage(deep = True).sum()/1024/1024
+        print(f'{load:<32}{len(products_df):>10}{elapsed:>10.2f}{memory:>12.1f}')
+    print(f'Size on disk: csv {csv_size:.1f} MB, parquet {folder_size(output):.1f} MB')
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Size and load time of the CSV and Parquet storages.')
+    parser.add_argument('--data', default = 'data')
+    parser.add_argument('--output', default = None)
+    args = parser.parse_args()
+
+    if args.output is None:
+        with tempfile.TemporaryDirectory() as output:
+            compare_storages(args.data, output)
+    else:
+        compare_storages(args.data, args.output)
+
+
+if __name__ == '__main__':
+    main()
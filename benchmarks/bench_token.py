@@ -0,0 +1,84 @@
+# Check of the automatic refresh of the access token (src/token_manager.py) against the OAuth endpoint of the mock API.
+# 1. Many processes and threads ask for the token at the same time once it's about to expire: it must be refreshed
+#    exactly once (the refresh tokens of the mock, like the real ones, can only be used once).
+# 2. A parallel extraction runs while the access tokens of the mock expire every few seconds: no page may fail.
+#
+# Usage:
+#     python -m benchmarks.bench_token --processes 4 --threads 8 --token-ttl 3
+
+import os
+import time
+import argparse
+import tempfile
+import threading
+import multiprocessing
+from src.retrieve import meliRetriever
+from src.token_manager import TokenManager
+from benchmarks.mock_api import MockCatalog, MockAPIServer
+
+def ask_for_tokens(manager, threads, barrier, results):
+    """
+    Asks for the access token from several threads at the same moment.
+    """
+    tokens = []
+    def ask():
+        barrier.wait()
+        tokens.append(manager.access_token())
+    workers = [threading.Thread(target = ask) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    results.put(tokens)
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Concurrent refreshes of the access token against the mock API.')
+    parser.add_argument('--data', default = 'data')
+    parser.add_argument('--processes', type = int, default = 4)
+    parser.add_argument('--threads', type = int, default = 8)
+    parser.add_argument('--token-ttl', type = float, default = 3.0, help = 'Seconds each access token of the mock is valid')
+    parser.add_argument('--n-jobs', type = int, default = 3)
+    args = parser.parse_args()
+
+    server = MockAPIServer(MockCatalog(args.data, products_per_category = 200), latency = 0.005, require_token = True,
+                           token_ttl = args.token_ttl).start()
+    token_url = f'{server.url}/oauth/token'
+    folder = tempfile.mkdtemp()
+    refresh_margin = args.token_ttl/3
+
+    # 1. Stampede
+    manager = TokenManager('mock-client', 'mock-secret', refresh_token = 'mock-refresh-token', path = os.path.join(folder, 'token.json'),
+                           token_url = token_url, refresh_margin = refresh_margin)
+    first_token = manager.access_token()
+    time.sleep(args.token_ttl - refresh_margin)
+    server.reset_stats()
+    context = multiprocessing.get_context('fork')
+    barrier, results = context.Barrier(args.processes*args.threads), context.Queue()
+    processes = [context.Process(target = ask_for_tokens, args = (manager, args.threads, barrier, results)) for _ in range(args.processes)]
+    for process in processes:
+        process.start()
+    tokens = {token for _ in processes for token in results.get()}
+    for process in processes:
+        process.join()
+    refreshes = server.stats()['requests_by_endpoint'].get('oauth', 0)
+    print(f'{args.processes} processes x {args.threads} threads asked for the token: {refreshes} refresh, {len(tokens)} distinct token')
+    assert refreshes == 1 and len(tokens) == 1 and first_token not in tokens
+
+    # 2. Extraction longer than the life of the tokens
+    retriever = meliRetriever('Colombia', token = manager, folder = os.path.join(folder, 'data'), n_jobs = args.n_jobs,
+                              api_url = server.url, requests_per_second = 1e9, metrics_interval = None)
+    retriever.available_categories = dict(list(retriever.available_categories.items())[:6])
+    server.reset_stats()
+    start = time.perf_counter()
+    category_paths = retriever.retrieve_categories(products_per_category = 200)
+    elapsed = time.perf_counter() - start
+    stats = server.stats()
+    print(f"Extraction of {elapsed:.1f} s with tokens of {args.token_ttl:.0f} s: {stats['requests_by_endpoint'].get('oauth', 0)} refreshes, "
+          f"{stats['responses_by_status'].get(401, 0)} requests rejected with 401, "
+          f"{sum(path is None for path in category_paths)} categories with failed pages")
+    assert all(path is not None for path in category_paths)
+    server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,590 @@
+# A local stand-in of Mercado Libre's API, used to measure meliRetriever without live credentials.
+# The payloads are synthesized from the stored data/*.csv files, so a crawl against the mock
+# server rebuilds (almost) the same CSVs. The server can add latency, fail a fraction of the requests
+# with 5xx errors and answer 429 (with Retry-After) above a rate limit, like the real API. It also serves the
+# OAuth endpoint (POST /oauth/token), and can reject the requests without a valid access token (401).
+# The children of each category are the leaf categories of its products, and the search can be filtered by
+# price and limited to a maximum offset (400 beyond it), like the public search.
+#
+# Usage:
+#     python -m benchmarks.mock_api --port 8000
+#     python -m benchmarks.mock_api --port 8000 --latency 0.05 --jitter 0.02 --error-rate 0.01 --rate-limit 50
+
+import os
+import re
+import json
+import time
+import zlib
+import random
+import secrets
+import argparse
+import threading
+import pandas as pd
+from collections import Counter, defaultdict
+from urllib.parse import urlparse, parse_qs, parse_qsl
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+def _number(value):
+    """
+    Converts a CSV string into an int or a float. Missing values are returned as None.
+    """
+    if pd.isna(value):
+        return None
+    number = float(value)
+    return int(number) if number.is_integer() and '.' not in value else number
+
+def _boolean(value):
+    return None if pd.isna(value) else value == 'True'
+
+def _string(value):
+    return None if pd.isna(value) else value
+
+
+class MockCatalog:
+    """
+    The products of the stored CSVs, rendered as the JSON payloads of MELI's API.
+    """
+
+    def __init__(self, data_folder = 'data', site_id = 'MCO', site_name = 'Colombia', products_per_category = None):
+        """
+        Params:
+        --------
+            data_folder (string):
+                (Default data) Folder with the CSV files of each category.
+
+            site_id (string):
+                (Default MCO) The ID of the site served by the mock. If the IDs of the CSVs belong to another site,
+                              the products are served with the prefix of this site (e.g. MCO1000 as MLA1000).
+
+            site_name (string):
+                (Default Colombia) The name of the site served by the mock.
+
+            products_per_category (int):
+                (Default None) Maximum number of products loaded for each category. If None, loads all of them.
+        """
+        self.site_id = site_id
+        self.site_name = site_name
+        self.categories = {}
+        self.products = {}
+        self.sellers = {}
+        self._subcategories = None
+        for file in sorted(os.listdir(data_folder)):
+            if not file.endswith('.csv'):
+                continue
+            category_id = self.site_prefixed(file[:-len('.csv')])
+            category_df = pd.read_csv(os.path.join(data_folder, file), sep = ';', dtype = str, nrows = products_per_category)
+            records = category_df.to_dict('records')
+            for record in records:
+                record['id'], record['category_id'] = self.site_prefixed(record['id']), self.site_prefixed(record['category_id'])
+            self.categories[category_id] = {
+                'name': records[0]['category_name'] if records else category_id,
+                'ids': [record['id'] for record in records]
+            }
+            for record in records:
+                self.products[record['id']] = record
+                self.sellers[self.seller_id(record)] = record
+
+    def site_prefixed(self, resource_id):
+        """
+        An ID of the CSVs (e.g. MCO1000) with the prefix of the site of the mock.
+        """
+        return resource_id if pd.isna(resource_id) else self.site_id + resource_id[len(self.site_id):]
+
+    def sites(self):
+        return [{'default_currency_id': 'COP', 'id': self.site_id, 'name': self.site_name}]
+
+    def site_categories(self, site_id = None):
+        return [{'id': category_id, 'name': category['name']} for category_id, category in self.categories.items()]
+
+    def subcategories(self):
+        """
+        The children of the categories: the leaf categories of their products, built the first time they're used.
+        A leaf found in several categories of the CSVs is a different child of each one ({leaf}-{category}),
+        so the children of a category have all its products, and only them.
+        """
+        if self._subcategories is None:
+            leaf_parents = defaultdict(set)
+            for category_id, category in self.categories.items():
+                for product_id in category['ids']:
+                    leaf_parents[self.products[product_id]['category_id']].add(category_id)
+            subcategories = {} # Assigned once it's complete, since the handlers run in several threads
+            for category_id, category in self.categories.items():
+                for product_id in category['ids']:
+                    leaf_id = self.products[product_id]['category_id']
+                    shared = len(leaf_parents[leaf_id]) > 1 or leaf_id in self.categories
+                    child_id = f'{leaf_id}-{category_id}' if shared else leaf_id
+                    child = subcategories.setdefault(child_id, {'name': child_id, 'parent': category_id, 'ids': []})
+                    child['ids'].append(product_id)
+            self._subcategories = subcategories
+        return self._subcategories
+
+    def category(self, category_id):
+        category = self.categories.get(category_id)
+        children = []
+        if category is None:
+            category = self.subcategories().get(category_id)
+            if category is None:
+                return None
+        else:
+            children = [{'id': child_id, 'name': child['name'], 'total_items_in_this_category': len(child['ids'])}
+                            for child_id, child in self.subcategories().items() if child['parent'] == category_id]
+        return {
+            'id': category_id,
+            'name': category['name'],
+            'total_items_in_this_category': len(category['ids']),
+            'children_categories': children
+        }
+
+    def price(self, product_id):
+        """
+        The price of a product. The products without price in the CSVs are served as the cheapest ones (0).
+        """
+        return _number(self.products[product_id]['price']) or 0
+
+    def search(self, category_id, offset, limit = 50, sort = None, price_range = None):
+        """
+        A search page of a category (or of one of its children). With sort = 'start_time_desc', the last products
+        of the category are treated as the most recent ones. price_range (low, high) keeps the products with
+        low <= price <= high, like the API (None is an open end).
+        """
+        category = self.categories.get(category_id) or self.subcategories().get(category_id, {'ids': []})
+        ids = category['ids'][::-1] if sort == 'start_time_desc' else category['ids']
+        if price_range is not None:
+            low, high = price_range
+            ids = [product_id for product_id in ids if (low is None or self.price(product_id) >= low)
+                                                        and (high is None or self.price(product_id) <= high)]
+        total = len(ids)
+        ids = ids[offset:offset + limit]
+        return {
+            'site_id': self.site_id,
+            'paging': {'total': total, 'offset': offset, 'limit': limit},
+            'results': [self.item(product_id) for product_id in ids]
+        }
+
+    def seller_id(self, record):
+        """
+        A stable seller ID for a product. Products with the same reputation share the seller.
+        """
+        reputation = '|'.join(str(record[key]) for key in ['seller_level_id', 'seller_powerseller', 'positive_rating',
+                                                           'negative_rating', 'neutral_rating'])
+        return zlib.crc32(reputation.encode())
+
+    def seller(self, record):
+        return {
+            'id': self.seller_id(record),
+            'registration_date': None,
+            'seller_reputation': {
+                'level_id': _string(record['seller_level_id']),
+                'power_seller_status': _string(record['seller_powerseller']),
+                'transactions': {
+                    'ratings': {
+                        'positive': _number(record['positive_rating']),
+                        'negative': _number(record['negative_rating']),
+                        'neutral': _number(record['neutral_rating'])
+                    }
+                }
+            }
+        }
+
+    def item(self, product_id):
+        record = self.products[product_id]
+        return {
+            'id': record['id'],
+            'site_id': self.site_id,
+            'title': record['title'],
+            'seller': self.seller(record),
+            'price': _number(record['price']),
+            'available_quantity': _number(record['available_quantity']),
+            'sold_quantity': _number(record['sold_quantity']),
+            'buying_mode': record['buying_mode'],
+            'listing_type_id': record['listing_type_id'],
+            'condition': record['condition'],
+            'thumbnail': f"http://http2.mlstatic.com/D_{record['id']}-I_{record['month_update']}{record['year_update']}",
+            'accepts_mercadopago': _boolean(record['accepts_mercadopago']),
+            'original_price': _number(record['original_price']),
+            'category_id': record['category_id'],
+            'official_store_id': 1 if record['is_official_store'] == 'True' else None,
+            'shipping': {
+                'free_shipping': _boolean(record['free_shipping']),
+                'store_pick_up': _boolean(record['store_pickup'])
+            },
+            'tags': ['tag'] * int(record['number_of_tags'])
+        }
+
+    def item_details(self, product_id):
+        """
+        The body of /items/{id}: the search result with the seller reduced to its ID.
+        """
+        item = self.item(product_id)
+        item['seller_id'] = item.pop('seller')['id']
+        return item
+
+    def user(self, seller_id):
+        return {'id': seller_id, 'nickname': f'SELLER{seller_id}', **self.seller(self.sellers[seller_id])}
+
+    def multiget(self, resource, ids):
+        """
+        The response of /items?ids= or /users?ids=.
+        """
+        responses = []
+        for resource_id in ids:
+            try:
+                if resource == 'items':
+                    body = self.item_details(resource_id)
+                else:
+                    body = self.user(int(resource_id))
+                responses.append({'code': 200, 'body': body})
+            except (KeyError, ValueError):
+                responses.append({'code': 404, 'body': {'message': 'resource not found', 'error': 'not_found', 'status': 404}})
+        return responses
+
+    def questions(self, product_id):
+        record = self.products.get(product_id)
+        if record is None:
+            return {'total': 0, 'questions': []}
+        total = _number(record['total_questions'])
+        questions = []
+        if not pd.isna(record['year_created']):
+            questions.append({'date_created': f"{record['year_created']}-{record['month_created']}-01T00:00:00.000-04:00"})
+        return {'total': int(total) if total is not None else None, 'questions': questions}
+
+
+class MultiSiteCatalog:
+    """
+    Serves several MockCatalogs, one for each site. The requests are routed by the prefix of the IDs.
+
+    Example:
+        >>> catalog = MultiSiteCatalog([MockCatalog('data'), MockCatalog('data', 'MLA', 'Argentina')])
+    """
+
+    def __init__(self, catalogs):
+        self.catalogs = {catalog.site_id: catalog for catalog in catalogs}
+
+    def catalog(self, resource_id):
+        """
+        The catalog of the site of an ID (the first catalog if the prefix isn't a site).
+        """
+        return self.catalogs.get(str(resource_id)[:3], next(iter(self.catalogs.values())))
+
+    def sites(self):
+        return [site for catalog in self.catalogs.values() for site in catalog.sites()]
+
+    def site_categories(self, site_id = None):
+        return self.catalog(site_id).site_categories()
+
+    def category(self, category_id):
+        return self.catalog(category_id).category(category_id)
+
+    def search(self, category_id, offset, limit = 50, sort = None, price_range = None):
+        return self.catalog(category_id).search(category_id, offset, limit, sort, price_range)
+
+    def questions(self, product_id):
+        return self.catalog(product_id).questions(product_id)
+
+    def multiget(self, resource, ids):
+        if resource == 'items':
+            return [response for resource_id in ids for response in self.catalog(resource_id).multiget(resource, [resource_id])]
+        return self.catalog(None).multiget(resource, ids) # Sellers are the same in every site
+
+
+class MockAPIHandler(BaseHTTPRequestHandler):
+    """
+    Routes the GET requests of meliRetriever to the MockCatalog of the server.
+    """
+    protocol_version = 'HTTP/1.1' # Keep-alive connections
+    disable_nagle_algorithm = True
+
+    routes = [
+        ('sites', re.compile(r'^/sites$')),
+        ('site_categories', re.compile(r'^/sites/(?P<site_id>[^/]+)/categories$')),
+        ('search', re.compile(r'^/sites/(?P<site_id>[^/]+)/search$')),
+        ('category', re.compile(r'^/categories/(?P<category_id>[^/]+)$')),
+        ('questions', re.compile(r'^/questions/search$')),
+        ('items', re.compile(r'^/items$')),
+        ('users', re.compile(r'^/users$')),
+    ]
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        for endpoint, pattern in self.routes:
+            match = pattern.match(url.path)
+            if match:
+                self.server.count_request(endpoint)
+                if not self.server.is_authorized(self.headers.get('Authorization')):
+                    self.server.count_status(401)
+                    return self.send_json(401, {'message': 'invalid access token', 'error': 'unauthorized', 'status': 401})
+                delay = self.server.response_delay()
+                if delay:
+                    time.sleep(delay)
+                rejection = self.server.rejection()
+                if rejection is not None:
+                    self.server.count_status(rejection[0])
+                    return self.send_json(*rejection)
+                status, body = getattr(self, f'handle_{endpoint}')(query, **match.groupdict())
+                self.server.count_status(status)
+                return self.send_json(status, body)
+        self.server.count_request('not_found')
+        self.send_json(404, {'message': 'resource not found', 'error': 'not_found', 'status': 404})
+
+    def do_POST(self):
+        """
+        The OAuth endpoint: authorization_code and refresh_token grants (refresh tokens can be used only once).
+        """
+        length = int(self.headers.get('Content-Length', 0))
+        form = dict(parse_qsl(self.rfile.read(length).decode('utf-8')))
+        if urlparse(self.path).path != '/oauth/token':
+            self.server.count_request('not_found')
+            return self.send_json(404, {'message': 'resource not found', 'error': 'not_found', 'status': 404})
+        self.server.count_request('oauth')
+        tokens = self.server.grant(form)
+        if tokens is None:
+            self.server.count_status(400)
+            return self.send_json(400, {'message': 'invalid_grant', 'error': 'invalid_grant', 'status': 400})
+        self.server.count_status(200)
+        self.send_json(200, tokens)
+
+    def send_json(self, status, body, headers = None):
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def handle_sites(self, query):
+        return 200, self.server.catalog.sites()
+
+    def handle_site_categories(self, query, site_id):
+        return 200, self.server.catalog.site_categories(site_id)
+
+    def handle_search(self, query, site_id):
+        offset = int(query.get('offset', 0))
+        limit = int(query.get('limit', 50))
+        max_offset = self.server.max_offset
+        if max_offset is not None and offset + limit > max_offset:
+            return 400, {'message': f'The requested offset is higher than the allowed for public users. Maximum allowed is {max_offset}',
+                         'error': 'bad_request', 'status': 400}
+        price_range = None
+        if 'price' in query:
+            price_range = tuple(None if bound == '*' else float(bound) for bound in query['price'].split('-'))
+        return 200, self.server.catalog.search(query.get('category'), offset, limit, query.get('sort'), price_range)
+
+    def handle_category(self, query, category_id):
+        category = self.server.catalog.category(category_id)
+        if category is None:
+            return 404, {'message': 'Category not found', 'error': 'not_found', 'status': 404}
+        return 200, category
+
+    def handle_questions(self, query):
+        return 200, self.server.catalog.questions(query.get('item'))
+
+    def handle_items(self, query):
+        return 200, self.server.catalog.multiget('items', query.get('ids', '').split(','))
+
+    def handle_users(self, query):
+        return 200, self.server.catalog.multiget('users', query.get('ids', '').split(','))
+
+
+class MockAPIServer(ThreadingHTTPServer):
+    """
+    A threaded HTTP server that serves a MockCatalog and counts the connections and requests it receives.
+
+    Example:
+        >>> server = MockAPIServer(MockCatalog('data')).start()
+        >>> server = MockAPIServer(MockCatalog('data'), latency = 0.05, error_rate = 0.01, rate_limit = 50).start()
+        >>> retriever = meliRetriever('Colombia', token = 'mock', api_url = server.url)
+        >>> server.stats()
+        >>> server.stop()
+    """
+    daemon_threads = True
+
+    def __init__(self, catalog, host = '127.0.0.1', port = 0, handler = MockAPIHandler, latency = 0.0, jitter = 0.0,
+                 error_rate = 0.0, rate_limit = None, seed = 42, require_token = False, token_ttl = 21600, refresh_token = 'mock-refresh-token',
+                 max_offset = None):
+        """
+        Params:
+        --------
+            catalog (MockCatalog or MultiSiteCatalog):
+                The products served.
+
+            host, port:
+                (Default 127.0.0.1, 0) Address of the server. Port 0 picks a free port.
+
+            latency (float):
+                (Default 0.0) Seconds added to every response.
+
+            jitter (float):
+                (Default 0.0) Standard deviation, in seconds, of a normal noise added to the latency (never below 0).
+
+            error_rate (float):
+                (Default 0.0) Fraction of the requests answered with a 500 or 503 error.
+
+            rate_limit (float):
+                (Default None) Requests per second allowed. Above it, requests are answered with 429 and
+                               the Retry-After and X-RateLimit-* headers. If None, there is no limit.
+
+            seed (int):
+                (Default 42) Seed of the random latencies and errors.
+
+            require_token (bool):
+                (Default False) If True, the GET requests need an unexpired access token issued by POST /oauth/token.
+
+            token_ttl (float):
+                (Default 21600) Seconds each access token is valid (6 hours, as in the real API).
+
+            refresh_token (string):
+                (Default mock-refresh-token) A refresh token accepted by the first refresh_token grant.
+
+            max_offset (int):
+                (Default None) Products of a search reachable by its offset. Pages beyond it are answered with 400,
+                               like the 1000 products of the public search. If None, there is no limit.
+        """
+        super().__init__((host, port), handler)
+        self.catalog = catalog
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.random = random.Random(seed)
+        self.window = (0, 0) # (second, requests received in that second) of the rate limit
+        self.require_token = require_token
+        self.token_ttl = token_ttl
+        self.access_tokens = {} # Access token: expiration (epoch time)
+        self.refresh_tokens = {refresh_token}
+        self.max_offset = max_offset
+        self.lock = threading.Lock()
+        self.reset_stats()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def process_request(self, request, client_address):
+        with self.lock:
+            self.connections += 1
+        super().process_request(request, client_address)
+
+    def count_request(self, endpoint):
+        with self.lock:
+            self.requests[endpoint] += 1
+
+    def count_status(self, status):
+        with self.lock:
+            self.status_codes[status] += 1
+
+    def response_delay(self):
+        """
+        Seconds to wait before answering a request.
+        """
+        if not self.jitter:
+            return self.latency
+        with self.lock:
+            return max(0.0, self.random.gauss(self.latency, self.jitter))
+
+    def rejection(self):
+        """
+        The (status, body, headers) of a request rejected by the rate limit or by a random error, or None.
+        """
+        with self.lock:
+            if self.rate_limit is not None:
+                now = time.time()
+                second, requests = self.window
+                second, requests = (second, requests + 1) if int(now) == second else (int(now), 1)
+                self.window = (second, requests)
+                if requests > self.rate_limit:
+                    retry_after = second + 1 - now
+                    headers = {'Retry-After': f'{retry_after:.3f}', 'X-RateLimit-Limit': str(self.rate_limit),
+                               'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': f'{retry_after:.3f}'}
+                    return 429, {'message': 'Too many requests', 'error': 'too_many_requests', 'status': 429}, headers
+            if self.error_rate and self.random.random() < self.error_rate:
+                status = self.random.choice([500, 503])
+                return status, {'message': 'Internal server error', 'error': 'internal_error', 'status': status}, {}
+        return None
+
+    def grant(self, form):
+        """
+        The response of an OAuth grant, or None if it's invalid. Every grant issues a new refresh token
+        and invalidates the one used.
+        """
+        with self.lock:
+            if form.get('grant_type') == 'refresh_token':
+                if form.get('refresh_token') not in self.refresh_tokens:
+                    return None
+                self.refresh_tokens.remove(form['refresh_token'])
+            elif form.get('grant_type') != 'authorization_code' or not form.get('code'):
+                return None
+            access_token, refresh_token = f'APP_USR-{secrets.token_hex(8)}', f'TG-{secrets.token_hex(8)}'
+            self.access_tokens[access_token] = time.time() + self.token_ttl
+            self.refresh_tokens.add(refresh_token)
+            return {'access_token': access_token, 'token_type': 'bearer', 'expires_in': self.token_ttl,
+                    'scope': 'offline_access read', 'user_id': 1, 'refresh_token': refresh_token}
+
+    def is_authorized(self, authorization):
+        """
+        True if tokens aren't required, or if the Authorization header has an unexpired access token.
+        """
+        if not self.require_token:
+            return True
+        access_token = (authorization or '')[len('Bearer '):]
+        with self.lock:
+            return self.access_tokens.get(access_token, 0) > time.time()
+
+    def reset_stats(self):
+        with self.lock:
+            self.connections = 0
+            self.requests = Counter()
+            self.status_codes = Counter()
+
+    def stats(self):
+        """
+        Number of connections opened, requests received by endpoint and responses by status code.
+        """
+        with self.lock:
+            return {
+                'connections': self.connections,
+                'requests': sum(self.requests.values()),
+                'requests_by_endpoint': dict(self.requests),
+                'responses_by_status': dict(self.status_codes)
+            }
+
+    def start(self):
+        """
+        Serves the requests in a background thread.
+        """
+        thread = threading.Thread(target = self.serve_forever, daemon = True)
+        thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = "Serves a mock of MELI's API built from the stored CSVs.")
+    parser.add_argument('--data', default = 'data')
+    parser.add_argument('--host', default = '127.0.0.1')
+    parser.add_argument('--port', type = int, default = 8000)
+    parser.add_argument('--products-per-category', type = int, default = None)
+    parser.add_argument('--latency', type = float, default = 0.0, help = 'Seconds added to every response')
+    parser.add_argument('--jitter', type = float, default = 0.0, help = 'Standard deviation of the latency')
+    parser.add_argument('--error-rate', type = float, default = 0.0, help = 'Fraction of requests answered with 5xx')
+    parser.add_argument('--rate-limit', type = float, default = None, help = 'Requests per second before answering 429')
+    parser.add_argument('--max-offset', type = int, default = None, help = 'Products of a search reachable by its offset')
+    args = parser.parse_args()
+
+    server = MockAPIServer(MockCatalog(args.data, products_per_category = args.products_per_category), args.host, args.port,
+                           latency = args.latency, jitter = args.jitter, error_rate = args.error_rate, rate_limit = args.rate_limit,
+                           max_offset = args.max_offset)
+    print(f'Serving the mock API at {server.url}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
@@ -1,3 +1,8 @@
 from .metrics import plot_confusion_matrix
-from .xgb_model import GridSearchXGBClassifier
-from .benchmark import benchmark
\ No newline at end of file
+from .xgb_model import GridSearchXGBClassifier, HalvingSearchXGBClassifier
+from .benchmark import benchmark
+from .features import FEATURES, build_features, feature_matrix
+from .serving import save_models, SoldQuantityService
+from .feature_store import FeatureStore
+from .out_of_core import hash_split, train_out_of_core, evaluate_out_of_core
+from .cube import AggregateCube
\ No newline at end of file
@@ -1,4 +1,5 @@
 # Creación de Benchmark
+import numpy as np
 import pandas as pd
 
 class benchmark:
@@ -7,6 +8,7 @@ class benchmark:
         self.grouping = grouping
         self.group_after = (3.5*(12/grouping) - 1) 
         self.lookup_model = None
+        self.global_mode = None
         
     def create_group_by_months(self, row):
         """
@@ -21,6 +23,25 @@ class benchmark:
             group = (product_age-1)//self.grouping # Mod para dentro de un mismo grupo
             return group if group <= self.group_after else self.group_after + 1
 
+    def group_by_months(self, product_age):
+        """
+        Array version of create_group_by_months: discretizes a column of product_age by self.grouping months.
+
+        Params
+        --------
+            product_age (pandas.Series or np.array):
+                The age of each product, in months.
+
+        Returns
+        --------
+            groupings (np.array):
+                The group of each product (-1 if its age is missing).
+        """
+        product_age = np.asarray(product_age, dtype = float)
+        groups = (product_age - 1)//self.grouping
+        groups = np.where(groups <= self.group_after, groups, self.group_after + 1)
+        return np.where(np.isnan(product_age), -1, groups)
+
     def fit(self, X, y):
         """
         Fits the benchmark model based on modes. 
@@ -37,12 +58,19 @@ class benchmark:
         
         """
         concat_df = pd.concat([X, y], axis = 1)
-        concat_df['groupings'] = concat_df.apply(self.create_group_by_months, axis = 1)
-        mode_by_group = concat_df.groupby('groupings').sold_quantity.apply(lambda x: x.mode()).reset_index()
+        sold_by_group = pd.DataFrame({
+            'groupings': self.group_by_months(concat_df.product_age),
+            'sold_quantity': concat_df.sold_quantity.values
+        })
+        # Frequency of each value by group. If several values are the mode of a group, the largest one is kept.
+        counts = sold_by_group.groupby(['groupings', 'sold_quantity']).size().reset_index(name = 'count')
+        mode_by_group = counts.sort_values(['groupings', 'count', 'sold_quantity']).drop_duplicates('groupings', keep = 'last')
         self.lookup_model = dict(zip(mode_by_group.groupings, mode_by_group.sold_quantity))
+        global_counts = counts.groupby('sold_quantity')['count'].sum()
+        self.global_mode = global_counts[global_counts == global_counts.max()].index.max()
 
     
-    def predict(self, X):
+    def predict(self, X, unseen = 'raise'):
         """
         Predicts the sold_quantity based on the lookup table
         
@@ -51,16 +79,32 @@ class benchmark:
             X (pandas.DataFrame):
                 A pandas DataFrame containing information of the products. 
                 Must have product_age, golden_categories and is_new
+
+            unseen (string or float):
+                (Default raise) Prediction of the groups of product_age that weren't seen in fit
+                                (e.g. self.global_mode or np.nan). If 'raise', a KeyError is raised.
         
         Returns
         --------
             prediction_list (np.array):
                 A numpy array with the prediction
+
+        Raises
+        --------
+            KeyError:
+                If a group of product_age wasn't seen in fit and unseen is 'raise'.
         """
-        X_copy = X.copy()
-        X_copy['groupings'] = X_copy.apply(self.create_group_by_months, axis = 1)
-        X_copy['prediction'] = X_copy.apply(self.lookup, axis = 1)
-        prediction_list = X_copy.prediction.values
+        groupings = self.group_by_months(X.product_age)
+        lookup_table = pd.Series(self.lookup_model)
+        positions = lookup_table.index.get_indexer(groupings)
+        if (positions == -1).any() and isinstance(unseen, str) and unseen == 'raise':
+            raise KeyError(groupings[positions == -1][0])
+
+        initial_prediction = lookup_table.values[positions]
+        if (positions == -1).any(): # Each unseen group gets the unseen prediction
+            initial_prediction = np.where(positions == -1, unseen, initial_prediction)
+        golden_new = X.is_new.values*X.golden_categories.values
+        prediction_list = np.where(golden_new != 0, initial_prediction, 0)
         return prediction_list
         
     
@@ -0,0 +1,247 @@
+# Aggregate cube of the exploratory notebooks.
+# EDA_SoldQuantity.ipynb and AnalisisExploratorio.ipynb compare the distribution of sold_quantity across several
+# dimensions of the products (category, powerseller, listing type, ...), grouping all the products again for each
+# chart. The cube counts the products of every combination of the dimensions and sold_quantity in one pass over each
+# CSV file, and stores the counts of each file in a Parquet file, so only new or modified files are read again.
+# Any breakdown of the dimensions is then a group by over a few thousand rows instead of the whole dataset.
+
+import os
+import json
+import pandas as pd
+from . import features as features_module
+from .features import FEATURES, RAW_COLUMNS, feature_columns, numeric
+from .fingerprint import content_key
+
+DIMENSIONS = ['category_name', 'seller_powerseller', 'listing_type_id', 'updated_picture', 'is_new', 'available_quantity']
+MEASURE = 'sold_quantity'
+
+# Dimensions that are numbers in the CSVs. The rest are read as strings.
+NUMERIC_COLUMNS = ['available_quantity', 'sold_quantity', 'price', 'original_price', 'total_questions']
+
+def cube_columns(products_df, dimensions = DIMENSIONS, measure = MEASURE, actual_year = 2020, actual_month = 12):
+    """
+    The dimensions and the measure of each product. The dimensions can be columns of the retriever
+    or FEATURES (see features.feature_columns). seller_powerseller is 'NotPowerSeller' when missing.
+
+    Returns
+    --------
+        columns_df (pandas.DataFrame):
+            A column for each dimension and for the measure, with the index of products_df.
+    """
+    model_features = feature_columns(products_df, actual_year, actual_month) if set(dimensions) & set(FEATURES) else {}
+    columns_df = pd.DataFrame(index = products_df.index)
+    for column in list(dimensions) + [measure]:
+        if column in model_features:
+            columns_df[column] = model_features[column].astype(int)
+        elif column not in products_df:
+            columns_df[column] = float('nan')
+        elif column in NUMERIC_COLUMNS:
+            columns_df[column] = numeric(products_df[column])
+        else:
+            columns_df[column] = products_df[column]
+    if 'seller_powerseller' in columns_df:
+        columns_df['seller_powerseller'] = columns_df.seller_powerseller.fillna('NotPowerSeller')
+    return columns_df
+
+
+class AggregateCube:
+    """
+    Counts of the products by dimensions and sold_quantity, updated incrementally from the CSV files of a data folder.
+
+    Example:
+        >>> cube = AggregateCube('../data')
+        >>> cube.update() # Reads only the files that are new or changed since the last update
+        >>> cube.percentages('listing_type_id') # % of each sold_quantity within each listing type
+        >>> cube.percentages('seller_powerseller', where = lambda cube: ~cube.category_name.isin(['Inmuebles']))
+    """
+
+    def __init__(self, data_folder = '../data', cache_folder = None, dimensions = DIMENSIONS, measure = MEASURE,
+                 actual_year = 2020, actual_month = 12):
+        """
+        Params:
+        --------
+            data_folder (string):
+                (Default ../data) Folder with the CSV file of each category.
+
+            cache_folder (string):
+                (Default None) Folder of the stored counts. If None, data_folder/.cube is used.
+
+            dimensions (list):
+                (Default DIMENSIONS) Columns of the retriever or FEATURES by which the products are counted.
+
+            measure (string):
+                (Default sold_quantity) Column whose distribution is compared across the dimensions.
+
+            actual_year, actual_month (int):
+                (Default 2020, 12) Date used to compute the age of the products.
+        """
+        self.data_folder = data_folder
+        self.cache_folder = cache_folder or os.path.join(data_folder, '.cube')
+        self.dimensions = list(dimensions)
+        self.measure = measure
+        self.actual_year = actual_year
+        self.actual_month = actual_month
+        self._cube = None
+
+    @property
+    def columns(self):
+        return self.dimensions + [self.measure]
+
+    @property
+    def path(self):
+        return os.path.join(self.cache_folder, 'cube.parquet')
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.cache_folder, 'manifest.json')
+
+    def files(self):
+        return sorted(file for file in os.listdir(self.data_folder) if file.endswith('.csv'))
+
+    def key(self):
+        """
+        A hash of the code that computes the dimensions, of the dimensions and of the reference date.
+        When it changes, the counts of every file are computed again.
+        """
+        return content_key([features_module.__file__, __file__], [self.columns, self.actual_year, self.actual_month])
+
+    def file_key(self, file):
+        """
+        A hash of the content of a CSV file.
+        """
+        return content_key([os.path.join(self.data_folder, file)])
+
+    def file_counts(self, file):
+        """
+        Counts the products of a CSV file by the dimensions and the measure.
+
+        Returns
+        --------
+            counts_df (pandas.DataFrame):
+                A row for each combination found in the file, with its count (missing values are kept).
+        """
+        needed_columns = set(RAW_COLUMNS) | set(self.columns)
+        products_df = pd.read_csv(os.path.join(self.data_folder, file), sep = ';', dtype = str,
+                                  usecols = lambda column: column in needed_columns)
+        columns_df = cube_columns(products_df, self.dimensions, self.measure, self.actual_year, self.actual_month)
+        counts_df = columns_df.groupby(self.columns, dropna = False).size().rename('count').reset_index()
+        counts_df.insert(0, 'file', file)
+        return counts_df
+
+    def read_stored(self):
+        """
+        The stored counts of each file, and the manifest with the hashes they were computed from.
+        """
+        if not (os.path.exists(self.path) and os.path.exists(self.manifest_path)):
+            return None, {'key': None, 'files': {}}
+        with open(self.manifest_path, 'r') as manifest_file:
+            manifest = json.load(manifest_file)
+        return pd.read_parquet(self.path), manifest
+
+    def update(self, refresh = False):
+        """
+        Counts the products of the files added or modified since the last update, and drops the counts of the
+        files removed from the data folder.
+
+        Params
+        --------
+            refresh (bool):
+                (Default False) If True, the counts of every file are computed again.
+
+        Returns
+        --------
+            updated_files (list):
+                The files that were read.
+        """
+        stored_df, manifest = self.read_stored()
+        key = self.key()
+        if refresh or manifest['key'] != key:
+            stored_df, manifest = None, {'key': key, 'files': {}}
+
+        file_keys = {file: self.file_key(file) for file in self.files()}
+        updated_files = [file for file, file_key in file_keys.items() if manifest['files'].get(file) != file_key]
+        if not updated_files and set(manifest['files']) == set(file_keys) and stored_df is not None:
+            if self._cube is None:
+                self._cube = self.aggregate(stored_df)
+            return []
+
+        kept_df = stored_df[stored_df.file.isin(set(file_keys) - set(updated_files))] if stored_df is not None else None
+        counts_dfs = [counts_df for counts_df in [kept_df] + [self.file_counts(file) for file in updated_files] if counts_df is not None]
+        counts_df = pd.concat(counts_dfs, ignore_index = True) if counts_dfs else pd.DataFrame(columns = ['file'] + self.columns + ['count'])
+        os.makedirs(self.cache_folder, exist_ok = True)
+        counts_df.to_parquet(f'{self.path}.tmp', index = False)
+        os.replace(f'{self.path}.tmp', self.path)
+        with open(f'{self.manifest_path}.tmp', 'w') as manifest_file:
+            json.dump({'key': key, 'files': file_keys}, manifest_file)
+        os.replace(f'{self.manifest_path}.tmp', self.manifest_path)
+        self._cube = self.aggregate(counts_df)
+        return updated_files
+
+    def aggregate(self, counts_df):
+        """
+        Adds the counts of all the files.
+        """
+        return counts_df.groupby(self.columns, dropna = False)['count'].sum().reset_index()
+
+    @property
+    def cube(self):
+        """
+        The counts of all the products by the dimensions and the measure. The stored counts are loaded the first
+        time they're used (and built if there are none). Call update to add the files that landed since.
+        """
+        if self._cube is None:
+            stored_df, manifest = self.read_stored()
+            if stored_df is not None and manifest['key'] == self.key():
+                self._cube = self.aggregate(stored_df)
+            else:
+                self.update()
+        return self._cube
+
+    def counts(self, dimensions, where = None):
+        """
+        Number of products of each combination of some dimensions (and the measure).
+
+        Params
+        --------
+            dimensions (list):
+                The dimensions (or the measure) to group by. Missing values are dropped, like in DataFrame.groupby.
+
+            where (function):
+                (Default None) Receives the cube and returns the boolean mask of the rows to count
+                               (e.g. lambda cube: cube.category_name != 'Inmuebles').
+        """
+        cube = self.cube if where is None else self.cube[where(self.cube)]
+        return cube.groupby(list(dimensions))['count'].sum()
+
+    def percentages(self, index, columns = None, where = None):
+        """
+        The percentage of each value of columns within each value of index. Equivalent to
+        products_df.groupby([index, columns]).size().groupby(level = 0).apply(lambda x: 100*x/x.sum()).unstack()
+
+        Params
+        --------
+            index (string):
+                The dimension (or the measure) of the rows.
+
+            columns (string):
+                (Default None) The dimension of the columns. If None, the measure.
+
+            where (function):
+                (Default None) Selects the rows of the cube to count (see counts).
+
+        Returns
+        --------
+            percentages_df (pandas.DataFrame):
+                A row for each value of index, whose values add up to 100.
+        """
+        counts = self.counts([index, columns or self.measure], where)
+        return (100*counts/counts.groupby(level = 0).transform('sum')).unstack()
+
+    def clear(self):
+        """
+        Removes the stored counts.
+        """
+        for path in [self.path, self.manifest_path]:
+            if os.path.exists(path):
+                os.remove(path)
+        self._cube = None
@@ -0,0 +1,150 @@
+# Feature store of the notebooks.
+# The features used by the exploratory and model notebooks are computed in one pass over the extracted products,
+# and materialized to a Parquet file keyed by a hash of the CSV files and of the code that computes them.
+# Repeated runs load the file instead of parsing the CSVs and deriving the features again.
+
+import os
+import numpy as np
+import pandas as pd
+from . import features as features_module
+from .features import feature_columns
+from .fingerprint import content_key
+
+# Columns added to the products, besides the FEATURES of the model.
+STORE_FEATURES = ['golden_categories', 'is_new', 'total_questions', 'has_questions', 'product_age', 'has_discount',
+                  'vlr_descuento', 'updated_picture', 'seller_powerseller', 'seller_level_id', 'GroupedReputation']
+
+# Indicators stored as booleans, as in the exploratory notebooks (e.g. complete_df[complete_df.has_discount]).
+BOOLEAN_FEATURES = ['is_new', 'has_discount', 'updated_picture']
+
+REPUTATION_GROUPS = {
+    '5_green': 'Green Seller',
+    '4_light_green': 'Green Seller',
+    '3_yellow': 'Yellow Seller',
+    '2_orange': 'Orange Seller',
+    '1_red': 'Orange Seller',
+    'NoColor': 'No Color'
+}
+
+def compute_store_features(products_df, actual_year = 2020, actual_month = 12):
+    """
+    Adds the features of the notebooks to the products.
+
+    Params
+    --------
+        products_df (pandas.DataFrame):
+            The products extracted by meliRetriever.
+
+        actual_year, actual_month (int):
+            (Default 2020, 12) Date used to compute the age of the products.
+
+    Returns
+    --------
+        features_df (pandas.DataFrame):
+            The products with the STORE_FEATURES. total_questions is 0 for the products without questions,
+            seller_powerseller is 'NotPowerSeller' and seller_level_id is 'NoColor' when missing.
+            The BOOLEAN_FEATURES are booleans, and the rest of the indicators are 0 or 1.
+    """
+    features_df = products_df.copy()
+    model_features = feature_columns(products_df, actual_year, actual_month)
+    for feature, values in model_features.items():
+        features_df[feature] = values.astype(bool) if feature in BOOLEAN_FEATURES else values
+    features_df['has_questions'] = 1*(products_df.total_questions.notna().values)
+
+    # Cálculo del descuento aplicado al producto
+    price, original_price = products_df.price.values, products_df.original_price.values
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        features_df['vlr_descuento'] = np.where(np.isnan(original_price), 0, np.round(1 - price/original_price, 2))
+
+    # Modificadores de Reputación
+    features_df['seller_powerseller'] = products_df.seller_powerseller.fillna('NotPowerSeller')
+    features_df['seller_level_id'] = products_df.seller_level_id.fillna('NoColor')
+    features_df['GroupedReputation'] = features_df.seller_level_id.map(REPUTATION_GROUPS)
+    return features_df
+
+
+class FeatureStore:
+    """
+    Computes the features of the products of a data folder once, and caches them in a Parquet file.
+
+    Example:
+        >>> store = FeatureStore('../data')
+        >>> complete_df = store.load() # Built on the first run, read from the cache afterwards
+    """
+
+    def __init__(self, data_folder = '../data', cache_folder = None, actual_year = 2020, actual_month = 12):
+        """
+        Params:
+        --------
+            data_folder (string):
+                (Default ../data) Folder with the CSV file of each category.
+
+            cache_folder (string):
+                (Default None) Folder of the cached features. If None, data_folder/.features is used.
+
+            actual_year, actual_month (int):
+                (Default 2020, 12) Date used to compute the age of the products.
+        """
+        self.data_folder = data_folder
+        self.cache_folder = cache_folder or os.path.join(data_folder, '.features')
+        self.actual_year = actual_year
+        self.actual_month = actual_month
+
+    def files(self):
+        """
+        The CSV files, in the order of os.listdir, like the notebooks read them (the order of the products
+        changes the split of train_test_split).
+        """
+        return [file for file in os.listdir(self.data_folder) if file.endswith('.csv')]
+
+    def key(self):
+        """
+        A hash of the content of the CSV files (and their order), of the code of the features and of the reference date.
+        """
+        files = self.files()
+        return content_key([features_module.__file__, __file__] + [os.path.join(self.data_folder, file) for file in files],
+                           [self.actual_year, self.actual_month, files])
+
+    def path(self, key = None):
+        return os.path.join(self.cache_folder, f'features-{(key or self.key())[:16]}.parquet')
+
+    def build(self):
+        """
+        Reads the CSV files and computes the features of their products.
+        """
+        data_by_category = [pd.read_csv(os.path.join(self.data_folder, file), sep = ';') for file in self.files()]
+        complete_df = pd.concat(data_by_category, axis = 0, ignore_index = True)
+        return compute_store_features(complete_df, self.actual_year, self.actual_month)
+
+    def load(self, columns = None, refresh = False):
+        """
+        The products with their features, from the cache if the data and the code didn't change.
+
+        Params
+        --------
+            columns (list):
+                (Default None) The columns to load. If None, loads all of them.
+
+            refresh (bool):
+                (Default False) If True, the features are built again even if they are cached.
+        """
+        path = self.path()
+        if refresh or not os.path.exists(path):
+            os.makedirs(self.cache_folder, exist_ok = True)
+            features_df = self.build()
+            for column in features_df.columns[features_df.dtypes == object]: # e.g. month_update mixes numbers and strings
+                values = features_df[column]
+                features_df[column] = values.where(values.isna(), values.astype(str))
+            temporary_path = f'{path}.tmp'
+            features_df.to_parquet(temporary_path, index = False)
+            os.replace(temporary_path, path)
+            return features_df[columns] if columns is not None else features_df
+        return pd.read_parquet(path, columns = columns)
+
+    def clear(self):
+        """
+        Removes the cached features.
+        """
+        for file in os.listdir(self.cache_folder):
+            if file.startswith('features-'):
+                os.remove(os.path.join(self.cache_folder, file))
@@ -0,0 +1,70 @@
+# Features of the sold_quantity models, computed from the columns extracted by meliRetriever.
+import numpy as np
+import pandas as pd
+
+FEATURES = ['golden_categories', 'is_new', 'total_questions', 'product_age', 'has_discount', 'updated_picture']
+
+# Columns of the retriever needed to compute the features.
+RAW_COLUMNS = ['listing_type_id', 'condition', 'total_questions', 'year_created', 'month_created',
+               'original_price', 'year_update', 'month_update']
+
+def numeric(values):
+    """
+    Converts a column to floats. Values that aren't numbers (e.g. a malformed thumbnail date) become NaN.
+    """
+    try:
+        return np.asarray(values, dtype = float)
+    except (TypeError, ValueError):
+        return pd.to_numeric(pd.Series(values), errors = 'coerce').to_numpy(dtype = float)
+
+def feature_columns(raw_columns, actual_year = 2020, actual_month = 12):
+    """
+    Computes the features of MODEL_SoldQuantity.ipynb with array operations.
+
+    Params
+    --------
+        raw_columns (dict or pandas.DataFrame):
+            The values of each one of the RAW_COLUMNS.
+
+        actual_year (int):
+            (Default 2020) Year used to compute the age of the products.
+
+        actual_month (int):
+            (Default 12) Month used to compute the age of the products.
+
+    Returns
+    --------
+        features (dict):
+            An array for each one of the FEATURES.
+    """
+    year_created, month_created = numeric(raw_columns['year_created']), numeric(raw_columns['month_created'])
+    year_update, month_update = numeric(raw_columns['year_update']), numeric(raw_columns['month_update'])
+    same_date = (year_update == year_created) & (month_update == month_created)
+    return {
+        # Indicador de Categoría Dorada
+        'golden_categories': 1*np.isin(np.asarray(raw_columns['listing_type_id'], dtype = object), ['gold_pro', 'gold_special']),
+        # Indicador de Producto Nuevo
+        'is_new': 1*(np.asarray(raw_columns['condition'], dtype = object) == 'new'),
+        # Los productos con total preguntas nulo es porque son 0.
+        'total_questions': np.nan_to_num(numeric(raw_columns['total_questions']), nan = 0.0),
+        # Antigüedad de Producto
+        'product_age': 12*(actual_year - year_created) + (actual_month - month_created) + 1,
+        # Indicador de descuento
+        'has_discount': 1*(~np.isnan(numeric(raw_columns['original_price']))),
+        # Indica si la foto fue actualizada
+        'updated_picture': 1.0*(~same_date)
+    }
+
+def build_features(products_df, actual_year = 2020, actual_month = 12):
+    """
+    The FEATURES of each product, as a DataFrame with the index of products_df (see feature_columns).
+    """
+    return pd.DataFrame(feature_columns(products_df, actual_year, actual_month), index = products_df.index, columns = FEATURES)
+
+def feature_matrix(items, actual_year = 2020, actual_month = 12):
+    """
+    The FEATURES of a batch of products, given as a list of dictionaries with the RAW_COLUMNS, as a float matrix.
+    """
+    raw_columns = {column: [item.get(column) for item in items] for column in RAW_COLUMNS}
+    features = feature_columns(raw_columns, actual_year, actual_month)
+    return np.column_stack([features[feature] for feature in FEATURES]).astype(float)
@@ -0,0 +1,32 @@
+# Hashes of the results cached by the notebooks (feature_store.py and cube.py).
+# A cached result is valid while the files it was computed from (the CSVs and the source of the code that
+# computes it) and its parameters don't change.
+
+import json
+import hashlib
+
+def content_key(paths, parameters = None):
+    """
+    A SHA-1 of the content of some files, in order, and of some parameters.
+
+    Params
+    --------
+        paths (list):
+            The files (e.g. CSV files or the modules of the code).
+
+        parameters (list or dict):
+            (Default None) Values that can be serialized to JSON (e.g. the reference date of the features).
+
+    Returns
+    --------
+        key (string):
+            The hexadecimal digest.
+    """
+    key = hashlib.sha1()
+    for path in paths:
+        with open(path, 'rb') as content_file:
+            for block in iter(lambda: content_file.read(1 << 20), b''):
+                key.update(block)
+    if parameters is not None:
+        key.update(json.dumps(parameters).encode())
+    return key.hexdigest()
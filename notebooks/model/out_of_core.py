@@ -0,0 +1,209 @@
+# Out-of-core training of the sold_quantity classifier.
+# The category files are streamed chunk by chunk: each product is assigned to train, validation or test by a hash
+# of its id (the same split on every run and every machine), and XGBoost reads the chunks through an external
+# memory DMatrix, so the peak memory depends on the chunk size and not on the number of products.
+
+import os
+import zlib
+import numpy as np
+import xgboost as xgb
+from .features import FEATURES, RAW_COLUMNS, feature_columns
+
+SPLITS = ['train', 'validation', 'test']
+
+# Parameters of the classifier of MODEL_SoldQuantity.ipynb. External memory requires the hist tree method.
+DEFAULT_PARAMS = {'objective': 'multi:softmax', 'tree_method': 'hist', 'nthread': 3}
+
+def hash_split(ids, train_size = 0.7, validation_size = 0.15):
+    """
+    Assigns each product to a split by the CRC32 of its id. The split of a product doesn't depend on
+    the order of the files nor on the other products, so it's the same in memory and out of core.
+
+    Params
+    --------
+        ids (iterable):
+            The ids of the products.
+
+        train_size, validation_size (float):
+            (Default 0.7, 0.15) Fraction of the products in train and validation. The rest are in test.
+
+    Returns
+    --------
+        splits (np.array):
+            The split of each product ('train', 'validation' or 'test').
+    """
+    buckets = np.array([zlib.crc32(str(item_id).encode('utf-8')) for item_id in ids], dtype = float)/2**32
+    return np.where(buckets < train_size, 'train', np.where(buckets < train_size + validation_size, 'validation', 'test'))
+
+def split_chunks(storage, category_ids, split, chunksize = 50000, train_size = 0.7, validation_size = 0.15,
+                 actual_year = 2020, actual_month = 12):
+    """
+    Yields the features matrix and the sold_quantity of the products of a split, one chunk at a time.
+    """
+    for category_id in category_ids:
+        for chunk_df in storage.iter_chunks(category_id, columns = ['id'] + RAW_COLUMNS + ['sold_quantity'], chunksize = chunksize):
+            chunk_df = chunk_df[hash_split(chunk_df['id'], train_size, validation_size) == split]
+            if chunk_df.empty:
+                continue
+            features = feature_columns(chunk_df, actual_year, actual_month)
+            yield np.column_stack([features[feature] for feature in FEATURES]).astype(float), chunk_df.sold_quantity.values
+
+def stream_classes(storage, category_ids, chunksize = 50000):
+    """
+    The distinct values of sold_quantity of the stored products (the classes of the classifier).
+    """
+    classes = set()
+    for category_id in category_ids:
+        for chunk_df in storage.iter_chunks(category_id, columns = ['sold_quantity'], chunksize = chunksize):
+            classes.update(chunk_df.sold_quantity.unique())
+    return np.array(sorted(classes))
+
+
+class ProductChunks(xgb.DataIter if hasattr(xgb, 'DataIter') else object):
+    """
+    An xgboost.DataIter over the chunks of a split (xgboost >= 1.5). XGBoost iterates it to build its
+    external memory cache, labels encoded as the positions of sold_quantity in classes.
+
+    Example:
+        >>> chunks = ProductChunks(storage, category_ids, 'train', classes, cache_prefix = 'cache/train')
+        >>> train_matrix = xgb.DMatrix(chunks)
+    """
+
+    def __init__(self, storage, category_ids, split, classes, cache_prefix, **split_kwargs):
+        """
+        Params:
+        --------
+            storage (CSVStorage or ParquetStorage):
+                The storage of the products.
+
+            category_ids (list):
+                The categories to read.
+
+            split (string):
+                'train', 'validation' or 'test'.
+
+            classes (np.array):
+                The sorted values of sold_quantity.
+
+            cache_prefix (string):
+                Prefix of the cache files written by XGBoost.
+
+            split_kwargs:
+                chunksize, train_size, validation_size, actual_year and actual_month of split_chunks.
+        """
+        self.chunk_arguments = (storage, category_ids, split)
+        self.split_kwargs = split_kwargs
+        self.classes = classes
+        self.chunks = None
+        super().__init__(cache_prefix = cache_prefix)
+
+    def next(self, input_data):
+        if self.chunks is None:
+            self.chunks = split_chunks(*self.chunk_arguments, **self.split_kwargs)
+        try:
+            features, sold_quantity = next(self.chunks)
+        except StopIteration:
+            return 0
+        input_data(data = features, label = np.searchsorted(self.classes, sold_quantity), feature_names = FEATURES)
+        return 1
+
+    def reset(self):
+        self.chunks = None
+
+
+def write_libsvm(chunks, classes, path):
+    """
+    Writes the chunks of a split to a libsvm file, for the external memory of xgboost < 1.5. The missing values
+    are left out of each line, and the zeros are written (libsvm treats the absent values as missing).
+    """
+    with open(path, 'w') as libsvm_file:
+        for features, sold_quantity in chunks:
+            for label, row in zip(np.searchsorted(classes, sold_quantity), features):
+                values = ' '.join(f'{column}:{value:.17g}' for column, value in enumerate(row) if not np.isnan(value))
+                libsvm_file.write(f'{label} {values}\n')
+
+def external_memory_matrix(storage, category_ids, split, classes, cache_folder, **split_kwargs):
+    """
+    A DMatrix of a split backed by a cache in cache_folder: an iterator over the chunks (xgboost >= 1.5)
+    or a libsvm file with a #cache suffix (older versions).
+    """
+    os.makedirs(cache_folder, exist_ok = True)
+    cache_prefix = os.path.join(cache_folder, split)
+    if hasattr(xgb, 'DataIter'):
+        return xgb.DMatrix(ProductChunks(storage, category_ids, split, classes, cache_prefix, **split_kwargs))
+    libsvm_path = f'{cache_prefix}.libsvm'
+    write_libsvm(split_chunks(storage, category_ids, split, **split_kwargs), classes, libsvm_path)
+    return xgb.DMatrix(f'{libsvm_path}#{cache_prefix}.cache', feature_names = FEATURES)
+
+def train_out_of_core(storage, category_ids, cache_folder, params = None, num_boost_round = 500,
+                      early_stopping_rounds = None, **split_kwargs):
+    """
+    Trains the sold_quantity classifier with the train split, streaming the stored products.
+
+    Params
+    --------
+        storage (CSVStorage or ParquetStorage):
+            The storage of the products, e.g. CSVStorage('../data').
+
+        category_ids (list):
+            The categories used to train.
+
+        cache_folder (string):
+            Folder of the external memory cache of XGBoost.
+
+        params (dict):
+            (Default None) Parameters of xgboost.train, added to DEFAULT_PARAMS.
+
+        num_boost_round (int):
+            (Default 500) Number of trees.
+
+        early_stopping_rounds (int):
+            (Default None) If given, stops when the validation split doesn't improve in this number of rounds.
+
+        split_kwargs:
+            chunksize, train_size, validation_size, actual_year and actual_month of split_chunks.
+
+    Returns
+    --------
+        booster (xgboost.Booster):
+            The trained classifier. It predicts the position of the sold_quantity in classes.
+
+        classes (np.array):
+            The sorted values of sold_quantity.
+    """
+    classes = stream_classes(storage, category_ids, split_kwargs.get('chunksize', 50000))
+    params = {**DEFAULT_PARAMS, 'num_class': len(classes), **(params or {})}
+    train_matrix = external_memory_matrix(storage, category_ids, 'train', classes, cache_folder, **split_kwargs)
+    evals = [(train_matrix, 'train')]
+    if early_stopping_rounds is not None:
+        evals.append((external_memory_matrix(storage, category_ids, 'validation', classes, cache_folder, **split_kwargs), 'validation'))
+    booster = xgb.train(params, train_matrix, num_boost_round = num_boost_round, evals = evals,
+                        early_stopping_rounds = early_stopping_rounds, verbose_eval = False)
+    return booster, classes
+
+def macro_f1(confusion):
+    """
+    The f1 macro of a confusion matrix (rows: true class, columns: predicted class), over the classes that
+    are in the true or the predicted values, as sklearn.metrics.f1_score.
+    """
+    true_positives = np.diag(confusion).astype(float)
+    true_counts, predicted_counts = confusion.sum(axis = 1), confusion.sum(axis = 0)
+    present = (true_counts + predicted_counts) > 0
+    f1_scores = 2*true_positives[present]/(true_counts[present] + predicted_counts[present])
+    return f1_scores.mean()
+
+def evaluate_out_of_core(booster, classes, storage, category_ids, split = 'test', **split_kwargs):
+    """
+    Predicts a split chunk by chunk, accumulating its confusion matrix.
+
+    Returns
+    --------
+        metrics (dict):
+            The number of products, the accuracy, the f1 macro and the confusion matrix of the split.
+    """
+    confusion = np.zeros((len(classes), len(classes)), dtype = np.int64)
+    for features, sold_quantity in split_chunks(storage, category_ids, split, **split_kwargs):
+        predictions = booster.predict(xgb.DMatrix(features, feature_names = FEATURES)).astype(int)
+        np.add.at(confusion, (np.searchsorted(classes, sold_quantity), predictions), 1)
+    return {'rows': int(confusion.sum()), 'accuracy': np.trace(confusion)/max(confusion.sum(), 1),
+            'f1_macro': macro_f1(confusion), 'confusion_matrix': confusion}
@@ -0,0 +1,211 @@
+# Persistence and scoring of the sold_quantity models.
+# save_models stores the fitted XGBoost classifier and the benchmark lookup table in a folder. SoldQuantityService
+# loads them once and predicts batches of products given with the columns extracted by meliRetriever,
+# either in process or through a small HTTP server.
+#
+# Usage (from the root of the repository):
+#     python -m notebooks.model.serving models/sold_quantity --port 8080
+#     python -m notebooks.model.serving models/sold_quantity --input data/MCO1000.csv --output predictions.csv
+
+import os
+import json
+import argparse
+import threading
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from .benchmark import benchmark
+from .features import FEATURES, RAW_COLUMNS, build_features, feature_matrix
+
+def save_models(path, xgb_model = None, benchmark_model = None, classes = None, actual_year = 2020, actual_month = 12):
+    """
+    Saves the fitted models in a folder: xgb_model.json (XGBoost's JSON format), benchmark.json and metadata.json.
+
+    Params
+    --------
+        path (string):
+            Folder where the models are saved.
+
+        xgb_model (XGBClassifier or GridSearchCV):
+            (Default None) The fitted classifier. For a GridSearchCV, its best estimator is saved.
+
+        benchmark_model (benchmark):
+            (Default None) The fitted benchmark.
+
+        classes (list):
+            (Default None) The sold_quantity of each class of the classifier. If None, uses the classes_ of the classifier (or of the search).
+
+        actual_year, actual_month (int):
+            (Default 2020, 12) Date used to compute the age of the products.
+    """
+    os.makedirs(path, exist_ok = True)
+    metadata = {'features': FEATURES, 'raw_columns': RAW_COLUMNS, 'actual_year': actual_year, 'actual_month': actual_month}
+    if xgb_model is not None:
+        estimator = getattr(xgb_model, 'best_estimator_', xgb_model)
+        estimator.get_booster().save_model(os.path.join(path, 'xgb_model.json'))
+        classes = getattr(xgb_model, 'classes_', estimator.classes_) if classes is None else classes
+        metadata['classes'] = [int(label) for label in classes]
+        metadata['xgboost_version'] = xgb.__version__
+    if benchmark_model is not None:
+        lookup_model = [[float(group), int(prediction)] for group, prediction in benchmark_model.lookup_model.items()]
+        with open(os.path.join(path, 'benchmark.json'), 'w') as benchmark_file:
+            global_mode = None if benchmark_model.global_mode is None else int(benchmark_model.global_mode)
+            json.dump({'grouping': benchmark_model.grouping, 'lookup_model': lookup_model, 'global_mode': global_mode}, benchmark_file)
+    with open(os.path.join(path, 'metadata.json'), 'w') as metadata_file:
+        json.dump(metadata, metadata_file, indent = 1)
+
+
+class SoldQuantityService:
+    """
+    Predicts the sold_quantity of batches of products with the models saved by save_models.
+
+    Example:
+        >>> service = SoldQuantityService('models/sold_quantity')
+        >>> service.predict([{'listing_type_id': 'gold_pro', 'condition': 'new', 'total_questions': 3, ...}])
+        {'xgboost': [5], 'benchmark': [1]}
+    """
+
+    def __init__(self, path):
+        """
+        Params:
+        --------
+            path (string):
+                Folder with the models saved by save_models.
+        """
+        with open(os.path.join(path, 'metadata.json')) as metadata_file:
+            self.metadata = json.load(metadata_file)
+        self.booster = None
+        self.benchmark = None
+        self.lock = threading.Lock()
+        if os.path.exists(os.path.join(path, 'xgb_model.json')):
+            self.booster = xgb.Booster()
+            self.booster.load_model(os.path.join(path, 'xgb_model.json'))
+            self.classes = np.array(self.metadata['classes'])
+        if os.path.exists(os.path.join(path, 'benchmark.json')):
+            with open(os.path.join(path, 'benchmark.json')) as benchmark_file:
+                saved_benchmark = json.load(benchmark_file)
+            self.benchmark = benchmark(saved_benchmark['grouping'])
+            self.benchmark.lookup_model = {group: prediction for group, prediction in saved_benchmark['lookup_model']}
+            self.benchmark.global_mode = saved_benchmark.get('global_mode')
+
+    def features(self, items):
+        """
+        The feature matrix of a batch of products, given as a DataFrame or a list of dictionaries with the RAW_COLUMNS.
+        """
+        if isinstance(items, pd.DataFrame):
+            products_df = items.reindex(columns = self.metadata['raw_columns'])
+            features_df = build_features(products_df, self.metadata['actual_year'], self.metadata['actual_month'])
+            return features_df[self.metadata['features']].to_numpy(dtype = float)
+        return feature_matrix(items, self.metadata['actual_year'], self.metadata['actual_month'])
+
+    def predict(self, items):
+        """
+        Predicts the sold_quantity of a batch of products.
+
+        Returns
+        --------
+            predictions (dict):
+                The predictions of each model ('xgboost' and 'benchmark') as lists, in the order of the items.
+                The products whose age group wasn't seen by the benchmark get the mode of all the products
+                (None if the saved benchmark doesn't have it).
+        """
+        features = self.features(items)
+        predictions = {}
+        if self.booster is not None:
+            with self.lock:
+                scores = self.booster.predict(xgb.DMatrix(features, feature_names = self.metadata['features']))
+            class_index = scores.argmax(axis = 1) if scores.ndim == 2 else scores.astype(int) # multi:softprob or multi:softmax
+            predictions['xgboost'] = self.classes[class_index].tolist()
+        if self.benchmark is not None:
+            unseen = self.benchmark.global_mode if self.benchmark.global_mode is not None else np.nan
+            benchmark_predictions = self.benchmark.predict(pd.DataFrame(features, columns = self.metadata['features']), unseen = unseen)
+            predictions['benchmark'] = [None if np.isnan(prediction) else prediction for prediction in benchmark_predictions.tolist()]
+        return predictions
+
+
+class PredictionHandler(BaseHTTPRequestHandler):
+    """
+    POST /predict with {"items": [...]} returns the predictions of SoldQuantityService.predict.
+    """
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path == '/health':
+            return self.send_json(200, {'status': 'ok'})
+        self.send_json(404, {'error': 'not_found'})
+
+    def do_POST(self):
+        if self.path != '/predict':
+            return self.send_json(404, {'error': 'not_found'})
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            predictions = self.server.service.predict(body['items'])
+        except (ValueError, KeyError, TypeError) as e:
+            return self.send_json(400, {'error': repr(e)})
+        self.send_json(200, predictions)
+
+    def send_json(self, status, body):
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+class PredictionServer(ThreadingHTTPServer):
+    """
+    A threaded HTTP server around a SoldQuantityService.
+    """
+    daemon_threads = True
+
+    def __init__(self, service, host = '127.0.0.1', port = 8080, handler = PredictionHandler):
+        super().__init__((host, port), handler)
+        self.service = service
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        """
+        Serves the requests in a background thread.
+        """
+        thread = threading.Thread(target = self.serve_forever, daemon = True)
+        thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Serves or applies the saved sold_quantity models.')
+    parser.add_argument('model')
+    parser.add_argument('--host', default = '127.0.0.1')
+    parser.add_argument('--port', type = int, default = 8080)
+    parser.add_argument('--input', default = None, help = "CSV (';'-separated) of products to score in batch")
+    parser.add_argument('--output', default = 'predictions.csv')
+    args = parser.parse_args()
+
+    service = SoldQuantityService(args.model)
+    if args.input is not None:
+        products_df = pd.read_csv(args.input, sep = ';')
+        predictions_df = pd.DataFrame(service.predict(products_df), index = products_df.index)
+        if 'id' in products_df:
+            predictions_df.insert(0, 'id', products_df['id'])
+        predictions_df.to_csv(args.output, sep = ';', index = False)
+    else:
+        server = PredictionServer(service, args.host, args.port)
+        print(f'Serving the sold_quantity models at {server.url}/predict')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.server_close()
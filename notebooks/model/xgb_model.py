@@ -1,4 +1,9 @@
-from sklearn.model_selection import StratifiedShuffleSplit, GridSearchCV
+import time
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from sklearn.metrics import f1_score
+from sklearn.model_selection import StratifiedShuffleSplit, GridSearchCV, ParameterGrid
 from xgboost import XGBClassifier
 
 def GridSearchXGBClassifier(num_class):
@@ -16,4 +21,136 @@ def GridSearchXGBClassifier(num_class):
 
 
 
-    Model_1.fit(X_train, y_train)
\ No newline at end of file
+    Model_1.fit(X_train, y_train)
+
+
+def predict_with_trees(model, X, n_trees):
+    """
+    Predicts with the first n_trees boosting rounds of a fitted XGBClassifier.
+    """
+    try:
+        return model.predict(X, iteration_range = (0, n_trees))
+    except TypeError: # xgboost < 1.4
+        return model.predict(X, ntree_limit = n_trees)
+
+def fit_and_score_prefixes(params, tree_counts, X, y, train, test, num_class):
+    """
+    Trains one model with max(tree_counts) trees on a fold, and scores (f1 macro) the predictions of each prefix of its trees.
+    """
+    model = XGBClassifier(objective = 'multi:softmax', num_class = num_class, n_estimators = max(tree_counts), n_jobs = 1, **params)
+    model.fit(X[train], y[train])
+    return [f1_score(y[test], predict_with_trees(model, X[test], n_trees), average = 'macro') for n_trees in tree_counts]
+
+
+class HalvingSearchXGBClassifier:
+    """
+    A replacement of GridSearchXGBClassifier. Instead of training a model for each n_estimators, trains one model per fold
+    with the largest number of trees and scores every prefix of its trees (e.g. 200, 300, ..., 700).
+    The folds and configurations are trained in parallel, and the configurations of param_grid (e.g. max_depth,
+    learning_rate) are compared by successive halving: all of them are trained with few trees, and only the
+    best 1/halving_factor go to the next round, with halving_factor times more trees.
+
+    Example:
+        >>> search = HalvingSearchXGBClassifier(num_class = 14, param_grid = {'max_depth': [3, 6, 9], 'learning_rate': [0.1, 0.3]})
+        >>> search.fit(X_train, y_train)
+        >>> search.best_params_
+        >>> search.predict(X_val)
+    """
+
+    def __init__(self, num_class, n_estimators = range(200, 800, 100), param_grid = None, halving_factor = 3,
+                 cv = None, n_jobs = -1, verbose = 1):
+        """
+        Params:
+        --------
+            num_class (int):
+                Number of classes of the target.
+
+            n_estimators (iterable):
+                (Default range(200, 800, 100)) Numbers of trees to evaluate.
+
+            param_grid (dict):
+                (Default None) Other parameters of XGBClassifier to search, e.g. {'max_depth': [3, 6]}.
+                If None, only n_estimators is searched (as GridSearchXGBClassifier).
+
+            halving_factor (int):
+                (Default 3) Fraction of the configurations kept after each round of successive halving.
+
+            cv (cross-validator):
+                (Default None) The folds. If None, uses the StratifiedShuffleSplit of GridSearchXGBClassifier.
+
+            n_jobs (int):
+                (Default -1) Number of models trained in parallel. If -1 uses all available.
+
+            verbose (int):
+                (Default 1) If greater than 0, prints the progress of each round.
+        """
+        self.num_class = num_class
+        self.n_estimators = sorted(n_estimators)
+        self.param_grid = param_grid or {}
+        self.halving_factor = halving_factor
+        self.cv = cv or StratifiedShuffleSplit(n_splits = 3, test_size = 0.3, random_state = 42)
+        self.n_jobs = n_jobs
+        self.verbose = verbose
+
+    def tree_budgets(self, n_configurations):
+        """
+        The number of trees of each round of successive halving. The last round uses the largest n_estimators.
+        The rounds are the smallest integer such that halving_factor**rounds >= n_configurations (computed
+        with integers, since math.log gives e.g. log(125, 5) = 3.0000000000000004).
+        """
+        rounds, survivors = 0, 1
+        while survivors < n_configurations:
+            survivors *= self.halving_factor
+            rounds += 1
+        max_trees = self.n_estimators[-1]
+        return [max(1, max_trees//self.halving_factor**(rounds - k)) for k in range(rounds + 1)]
+
+    def fit(self, X, y):
+        """
+        Searches the best configuration and number of trees, and refits it with all the data.
+
+        Params
+        --------
+            X (pandas.DataFrame or np.array):
+                The features.
+
+            y (pandas.Series, pandas.DataFrame or np.array):
+                The target.
+        """
+        start = time.perf_counter()
+        X_values = np.asarray(X)
+        self.classes_, y_encoded = np.unique(np.ravel(y), return_inverse = True)
+        folds = list(self.cv.split(X_values, y_encoded))
+        configurations = list(ParameterGrid(self.param_grid))
+        self.cv_results_ = []
+
+        budgets = self.tree_budgets(len(configurations))
+        for round_index, budget in enumerate(budgets):
+            tree_counts = [n_trees for n_trees in self.n_estimators if n_trees < budget] + [budget]
+            fold_scores = Parallel(n_jobs = self.n_jobs)(delayed(fit_and_score_prefixes)(params, tree_counts, X_values, y_encoded, train, test, self.num_class)
+                                        for params in configurations for train, test in folds)
+            fold_scores = np.array(fold_scores).reshape(len(configurations), len(folds), len(tree_counts))
+            mean_scores = fold_scores.mean(axis = 1)
+            for params, scores in zip(configurations, mean_scores):
+                for n_trees, score in zip(tree_counts, scores):
+                    self.cv_results_.append({**params, 'n_estimators': n_trees, 'budget': budget, 'mean_test_score': score})
+            if self.verbose:
+                print(f'{len(configurations)} configurations x {len(folds)} folds with {budget} trees: best f1 {mean_scores.max():.4f}')
+
+            if round_index < len(budgets) - 1: # The configurations of the last round are only scored
+                ranking = np.argsort(-mean_scores.max(axis = 1), kind = 'stable')
+                configurations = [configurations[idx] for idx in ranking[:max(1, len(configurations)//self.halving_factor)]]
+
+        last_round = [result for result in self.cv_results_ if result['budget'] == budget]
+        best = max(last_round, key = lambda result: result['mean_test_score'])
+        self.best_score_ = best['mean_test_score']
+        self.best_params_ = {key: value for key, value in best.items() if key not in ['budget', 'mean_test_score']}
+        self.cv_results_ = pd.DataFrame(self.cv_results_)
+
+        self.best_estimator_ = XGBClassifier(objective = 'multi:softmax', num_class = self.num_class, n_jobs = 3, **self.best_params_)
+        self.best_estimator_.fit(X, y_encoded)
+        self.fit_time_ = time.perf_counter() - start
+        return self
+
+    def predict(self, X):
+        return self.classes_[self.best_estimator_.predict(X).astype(int)]
@@ -1,2 +1,31 @@
-from .retrieve import meliRetriever
-from .token import getAPIkey
\ No newline at end of file
+# The modules are imported the first time one of their names is used (e.g. from src import meliRetriever),
+# so importing the package doesn't load pandas, aiohttp or the meli SDK until they are needed.
+
+import importlib
+
+_EXPORTS = {
+    'meliRetriever': '.retrieve',
+    'asyncMeliRetriever': '.async_retrieve',
+    'meliOrchestrator': '.orchestrator',
+    'ResponseCache': '.cache',
+    'ItemIndex': '.item_index',
+    'CSVStorage': '.storage',
+    'ParquetStorage': '.storage',
+    'MODEL_COLUMNS': '.storage',
+    'DatasetLoader': '.loader',
+    'SiteCatalog': '.site_catalog',
+    'TokenManager': '.token_manager',
+    'getAPIkey': '.token'
+}
+
+__all__ = list(_EXPORTS)
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    value = getattr(importlib.import_module(_EXPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,239 @@
+# An asyncio engine for meliRetriever.
+# Pages, categories and questions are requested concurrently over a single HTTP session, and all the
+# requests made with the same token go through one shared throttle. The blocking work (the files of the
+# checkpoints, the cache and the item index, and the refresh of the token) runs in threads, so it never
+# stalls the requests in flight.
+
+import json
+import time
+import asyncio
+import aiohttp
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+from .retrieve import meliRetriever, PageFetchError
+from .metrics import request_endpoint
+from .sharding import shard_label
+from .token_manager import TokenManager
+
+class asyncMeliRetriever(meliRetriever):
+    """
+    An alternative to meliRetriever(parallel = True) that keeps hundreds of requests in flight
+    from a single process. The generated files are the same as the ones of meliRetriever.
+
+    Example:
+        >>> retriever = asyncMeliRetriever(site_name = 'Colombia',
+                                           token = api_key,
+                                           requests_per_second = 20)
+
+        >>> retriever.create_dataset(products_per_category = 10000)
+
+    """
+
+    def __init__(self, site_name, token, folder = 'data', keep_individual_memory = False, requests_per_second = 10, max_in_flight = 200, 
+                 max_pages_in_flight = None, **kwargs):
+        """
+        Params:
+        --------
+            site_name (str):
+                A site name from which list MELI's products (https://api.mercadolibre.com/sites#json)
+
+            token (string):
+                MELI's API Token.
+
+            folder (string):
+                Folder where the data is going to be stored.
+
+            keep_individual_memory (bool):
+                (Default False) If the extraction for each category is going to be stored in memory.
+
+            requests_per_second (float):
+                (Default 10) Target requests per second for the token (see throttle.AdaptiveThrottle).
+
+            max_in_flight (int):
+                (Default 200) Maximum number of concurrent requests, and of keep-alive connections.
+
+            max_pages_in_flight (int):
+                (Default None) Maximum number of pages being retrieved (search, details and questions) or written
+                               at the same time. The rest wait for their turn before their search is sent, so the
+                               pages are finished and checkpointed as the extraction goes. If None, max_in_flight/25
+                               (each page has up to 50 questions requests).
+
+            **kwargs:
+                Other parameters of meliRetriever (e.g. max_retries, api_url).
+
+        """
+        super().__init__(site_name, token, folder = folder, keep_individual_memory = keep_individual_memory, parallel = False, 
+                            requests_per_second = requests_per_second, **kwargs)
+        self.max_in_flight = max_in_flight
+        self.max_pages_in_flight = max_pages_in_flight or max(1, max_in_flight//25)
+
+    def retrieve_categories(self, products_per_category, check_existence = True):
+        """
+        Lists the products of every available category concurrently.
+
+        Returns
+        ---------
+            category_paths (list):
+                The path of the file of each category (None for the categories with failed pages).
+        """
+        return run_coroutine(self.crawl_site(products_per_category, check_existence))
+
+    async def crawl_site(self, products_per_category, check_existence = True):
+        """
+        Coroutine that lists the products of every available category. Up to max_pages_in_flight pages are
+        retrieved at the same time (page_slots), and their requests share max_in_flight connections (semaphore).
+        The checkpoints are written by a single thread (writer), one page at a time.
+        """
+        semaphore = asyncio.Semaphore(self.max_in_flight)
+        page_slots = asyncio.Semaphore(self.max_pages_in_flight)
+        connector = aiohttp.TCPConnector(limit = self.max_in_flight)
+        with ThreadPoolExecutor(max_workers = 1) as writer:
+            async with aiohttp.ClientSession(connector = connector) as session:
+                fetcher = _Fetcher(session, self.throttle, semaphore, self.max_retries, self.cache, self.metrics, self.token)
+                category_tasks = [self.crawl_category(fetcher, writer, page_slots, category_id, check_existence, products_per_category)
+                                        for category_id in self.available_categories.keys()]
+                category_paths = await asyncio.gather(*category_tasks)
+        return category_paths
+
+    async def crawl_category(self, fetcher, writer, page_slots, category_id, check_existence = True, products_per_category = 5000):
+        """
+        Coroutine that lists all the products in a given category. Equivalent to iterate_through_category.
+        The shards of the category are planned in a thread, with the blocking requests of meliRetriever
+        (each thread with its own session), and its checkpoint is opened, written and finalized by writer.
+        """
+        loop = asyncio.get_running_loop()
+        if check_existence and self.storage.exists(category_id):
+            category_path = self.category_path(category_id)
+        else:
+            pages = await loop.run_in_executor(None, self.category_pages, category_id, products_per_category)
+            checkpoint = await loop.run_in_executor(writer, partial(self.storage.writer, category_id, resume = self.resume))
+            pending_pages = await loop.run_in_executor(writer, self.pending_pages, category_id, checkpoint, pages)
+            await asyncio.gather(*[self.crawl_page_with_retries(fetcher, writer, page_slots, checkpoint, category_id, page)
+                                        for page in pending_pages])
+            category_path = await loop.run_in_executor(writer, self.finish_category, category_id, checkpoint, pages)
+        return category_path
+
+    async def crawl_page_with_retries(self, fetcher, writer, page_slots, checkpoint, category_id, page):
+        """
+        Coroutine that retrieves a page, retrying it up to max_page_retries times, and writes it to the checkpoint
+        in the writer thread. The page holds one of the page_slots from its first request until it's written.
+        """
+        key, shard, offset = page
+        async with page_slots:
+            for attempt in range(self.max_page_retries + 1):
+                try:
+                    page_df = await self.crawl_page(fetcher, category_id, offset, shard)
+                except PageFetchError as e:
+                    error = e
+                else:
+                    await asyncio.get_running_loop().run_in_executor(writer, self.write_page, checkpoint, category_id, page, page_df)
+                    return
+            print(error)
+            await asyncio.get_running_loop().run_in_executor(writer, checkpoint.mark_failed, key, self.max_page_retries + 1, error)
+        self.metrics.record_failed_page()
+
+    async def crawl_page(self, fetcher, category_id, offset, shard = None):
+        """
+        Coroutine that retrieves a page of products and the questions of each one of them.
+        Equivalent to list_marketplace_products. The item_index is read in a thread.
+        """
+        try:
+            product_request = await fetcher.get_json(self.page_url(self.site_id, category_id, offset, shard = shard))
+            product_json = product_request['results']
+            if self.item_index is not None:
+                product_json = await asyncio.get_running_loop().run_in_executor(
+                    None, self.skip_duplicates, product_json, *self.index_page(self.site_id, category_id, offset, shard))
+            if self.multiget_batch_size:
+                product_json = await self.enrich_with_multiget_async(fetcher, product_json)
+            question_json = await asyncio.gather(*[fetcher.get_json(self.questions_url(product['id']))
+                                                        for product in product_json])
+            return self.build_page_df(product_json, question_json)
+        except Exception as e:
+            raise PageFetchError(f'Page {offset} of {shard_label(shard) or category_id} failed: {e!r}') from e
+
+    async def enrich_with_multiget_async(self, fetcher, product_json):
+        """
+        Coroutine that refreshes the item and seller details of a page. Equivalent to enrich_with_multiget.
+        """
+        product_ids = [product['id'] for product in product_json]
+        item_details = await self.retrieve_multiget_async(fetcher, 'items', product_ids)
+        seller_ids = self.seller_ids(product_json, item_details)
+        seller_details = await self.retrieve_multiget_async(fetcher, 'users', seller_ids)
+        return self.combine_multiget_details(product_json, item_details, seller_details)
+
+    async def retrieve_multiget_async(self, fetcher, resource, ids):
+        """
+        Coroutine that retrieves the details of several items or users. Equivalent to retrieve_multiget.
+        """
+        multiget_jsons = await asyncio.gather(*[fetcher.get_json(self.multiget_url(resource, batch))
+                                                    for batch in self.multiget_batches(ids)])
+        details = {}
+        for multiget_json in multiget_jsons:
+            details.update(self.parse_multiget(multiget_json))
+        return details
+
+
+class _Fetcher:
+    """
+    Sends throttled GET requests through a shared aiohttp session, recording them in the metrics of the retriever.
+    Equivalent to meliRetriever.get_json. The cache and the refresh of the token run in threads.
+    """
+
+    def __init__(self, session, throttle, semaphore, max_retries, cache = None, metrics = None, token = None):
+        self.session = session
+        self.token = token
+        self.throttle = throttle
+        self.semaphore = semaphore
+        self.max_retries = max_retries
+        self.cache = cache
+        self.metrics = metrics
+
+    async def get_json(self, url):
+        loop = asyncio.get_running_loop()
+        endpoint = request_endpoint(url)
+        if self.cache is not None:
+            cached_body = await loop.run_in_executor(None, self.cache.get, url)
+            if cached_body is not None:
+                if self.metrics is not None:
+                    self.metrics.record_cache_hit(endpoint)
+                return json.loads(cached_body)
+
+        async with self.semaphore:
+            for attempt in range(self.max_retries + 1):
+                waiting_since = time.perf_counter()
+                await self.throttle.acquire_async()
+                sent_at = time.perf_counter()
+                access_token = self.token
+                if isinstance(self.token, TokenManager):
+                    access_token = self.token.cached_token() or await loop.run_in_executor(None, self.token.access_token)
+                async with self.session.get(url, headers = {'Authorization': f'Bearer {access_token}'}) as response:
+                    retry = self.throttle.record(response.status, response.headers)
+                    body = await response.read()
+                if response.status == 401 and isinstance(self.token, TokenManager):
+                    await loop.run_in_executor(None, partial(self.token.refresh, expired_token = access_token))
+                    retry = True
+                if self.metrics is not None:
+                    self.metrics.record_sleep(sent_at - waiting_since)
+                    self.metrics.record_request(endpoint, time.perf_counter() - sent_at, response.status, len(body),
+                                                retry = retry and attempt < self.max_retries)
+                if not retry:
+                    break
+        if retry: # Rejected after max_retries retries
+            response.raise_for_status()
+        body = body.decode('utf-8')
+
+        if self.cache is not None and response.status == 200:
+            await loop.run_in_executor(None, self.cache.set, url, body)
+        return json.loads(body)
+
+
+def run_coroutine(coroutine):
+    """
+    Runs a coroutine until completion, even if an event loop is already running (e.g. inside Jupyter).
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+    with ThreadPoolExecutor(max_workers = 1) as executor:
+        return executor.submit(asyncio.run, coroutine).result()
@@ -0,0 +1,170 @@
+# Persistent cache of Mercado Libre API responses.
+# Responses are stored in a local SQLite file keyed by URL, so reruns and partial re-crawls
+# are served from disk instead of the network.
+
+import os
+import time
+import sqlite3
+import threading
+from .metrics import request_endpoint
+
+HOUR = 60*60
+DAY = 24*HOUR
+
+# Time to live of the responses of each endpoint (see metrics.request_endpoint).
+DEFAULT_TTLS = {
+    'sites': 7*DAY,
+    'site_categories': 7*DAY,
+    'categories': DAY,
+    'search': 6*HOUR,
+    'questions': DAY,
+    'items': 6*HOUR,
+    'users': DAY,
+}
+
+class ResponseCache:
+    """
+    An on-disk cache of API responses keyed by URL, with a time to live for each endpoint,
+    a size cap with least recently used (LRU) eviction and hit/miss counters.
+
+    Example:
+        >>> cache = ResponseCache('data/.responses.sqlite', max_size_mb = 1024)
+        >>> retriever = meliRetriever(site_name = 'Colombia', token = api_key, cache = cache)
+        >>> retriever.create_dataset()
+        >>> cache.stats()
+    """
+
+    def __init__(self, path = 'data/.responses.sqlite', ttls = None, max_size_mb = 512):
+        """
+        Params:
+        --------
+            path (string):
+                (Default data/.responses.sqlite) Location of the SQLite file.
+
+            ttls (dict):
+                (Default None) Seconds each endpoint ('sites', 'site_categories', 'categories', 'search', 'questions',
+                               'items', 'users') is kept. Endpoints not given use DEFAULT_TTLS.
+
+            max_size_mb (float):
+                (Default 512) Maximum size of the stored responses. When exceeded, the least recently used
+                              responses are deleted.
+        """
+        self.path = path
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self.max_size = max_size_mb*1024*1024
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self._connection = None
+        self._connection_pid = None
+        self.lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_connection'] = None
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    @property
+    def connection(self):
+        """
+        The SQLite connection of the current process.
+        """
+        if self._connection is None or self._connection_pid != os.getpid():
+            folder = os.path.dirname(self.path)
+            if folder:
+                os.makedirs(folder, exist_ok = True)
+            self._connection = sqlite3.connect(self.path, timeout = 60, check_same_thread = False)
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute("""CREATE TABLE IF NOT EXISTS responses (
+                                            url TEXT PRIMARY KEY,
+                                            body TEXT NOT NULL,
+                                            size INTEGER NOT NULL,
+                                            expires_at REAL NOT NULL,
+                                            last_access REAL NOT NULL)""")
+            self._connection.execute('CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)')
+            self._connection.commit()
+            self._connection_pid = os.getpid()
+        return self._connection
+
+    def get(self, url):
+        """
+        Returns the stored body of a URL, or None if it isn't stored or it expired.
+        """
+        now = time.time()
+        with self.lock:
+            row = self.connection.execute('SELECT body, expires_at FROM responses WHERE url = ?', (url,)).fetchone()
+            if row is None or row[1] < now:
+                self.misses += 1
+                return None
+            self.connection.execute('UPDATE responses SET last_access = ? WHERE url = ?', (now, url))
+            self.connection.commit()
+            self.hits += 1
+            return row[0]
+
+    def set(self, url, body):
+        """
+        Stores the body of a URL. Evicts the least recently used responses if the cache is full.
+        """
+        now = time.time()
+        expires_at = now + self.ttls[request_endpoint(url)]
+        with self.lock:
+            self.connection.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)',
+                                    (url, body, len(body), expires_at, now))
+            self.connection.commit()
+            self.stores += 1
+            if self.stores % 100 == 0:
+                self.__evict()
+
+    def __evict(self):
+        """
+        Deletes expired responses and, if the cache is still above its size cap, the least recently used ones.
+        """
+        connection = self.connection
+        deleted = connection.execute('DELETE FROM responses WHERE expires_at < ?', (time.time(),)).rowcount
+        size = connection.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        if size > self.max_size:
+            excess = size - 0.9*self.max_size # Leaves some room to avoid evicting on every insert
+            rows = connection.execute('SELECT url, size FROM responses ORDER BY last_access').fetchall()
+            to_delete = []
+            for url, row_size in rows:
+                if excess <= 0:
+                    break
+                to_delete.append((url,))
+                excess -= row_size
+            connection.executemany('DELETE FROM responses WHERE url = ?', to_delete)
+            deleted += len(to_delete)
+        connection.commit()
+        self.evictions += deleted
+
+    def stats(self):
+        """
+        Hits, misses, stored responses and evictions of this process.
+        """
+        requests = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits/requests if requests else 0.0,
+            'stores': self.stores,
+            'evictions': self.evictions
+        }
+
+    def merge(self, stats):
+        """
+        Adds the counters of a copy of this cache (e.g. in a worker process).
+        """
+        with self.lock:
+            self.hits += stats['hits']
+            self.misses += stats['misses']
+            self.stores += stats['stores']
+            self.evictions += stats['evictions']
+
+    def reset_stats(self):
+        with self.lock:
+            self.hits, self.misses, self.stores, self.evictions = 0, 0, 0, 0
@@ -0,0 +1,219 @@
+# Page level checkpoints for the extraction of a category.
+# Each page is appended to a partial CSV as soon as it arrives, and a journal records which offsets
+# are already on disk. An interrupted extraction resumes from the journal, requesting only the missing pages.
+
+import os
+import json
+import shutil
+
+def journal_order(record):
+    """
+    Sorts the records by offset. The keys of sharded pages are strings (see sharding.page_key), sorted after the offsets.
+    """
+    return (isinstance(record['offset'], str), record['offset'])
+
+
+def page_csv(page_df, columns, integer_columns = ()):
+    """
+    The rows of a page as ';'-separated lines, with the given columns in order. The integer columns are written as
+    nullable integers, so a page with a missing value doesn't write the rest of the column as floats (785.0).
+    """
+    import pandas as pd
+    page_df = page_df.reindex(columns = columns)
+    for column in integer_columns:
+        if column in page_df:
+            page_df[column] = pd.to_numeric(page_df[column]).astype('Int64')
+    return page_df.to_csv(sep = ';', index = False, header = False)
+
+
+class CrawlJournal:
+    """
+    An append-only journal of the pages of a category. Each line is a JSON record with the offset of
+    the page, its status ('done' or 'failed') and, for written pages, the bytes it occupies in the partial file.
+    """
+
+    def __init__(self, path):
+        """
+        Params:
+        --------
+            path (string):
+                Location of the journal file.
+        """
+        self.path = path
+        self.pages = {}
+        if os.path.exists(path):
+            self.load()
+
+    def load(self):
+        """
+        Reads the journal. A truncated last line (e.g. after a crash) is ignored.
+        """
+        with open(self.path, 'r') as journal_file:
+            for line in journal_file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                self.pages[record['offset']] = record
+
+    def append(self, record):
+        """
+        Adds a record to the journal and flushes it to disk.
+        """
+        self.pages[record['offset']] = record
+        with open(self.path, 'a') as journal_file:
+            journal_file.write(json.dumps(record) + '\n')
+            journal_file.flush()
+            os.fsync(journal_file.fileno())
+
+    def mark_done(self, offset, start, end):
+        self.append({'offset': offset, 'status': 'done', 'start': start, 'end': end})
+
+    def mark_failed(self, offset, attempts, error):
+        self.append({'offset': offset, 'status': 'failed', 'attempts': attempts, 'error': str(error)})
+
+    def done(self):
+        """
+        The records of the pages written to disk, sorted by offset (the keys of the shards of a category, after the offsets).
+        """
+        return sorted((record for record in self.pages.values() if record['status'] == 'done'), key = journal_order)
+
+    def failed(self):
+        """
+        The offsets of the pages that failed after all their retries.
+        """
+        return sorted((offset for offset, record in self.pages.items() if record['status'] == 'failed'),
+                      key = lambda offset: journal_order({'offset': offset}))
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.pages = {}
+
+
+class CategoryCheckpoint:
+    """
+    Writes the pages of a category to a partial CSV as they arrive, and assembles the final CSV,
+    sorted by offset, once every page is on disk.
+
+    Example:
+        >>> checkpoint = CategoryCheckpoint('data/MCO1000.csv', columns)
+        >>> for offset in checkpoint.pending(range(0, 1000, 50)):
+        ...     checkpoint.write_page(offset, page_df)
+        >>> checkpoint.finalize()
+    """
+
+    def __init__(self, path, columns, resume = True, integer_columns = ()):
+        """
+        Params:
+        --------
+            path (string):
+                Location of the final CSV of the category.
+
+            columns (list):
+                The columns of the CSV, in order. Every page is written with these columns.
+
+            resume (bool):
+                (Default True) If True, the pages recorded in the journal of a previous extraction are kept.
+                               If False, the previous partial file and journal are discarded.
+
+            integer_columns (list):
+                (Default ()) Columns written as integers even if some of their values are missing (see page_csv).
+        """
+        self.path = path
+        self.partial_path = f'{path}.partial'
+        self.columns = list(columns)
+        self.integer_columns = list(integer_columns)
+        self.journal = CrawlJournal(f'{path}.journal')
+        if not resume:
+            self.journal.remove()
+        self.__prepare_partial_file()
+
+    def __prepare_partial_file(self):
+        """
+        Creates the partial file with the header, or truncates it after the last page recorded in the journal,
+        discarding a page that was being written when the previous extraction stopped.
+        """
+        done = self.journal.done()
+        if done and os.path.exists(self.partial_path):
+            with open(self.partial_path, 'r+b') as partial_file:
+                partial_file.truncate(max(record['end'] for record in done))
+        else:
+            self.journal.remove()
+            header = ';'.join(self.columns) + '\n'
+            with open(self.partial_path, 'wb') as partial_file:
+                partial_file.write(header.encode('utf-8'))
+        with open(self.partial_path, 'rb') as partial_file:
+            self.header_size = len(partial_file.readline())
+
+    def pending(self, offsets):
+        """
+        The offsets that are not written to disk yet.
+        """
+        done = {record['offset'] for record in self.journal.done()}
+        return [offset for offset in offsets if offset not in done]
+
+    def write_page(self, offset, page_df):
+        """
+        Appends a page to the partial file and records it in the journal.
+        """
+        rows_csv = page_csv(page_df, self.columns, self.integer_columns)
+        with open(self.partial_path, 'ab') as partial_file:
+            start = partial_file.tell()
+            partial_file.write(rows_csv.encode('utf-8'))
+            partial_file.flush()
+            os.fsync(partial_file.fileno())
+            end = partial_file.tell()
+        self.journal.mark_done(offset, start, end)
+
+    def mark_failed(self, offset, attempts, error):
+        """
+        Records a page that failed after all its retries. It is requested again when the extraction is resumed.
+        """
+        self.journal.mark_failed(offset, attempts, error)
+
+    def is_complete(self, offsets):
+        return not self.pending(offsets)
+
+    def finalize(self, offsets = None):
+        """
+        Writes the final CSV with the pages sorted by offset, and removes the partial file and the journal.
+
+        Params:
+        --------
+            offsets (list):
+                (Default None) The offsets (or keys) of the pages of the category, in the order they are written.
+                               Pages of the journal that aren't included (e.g. planned by a previous extraction
+                               whose shards changed) are discarded. If None, every written page is kept.
+        """
+        done = self.journal.done()
+        if offsets is not None:
+            done_by_offset = {record['offset']: record for record in done}
+            done = [done_by_offset[offset] for offset in offsets if offset in done_by_offset]
+        temporary_path = f'{self.path}.tmp'
+        with open(self.partial_path, 'rb') as partial_file, open(temporary_path, 'wb') as final_file:
+            final_file.write(partial_file.read(self.header_size))
+            for record in done:
+                partial_file.seek(record['start'])
+                shutil.copyfileobj(_LimitedReader(partial_file, record['end'] - record['start']), final_file)
+        os.replace(temporary_path, self.path)
+        os.remove(self.partial_path)
+        self.journal.remove()
+
+
+class _LimitedReader:
+    """
+    A file wrapper that reads at most `size` bytes.
+    """
+
+    def __init__(self, file, size):
+        self.file = file
+        self.remaining = size
+
+    def read(self, size = -1):
+        if self.remaining <= 0:
+            return b''
+        size = self.remaining if size < 0 else min(size, self.remaining)
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
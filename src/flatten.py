@@ -0,0 +1,148 @@
+# Declarative flattening of the JSON responses of MELI's API.
+# Each column of a page is described by a dotted path into the product (or questions) response and an
+# optional transform. The paths are compiled once, and the column lists of the final DataFrame are
+# built directly from the products of a page, without intermediate frames or merges.
+
+def thumbnail_month(thumbnail):
+    """
+    The month of the last update of a product, taken from the date at the end of its thumbnail URL (_MMYYYY).
+    """
+    return thumbnail.split('_')[-1][:2] if thumbnail is not None else None
+
+def thumbnail_year(thumbnail):
+    return thumbnail.split('_')[-1][2:6] if thumbnail is not None else None
+
+def first_question_year(questions):
+    """
+    The year of the first question made about a product.
+    """
+    return questions[0]['date_created'].split('-')[0] if questions else None
+
+def first_question_month(questions):
+    return questions[0]['date_created'].split('-')[1] if questions else None
+
+def length(values):
+    return len(values) if values is not None else None
+
+def is_not_none(value):
+    return value is not None
+
+# Columns of a search result: (column, path, transform)
+PRODUCT_FIELDS = [
+    ('id', 'id'),
+    ('title', 'title'),
+    ('price', 'price'),
+    ('available_quantity', 'available_quantity'),
+    ('sold_quantity', 'sold_quantity'),
+    ('buying_mode', 'buying_mode'),
+    ('listing_type_id', 'listing_type_id'),
+    ('condition', 'condition'),
+    ('accepts_mercadopago', 'accepts_mercadopago'),
+    ('original_price', 'original_price'),
+    ('category_id', 'category_id'),
+    ('seller_level_id', 'seller.seller_reputation.level_id'),
+    ('seller_powerseller', 'seller.seller_reputation.power_seller_status'),
+    ('positive_rating', 'seller.seller_reputation.transactions.ratings.positive'),
+    ('negative_rating', 'seller.seller_reputation.transactions.ratings.negative'),
+    ('neutral_rating', 'seller.seller_reputation.transactions.ratings.neutral'),
+    ('free_shipping', 'shipping.free_shipping'),
+    ('store_pickup', 'shipping.store_pick_up'),
+    ('number_of_tags', 'tags', length),
+    ('is_official_store', 'official_store_id', is_not_none),
+    ('month_update', 'thumbnail', thumbnail_month),
+    ('year_update', 'thumbnail', thumbnail_year),
+]
+
+# Columns of a /questions/search response.
+QUESTION_FIELDS = [
+    ('year_created', 'questions', first_question_year),
+    ('month_created', 'questions', first_question_month),
+    ('total_questions', 'total'),
+]
+
+def compile_path(path):
+    """
+    Builds a function that returns the value at a dotted path of a record, or None if
+    any of the keys is missing.
+    """
+    keys = path.split('.')
+    if len(keys) == 1:
+        key = keys[0]
+        return lambda record: record.get(key)
+
+    def getter(record):
+        value = record
+        for key in keys:
+            if not isinstance(value, dict):
+                return None
+            value = value.get(key)
+        return value
+    return getter
+
+
+class PageFlattener:
+    """
+    Flattens the products of a search page (and their questions) into a DataFrame, without merges.
+
+    Example:
+        >>> flattener = PageFlattener()
+        >>> page_df = flattener.frame(search_json['results'], question_json)
+    """
+
+    def __init__(self, product_fields = PRODUCT_FIELDS, question_fields = QUESTION_FIELDS):
+        """
+        Params:
+        --------
+            product_fields (list):
+                (Default PRODUCT_FIELDS) Tuples (column, path, transform) read from each product.
+                The transform is optional and receives the value at the path (None if it's missing).
+
+            question_fields (list):
+                (Default QUESTION_FIELDS) Tuples (column, path, transform) read from the questions response of each product.
+        """
+        self.fields = (list(product_fields), list(question_fields))
+        self.product_fields = [self.__compile(field) for field in product_fields]
+        self.question_fields = [self.__compile(field) for field in question_fields]
+        self.columns = [column for column, _ in self.product_fields + self.question_fields]
+
+    def __getstate__(self):
+        return {'fields': self.fields} # The compiled getters can't be pickled, they are built again
+
+    def __setstate__(self, state):
+        self.__init__(*state['fields'])
+
+    def __compile(self, field):
+        column, path, *transform = field
+        getter = compile_path(path)
+        if transform:
+            transform = transform[0]
+            return column, lambda record: transform(getter(record))
+        return column, getter
+
+    def flatten(self, records, fields):
+        """
+        The values of each field for every record, as a dictionary of lists.
+        """
+        return {column: [getter(record) for record in records] for column, getter in fields}
+
+    def frame(self, product_json, question_json = None):
+        """
+        Params
+        --------
+            product_json (list):
+                The 'results' of a search response.
+
+            question_json (list):
+                (Default None) The questions responses of each product, in the same order as product_json.
+                If None, the question columns are left empty.
+
+        Returns
+        ---------
+            page_df (pandas.DataFrame):
+                A DataFrame with one row for each product of the page.
+        """
+        columns = self.flatten(product_json, self.product_fields)
+        if question_json is not None:
+            columns.update(self.flatten(question_json, self.question_fields))
+        import pandas as pd
+        return pd.DataFrame(columns, columns = self.columns)
@@ -0,0 +1,134 @@
+# Index of the products written by an extraction, shared by all its workers.
+# The same product can be listed by several categories, shards and pages, and each occurrence costs the request
+# of its questions (and its share of the multiget batches). The ids are stored in a local SQLite file with the page
+# that wrote them, in the same step as the page is written to its checkpoint. Pages skip the enrichment of the ids
+# written by other pages and drop them before writing, so the output has each id once. The ids of a page are only
+# kept while the page is on disk: when a category is (re)started, the ids of its pages missing from its checkpoint
+# are released, so no product is skipped because of a page that failed or was never written.
+
+import os
+import sqlite3
+import threading
+
+class ItemIndex:
+    """
+    A persistent set of the product ids written by the pages of a dataset.
+
+    Example:
+        >>> index = ItemIndex('data/.items.sqlite')
+        >>> retriever = meliRetriever(site_name = 'Colombia', token = api_key, item_index = index)
+        >>> retriever.create_dataset()
+        >>> retriever.metrics.stats()['duplicates'] # Products skipped because another page wrote them
+    """
+
+    def __init__(self, path = 'data/.items.sqlite'):
+        """
+        Params:
+        --------
+            path (string):
+                (Default data/.items.sqlite) Location of the SQLite file. It belongs to the dataset of a folder: use
+                                             one index for each dataset, and remove it (or call clear) when the
+                                             dataset is removed.
+        """
+        self.path = path
+        self._connection = None
+        self._connection_pid = None
+        self.lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_connection'] = None
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    @property
+    def connection(self):
+        """
+        The SQLite connection of the current process.
+        """
+        if self._connection is None or self._connection_pid != os.getpid():
+            folder = os.path.dirname(self.path)
+            if folder:
+                os.makedirs(folder, exist_ok = True)
+            self._connection = sqlite3.connect(self.path, timeout = 60, check_same_thread = False)
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute("""CREATE TABLE IF NOT EXISTS written_items (
+                                            id TEXT PRIMARY KEY,
+                                            category TEXT NOT NULL,
+                                            page TEXT NOT NULL) WITHOUT ROWID""")
+            self._connection.execute('CREATE INDEX IF NOT EXISTS written_items_category ON written_items (category, page)')
+            self._connection.commit()
+            self._connection_pid = os.getpid()
+        return self._connection
+
+    def written(self, ids, category, page):
+        """
+        The ids written by other pages. Only reads the index: the ids of the page are recorded by commit.
+
+        Params:
+        --------
+            ids (list):
+                The ids of the products of the page.
+
+            category (string):
+                The category of the page (e.g. MCO/MCO1000).
+
+            page (string):
+                The key of the page in the checkpoint of its category.
+        """
+        ids = list(dict.fromkeys(ids))
+        if not ids:
+            return set()
+        with self.lock:
+            rows = self.connection.execute(f"SELECT id, category, page FROM written_items WHERE id IN ({', '.join('?'*len(ids))})", ids).fetchall()
+        return {row[0] for row in rows if (row[1], row[2]) != (category, str(page))}
+
+    def commit(self, ids, category, page):
+        """
+        Records the ids of a page that is being written. The ids already written by the same page (e.g. when it's
+        written again after a crash) stay with it.
+
+        Returns
+        ---------
+            duplicates (set):
+                The ids written by other pages, which must be dropped from the page.
+        """
+        ids = list(dict.fromkeys(ids))
+        if not ids:
+            return set()
+        with self.lock:
+            connection = self.connection
+            connection.executemany('INSERT OR IGNORE INTO written_items VALUES (?, ?, ?)', [(product_id, category, str(page)) for product_id in ids])
+            rows = connection.execute(f"SELECT id, category, page FROM written_items WHERE id IN ({', '.join('?'*len(ids))})", ids).fetchall()
+            connection.commit()
+        return {row[0] for row in rows if (row[1], row[2]) != (category, str(page))}
+
+    def release(self, category, keep_pages = ()):
+        """
+        Forgets the ids of the pages of a category, except the ones of keep_pages (the pages on disk).
+        """
+        keep_pages = [str(page) for page in keep_pages]
+        with self.lock:
+            self.connection.execute(f"DELETE FROM written_items WHERE category = ? AND page NOT IN ({', '.join('?'*len(keep_pages))})",
+                                    [category] + keep_pages)
+            self.connection.commit()
+
+    def __len__(self):
+        with self.lock:
+            return self.connection.execute('SELECT COUNT(*) FROM written_items').fetchone()[0]
+
+    def __contains__(self, product_id):
+        with self.lock:
+            return self.connection.execute('SELECT 1 FROM written_items WHERE id = ?', (product_id,)).fetchone() is not None
+
+    def clear(self):
+        """
+        Forgets all the ids, so the next extraction retrieves every product again.
+        """
+        with self.lock:
+            self.connection.execute('DELETE FROM written_items')
+            self.connection.commit()
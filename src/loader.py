@@ -0,0 +1,246 @@
+# Memory-compact loading of the extracted products.
+# pandas.read_csv gives an object column for each string (even the ones with a handful of values, like condition)
+# and 64 bit numbers for small integers, and pd.concat keeps the frames of all the files and their copy at once.
+# DatasetLoader reads the files in parallel with a declared schema (categories, downcast numbers and nullable
+# booleans) and fills preallocated columns with them, releasing each file's values as soon as they are copied.
+
+import os
+import re
+import warnings
+import numpy as np
+
+# Types of the columns of the CSVs (see storage.OUTPUT_COLUMNS). Integers and booleans are nullable.
+DATASET_DTYPES = {
+    'id': 'str',
+    'title': 'str',
+    'price': 'float64',
+    'available_quantity': 'Int32',
+    'sold_quantity': 'Int32',
+    'buying_mode': 'category',
+    'listing_type_id': 'category',
+    'condition': 'category',
+    'accepts_mercadopago': 'boolean',
+    'original_price': 'float64',
+    'category_id': 'category',
+    'seller_level_id': 'category',
+    'seller_powerseller': 'category',
+    'positive_rating': 'float32',
+    'negative_rating': 'float32',
+    'neutral_rating': 'float32',
+    'free_shipping': 'boolean',
+    'store_pickup': 'boolean',
+    'number_of_tags': 'Int8',
+    'is_official_store': 'boolean',
+    'month_update': 'Int8',
+    'year_update': 'Int16',
+    'year_created': 'Int16',
+    'month_created': 'Int8',
+    'total_questions': 'Int32',
+    'category_name': 'category'
+}
+
+BOOLEAN_VALUES = {'True': True, 'False': False, 'true': True, 'false': False}
+
+# Name of the file of a category (e.g. MCO1000.csv). Other CSVs (e.g. the merged export of create_dataset) are skipped.
+CATEGORY_FILE = re.compile(r'^[A-Z]{3}\d+\.csv$')
+
+def read_dtype(dtype):
+    """
+    The dtype given to pandas.read_csv for a column of DATASET_DTYPES. Numbers and booleans are inferred,
+    since a malformed value would stop the read (they are converted by typed_values).
+    """
+    return dtype if dtype in ('str', 'category') else None
+
+def typed_values(values, dtype, name = None):
+    """
+    Converts a column read by pandas.read_csv (see read_dtype) to a dtype of DATASET_DTYPES. Values that can't be
+    converted (e.g. a malformed thumbnail date) are nulls. Numbers that aren't integers, or that don't fit in the
+    integer type, are nulls too, with a warning.
+
+    Params
+    --------
+        values (pandas.Series):
+            The column of a file.
+
+        dtype (string):
+            'str', 'category', 'boolean', a nullable integer ('Int8', 'Int16', 'Int32', 'Int64') or a float.
+
+        name (string):
+            (Default None) Name of the column (or file and column), used in the warnings.
+
+    Returns
+    --------
+        values (array or tuple):
+            The array of the column. Nullable columns are a tuple (data, mask), and categories a pandas.Categorical.
+    """
+    import pandas as pd
+    if dtype == 'str':
+        return values.array
+    if dtype == 'category':
+        return pd.Categorical(values)
+    if dtype == 'boolean':
+        if pd.api.types.is_bool_dtype(values.dtype) and not pd.api.types.is_extension_array_dtype(values.dtype):
+            return values.to_numpy(), np.zeros(len(values), dtype = bool)
+        booleans = values.astype(object).map(BOOLEAN_VALUES)
+        return booleans.fillna(False).to_numpy(dtype = bool), booleans.isna().to_numpy()
+    if pd.api.types.is_numeric_dtype(values.dtype):
+        numbers = values.to_numpy(dtype = float, na_value = np.nan)
+    else:
+        numbers = pd.to_numeric(values, errors = 'coerce').to_numpy(dtype = float)
+    if dtype.startswith('Int'):
+        limits = np.iinfo(dtype.lower())
+        invalid = ~np.isnan(numbers) & ((numbers < limits.min) | (numbers > limits.max) | (numbers != np.round(numbers)))
+        if invalid.any():
+            warnings.warn(f'{invalid.sum()} values of {name or "a column"} are not integers of {dtype} '
+                          f'(e.g. {numbers[invalid][0]}) and were loaded as nulls')
+        mask = np.isnan(numbers) | invalid
+        return np.where(mask, 0, numbers).astype(dtype.lower()), mask
+    return numbers.astype(dtype)
+
+def memory_report(before_df, after_df):
+    """
+    The memory of each column of a dataset loaded in two ways (e.g. with pandas.read_csv and with DatasetLoader).
+
+    Returns
+    --------
+        report_df (pandas.DataFrame):
+            The dtype and the megabytes of each column before and after, and their ratio, with a Total row.
+    """
+    import pandas as pd
+    columns = [column for column in before_df.columns if column in after_df.columns]
+    before_mb = before_df[columns].memory_usage(deep = True, index = False)/1024/1024
+    after_mb = after_df[columns].memory_usage(deep = True, index = False)/1024/1024
+    report_df = pd.DataFrame({'dtype_before': before_df[columns].dtypes.astype(str), 'dtype_after': after_df[columns].dtypes.astype(str),
+                              'mb_before': before_mb, 'mb_after': after_mb})
+    report_df.loc['Total'] = ['', '', before_mb.sum(), after_mb.sum()]
+    report_df['ratio'] = report_df['mb_before']/report_df['mb_after']
+    return report_df
+
+
+class DatasetLoader:
+    """
+    Loads the CSVs of the extracted products with compact types.
+
+    Example:
+        >>> loader = DatasetLoader('data')
+        >>> products_df = loader.load(columns = ['category_name', 'listing_type_id', 'sold_quantity'])
+        >>> memory_report(pd.read_csv('data/MCO1000.csv', sep = ';'), loader.load(['MCO1000']))
+    """
+
+    def __init__(self, folder = 'data', dtypes = DATASET_DTYPES, n_jobs = -1):
+        """
+        Params:
+        --------
+            folder (string):
+                (Default data) Folder with the CSV of each category (as written by meliRetriever), or with a
+                               subfolder of CSVs for each site (as written by meliOrchestrator).
+
+            dtypes (dict):
+                (Default DATASET_DTYPES) Type of each column (see typed_values). Columns that aren't included
+                                         are read as strings.
+
+            n_jobs (int):
+                (Default -1) Number of threads reading files at the same time. If -1 uses all available.
+        """
+        self.folder = folder
+        self.dtypes = dict(dtypes)
+        self.n_jobs = n_jobs
+
+    def files(self, category_ids = None, sites = None):
+        """
+        The CSV files of the categories of the dataset (see CATEGORY_FILE): the ones in folder and in its site subfolders.
+
+        Params
+        --------
+            category_ids (list):
+                (Default None) The categories to load. If None, loads all of them.
+
+            sites (list):
+                (Default None) The site subfolders to load. If None, loads all of them (and the files in folder).
+        """
+        folders = [os.path.join(self.folder, site) for site in sites] if sites is not None else [self.folder] + sorted(
+            os.path.join(self.folder, entry) for entry in os.listdir(self.folder)
+                if not entry.startswith('.') and os.path.isdir(os.path.join(self.folder, entry)))
+        files = []
+        for folder in folders:
+            files.extend(os.path.join(folder, file) for file in sorted(os.listdir(folder))
+                            if CATEGORY_FILE.match(file) and (category_ids is None or file[:-len('.csv')] in category_ids))
+        return files
+
+    def read_file(self, path, columns = None):
+        """
+        Reads a CSV and converts its columns (see read_dtype and typed_values).
+
+        Returns
+        --------
+            file_columns (dict):
+                The typed values of each column, and the number of rows of the file ('rows').
+        """
+        import pandas as pd
+        read_dtypes = {column: read_dtype(dtype) for column, dtype in self.dtypes.items() if read_dtype(dtype) is not None}
+        file_df = pd.read_csv(path, sep = ';', dtype = read_dtypes, usecols = columns)
+        file_columns = {column: typed_values(file_df[column], self.dtypes.get(column, 'str'), f'{column} in {path}')
+                            for column in file_df.columns}
+        file_columns['rows'] = len(file_df)
+        return file_columns
+
+    def load(self, category_ids = None, columns = None, sites = None):
+        """
+        Loads the products of the dataset in a single DataFrame, without concatenating the frames of each file.
+
+        Params
+        --------
+            category_ids (list):
+                (Default None) The categories to load. If None, loads all of them.
+
+            columns (list):
+                (Default None) The columns to load. If None, loads all of them.
+
+            sites (list):
+                (Default None) The site subfolders to load. If None, loads all of them.
+
+        Returns
+        ---------
+            products_df (pandas.DataFrame):
+                The selected products and columns, with the types of dtypes.
+        """
+        import pandas as pd
+        from joblib import Parallel, delayed
+        files = self.files(category_ids, sites)
+        if not files:
+            return pd.DataFrame(columns = columns)
+        file_columns = Parallel(n_jobs = self.n_jobs, prefer = 'threads')(delayed(self.read_file)(path, columns) for path in files)
+        rows = [file_values.pop('rows') for file_values in file_columns]
+        column_names = [column for column in file_columns[0]] if columns is None else list(columns)
+        products = {}
+        for column in column_names: # The values of each file are released once they are copied
+            products[column] = self.assemble([file_values.pop(column) for file_values in file_columns], rows,
+                                             self.dtypes.get(column, 'str'))
+        return pd.DataFrame(products, columns = column_names)
+
+    def assemble(self, pieces, rows, dtype):
+        """
+        Copies the values of a column in each file (see typed_values) to a single preallocated array.
+        Strings are concatenated instead, since their buffers (Arrow or Python objects) can't be preallocated.
+        """
+        import pandas as pd
+        if dtype == 'str':
+            return pd.concat([pd.Series(piece) for piece in pieces], ignore_index = True).array
+        total, starts = sum(rows), np.cumsum([0] + rows)
+        if dtype == 'category':
+            categories = pd.Index(sorted(set().union(*[piece.categories for piece in pieces])))
+            codes = np.empty(total, dtype = np.int8 if len(categories) < 2**7 else np.int16 if len(categories) < 2**15 else np.int32)
+            for start, piece in zip(starts, pieces): # The code of the nulls (-1) selects the last position, also -1
+                codes[start:start + len(piece)] = np.append(categories.get_indexer(piece.categories), -1)[piece.codes]
+            return pd.Categorical.from_codes(codes, categories)
+        if dtype == 'boolean' or dtype.startswith('Int'):
+            data = np.empty(total, dtype = bool if dtype == 'boolean' else dtype.lower())
+            mask = np.empty(total, dtype = bool)
+            for start, (piece_data, piece_mask) in zip(starts, pieces):
+                data[start:start + len(piece_data)] = piece_data
+                mask[start:start + len(piece_mask)] = piece_mask
+            return pd.arrays.BooleanArray(data, mask) if dtype == 'boolean' else pd.arrays.IntegerArray(data, mask)
+        values = np.empty(total, dtype = dtype)
+        for start, piece in zip(starts, pieces):
+            values[start:start + len(piece)] = piece
+        return values
@@ -0,0 +1,298 @@
+# Instrumentation of the extraction.
+# Every request of meliRetriever is recorded by endpoint: count, latency histogram, retries, errors and bytes
+# received, plus the time spent waiting for the throttle versus waiting on the network and the products written.
+# The metrics can be exported as JSON or in the Prometheus text format, and summarized while the extraction runs.
+
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+# Upper bounds (seconds) of the buckets of the latency histograms.
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+
+def request_endpoint(url):
+    """
+    The endpoint of a URL of MELI's API (search, categories, questions, items, users, site_categories or sites).
+    """
+    path = urlparse(url).path
+    if path.startswith('/questions'):
+        return 'questions'
+    if path.endswith('/search'):
+        return 'search'
+    if path.startswith('/categories'):
+        return 'categories'
+    if path.startswith('/items'):
+        return 'items'
+    if path.startswith('/users'):
+        return 'users'
+    if path.endswith('/categories'):
+        return 'site_categories'
+    return 'sites'
+
+
+class CrawlMetrics:
+    """
+    Counters and latency histograms of the requests of an extraction.
+
+    Example:
+        >>> metrics = CrawlMetrics()
+        >>> metrics.record_request('search', seconds = 0.12, status_code = 200, size = 35000)
+        >>> metrics.summary()
+        >>> metrics.export('data/metrics.prom') # Prometheus text format, JSON for any other extension
+    """
+
+    def __init__(self, buckets = LATENCY_BUCKETS):
+        """
+        Params:
+        --------
+            buckets (list):
+                (Default LATENCY_BUCKETS) Upper bounds, in seconds, of the buckets of the latency histograms.
+        """
+        self.buckets = list(buckets)
+        self.lock = threading.Lock()
+        self.reset_stats()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def reset_stats(self):
+        """
+        Restarts all the counters, and the clock used to compute the products per second.
+        """
+        self.started = time.monotonic()
+        self.endpoints = {}
+        self.sleep_seconds = 0.0
+        self.pages = 0
+        self.failed_pages = 0
+        self.items = 0
+        self.duplicates = 0
+        self.saved_requests = 0
+
+    def endpoint_stats(self, endpoint):
+        if endpoint not in self.endpoints:
+            self.endpoints[endpoint] = {'requests': 0, 'retries': 0, 'errors': 0, 'bytes': 0, 'cache_hits': 0,
+                                        'seconds': 0.0, 'buckets': [0]*(len(self.buckets) + 1)}
+        return self.endpoints[endpoint]
+
+    def record_request(self, endpoint, seconds, status_code, size, retry = False):
+        """
+        Records a response of the API.
+
+        Params
+        --------
+            endpoint (string):
+                The endpoint of the request (see request_endpoint).
+
+            seconds (float):
+                Time from sending the request to receiving the whole body.
+
+            status_code (int):
+                The HTTP status code of the response. Codes >= 400 are counted as errors.
+
+            size (int):
+                Bytes of the body.
+
+            retry (bool):
+                (Default False) True if the request is going to be sent again.
+        """
+        with self.lock:
+            endpoint_stats = self.endpoint_stats(endpoint)
+            endpoint_stats['requests'] += 1
+            endpoint_stats['retries'] += int(retry)
+            endpoint_stats['errors'] += int(status_code >= 400)
+            endpoint_stats['bytes'] += size
+            endpoint_stats['seconds'] += seconds
+            bucket = next((position for position, bound in enumerate(self.buckets) if seconds <= bound), len(self.buckets))
+            endpoint_stats['buckets'][bucket] += 1
+
+    def record_cache_hit(self, endpoint):
+        with self.lock:
+            self.endpoint_stats(endpoint)['cache_hits'] += 1
+
+    def record_sleep(self, seconds):
+        """
+        Records the time spent waiting for the throttle before a request.
+        """
+        with self.lock:
+            self.sleep_seconds += seconds
+
+    def record_page(self, items):
+        with self.lock:
+            self.pages += 1
+            self.items += items
+
+    def record_duplicates(self, products, saved_requests = 0):
+        """
+        Records the products of a page skipped because another page wrote them (see item_index.ItemIndex), and the
+        questions requests saved by the ones skipped before their details were requested.
+        """
+        with self.lock:
+            self.duplicates += products
+            self.saved_requests += saved_requests
+
+    def record_failed_page(self):
+        with self.lock:
+            self.failed_pages += 1
+
+    def stats(self):
+        """
+        All the counters, as a dictionary that can be serialized to JSON.
+        """
+        with self.lock:
+            elapsed = time.monotonic() - self.started
+            return {
+                'elapsed_seconds': elapsed,
+                'sleep_seconds': self.sleep_seconds,
+                'network_seconds': sum(endpoint_stats['seconds'] for endpoint_stats in self.endpoints.values()),
+                'pages': self.pages,
+                'failed_pages': self.failed_pages,
+                'items': self.items,
+                'duplicates': self.duplicates,
+                'saved_requests': self.saved_requests,
+                'items_per_second': self.items/elapsed if elapsed > 0 else 0.0,
+                'buckets': self.buckets,
+                'endpoints': {endpoint: {**endpoint_stats, 'buckets': list(endpoint_stats['buckets'])}
+                                    for endpoint, endpoint_stats in self.endpoints.items()}
+            }
+
+    def merge(self, stats):
+        """
+        Adds the counters of a copy of these metrics (e.g. in a worker process).
+        """
+        with self.lock:
+            self.sleep_seconds += stats['sleep_seconds']
+            self.pages += stats['pages']
+            self.failed_pages += stats['failed_pages']
+            self.items += stats['items']
+            self.duplicates += stats['duplicates']
+            self.saved_requests += stats['saved_requests']
+            for endpoint, worker_stats in stats['endpoints'].items():
+                endpoint_stats = self.endpoint_stats(endpoint)
+                for counter in ['requests', 'retries', 'errors', 'bytes', 'cache_hits', 'seconds']:
+                    endpoint_stats[counter] += worker_stats[counter]
+                endpoint_stats['buckets'] = [count + worker_count for count, worker_count in zip(endpoint_stats['buckets'], worker_stats['buckets'])]
+
+    def quantile(self, endpoint, q):
+        """
+        Upper bound of the histogram bucket that contains the q quantile of the latency of an endpoint.
+        """
+        counts = self.endpoints[endpoint]['buckets']
+        target, cumulative = q*sum(counts), 0
+        for bound, count in zip(self.buckets + [float('inf')], counts):
+            cumulative += count
+            if count and cumulative >= target:
+                return bound
+        return float('inf')
+
+    def summary(self):
+        """
+        A short description of the progress: products per second, requests and latency of each endpoint,
+        and time sleeping in the throttle versus waiting on the network.
+        """
+        stats = self.stats()
+        lines = [f"{stats['items']} products in {stats['pages']} pages ({stats['items_per_second']:.1f}/s), "
+                 f"{stats['failed_pages']} failed pages, sleeping {stats['sleep_seconds']:.1f} s, "
+                 f"on the network {stats['network_seconds']:.1f} s"]
+        if stats['duplicates']:
+            lines.append(f"    {stats['duplicates']} duplicate products skipped ({stats['saved_requests']} questions requests saved)")
+        for endpoint, endpoint_stats in sorted(stats['endpoints'].items()):
+            requests = endpoint_stats['requests']
+            mean = endpoint_stats['seconds']/requests*1000 if requests else 0.0
+            p99 = self.quantile(endpoint, 0.99)*1000 if requests else 0.0
+            lines.append(f"    {endpoint:<16}{requests:>8} requests {endpoint_stats['cache_hits']:>8} cached "
+                         f"{endpoint_stats['retries']:>6} retries {endpoint_stats['bytes']/1024/1024:>8.1f} MB "
+                         f"mean {mean:>7.1f} ms p99 <= {p99:.0f} ms")
+        return '\n'.join(lines)
+
+    def prometheus_text(self):
+        """
+        The metrics in the Prometheus text exposition format.
+        """
+        stats = self.stats()
+        lines = []
+        def add(name, kind, description, samples):
+            lines.extend([f'# HELP {name} {description}', f'# TYPE {name} {kind}'])
+            lines.extend(f'{name}{labels} {value}' for labels, value in samples)
+
+        endpoints = sorted(stats['endpoints'].items())
+        for counter, name, description in [('requests', 'meli_requests_total', 'Responses received from the API.'),
+                                           ('retries', 'meli_request_retries_total', 'Requests rejected by the API and sent again.'),
+                                           ('errors', 'meli_request_errors_total', 'Responses with status code >= 400.'),
+                                           ('bytes', 'meli_response_bytes_total', 'Bytes of the bodies received.'),
+                                           ('cache_hits', 'meli_cache_hits_total', 'Requests served by the response cache.')]:
+            add(name, 'counter', description, [(f'{{endpoint="{endpoint}"}}', endpoint_stats[counter]) for endpoint, endpoint_stats in endpoints])
+
+        histogram = []
+        for endpoint, endpoint_stats in endpoints:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ['+Inf'], endpoint_stats['buckets']):
+                cumulative += count
+                histogram.append((f'_bucket{{endpoint="{endpoint}",le="{bound}"}}', cumulative))
+            histogram.append((f'_sum{{endpoint="{endpoint}"}}', endpoint_stats['seconds']))
+            histogram.append((f'_count{{endpoint="{endpoint}"}}', endpoint_stats['requests']))
+        lines.extend(['# HELP meli_request_duration_seconds Latency of the requests, until the whole body is received.',
+                      '# TYPE meli_request_duration_seconds histogram'])
+        lines.extend(f'meli_request_duration_seconds{labels} {value}' for labels, value in histogram)
+
+        add('meli_throttle_sleep_seconds_total', 'counter', 'Time waiting for the throttle.', [('', stats['sleep_seconds'])])
+        add('meli_network_seconds_total', 'counter', 'Time waiting for the responses of the API.', [('', stats['network_seconds'])])
+        add('meli_pages_total', 'counter', 'Pages written.', [('', stats['pages'])])
+        add('meli_failed_pages_total', 'counter', 'Pages that failed after all their retries.', [('', stats['failed_pages'])])
+        add('meli_items_total', 'counter', 'Products written.', [('', stats['items'])])
+        add('meli_duplicate_items_total', 'counter', 'Products skipped because another page wrote them.', [('', stats['duplicates'])])
+        add('meli_saved_requests_total', 'counter', 'Questions requests saved by skipping duplicate products.', [('', stats['saved_requests'])])
+        add('meli_items_per_second', 'gauge', 'Products written per second since the extraction started.', [('', stats['items_per_second'])])
+        return '\n'.join(lines) + '\n'
+
+    def export(self, path):
+        """
+        Writes the metrics to path, in the Prometheus text format if it ends with .prom, or as JSON otherwise.
+        """
+        content = self.prometheus_text() if path.endswith('.prom') else json.dumps(self.stats(), indent = 2)
+        with open(f'{path}.tmp', 'w') as metrics_file:
+            metrics_file.write(content)
+        os.replace(f'{path}.tmp', path)
+
+    @contextmanager
+    def reporting(self, path = None, interval = 60):
+        """
+        While the context is active, prints the summary and exports the metrics to path every interval seconds.
+        Both are done once more when the context ends.
+
+        Params
+        --------
+            path (string):
+                (Default None) File of the metrics (see export). If None, the metrics aren't exported.
+
+            interval (float):
+                (Default 60) Seconds between reports. If None, only the final report is made.
+        """
+        stop = threading.Event()
+        def report():
+            if path is not None:
+                self.export(path)
+            print(self.summary())
+
+        def report_periodically():
+            while not stop.wait(interval):
+                report()
+
+        reporter = threading.Thread(target = report_periodically, daemon = True)
+        if interval is not None:
+            reporter.start()
+        try:
+            yield self
+        finally:
+            stop.set()
+            if reporter.is_alive():
+                reporter.join()
+            report()
@@ -0,0 +1,75 @@
+# Extraction of several MercadoLibre sites with one token and one pool of worker processes.
+
+import os
+from .retrieve import meliRetriever
+from .scheduler import PageScheduler
+
+class meliOrchestrator:
+    """
+    Crawls several countries at once. A meliRetriever is created for each site, and the pages of all their
+    categories are scheduled on a single bounded pool (see scheduler.PageScheduler), from the largest categories,
+    instead of running one pool for each country. The products of each site are stored in folder/{site_id}.
+
+    Example:
+        >>> orchestrator = meliOrchestrator(['Colombia', 'Argentina', 'Mexico'], token = api_key, n_jobs = 16)
+        >>> category_paths = orchestrator.create_datasets(products_per_category = 10000)
+        >>> orchestrator.retrievers['MLA'].storage.load(category_paths['MLA'])
+    """
+
+    def __init__(self, site_names, token, folder = 'data', n_jobs = -1, storage = None, max_in_flight = None, verbose = True, **kwargs):
+        """
+        Params:
+        --------
+            site_names (list):
+                The names of the sites to extract (https://api.mercadolibre.com/sites#json).
+
+            token (string):
+                MELI's API Token. All the sites share its throttle.
+
+            folder (string):
+                (Default data) Folder where the data is going to be stored, in a subfolder for each site.
+
+            n_jobs (int):
+                (Default -1) Number of worker processes shared by all the sites. If -1 uses all available.
+
+            storage (storage.CSVStorage or storage.ParquetStorage):
+                (Default None) Storage of all the sites. If None, a CSVStorage in folder/{site_id} for each site.
+                               A ParquetStorage partitions the products by site on its own.
+
+            max_in_flight (int):
+                (Default None) Maximum number of pages sent to the pool at once. If None, twice n_jobs.
+
+            verbose (bool):
+                (Default True) Shows the progress of the pages.
+
+            **kwargs:
+                Other parameters of meliRetriever (e.g. requests_per_second, api_url, cache).
+        """
+        self.retrievers = {}
+        for site_name in site_names:
+            retriever = meliRetriever(site_name, token, folder = folder, parallel = False, storage = storage, **kwargs)
+            if storage is None: # The default CSVStorage of the retriever is created in its folder
+                retriever.folder = os.path.join(folder, retriever.site_id)
+            self.retrievers[retriever.site_id] = retriever
+        self.scheduler = PageScheduler(self.retrievers, n_jobs = n_jobs, max_in_flight = max_in_flight, verbose = verbose)
+
+    def create_datasets(self, products_per_category = 5000, check_existence = True):
+        """
+        Extracts every available category of every site.
+
+        Params
+        --------
+            products_per_category (int):
+                (Default 5000) Maximum number of products requested for each category.
+
+            check_existence (bool):
+                (Default True) Skips the categories already stored.
+
+        Returns
+        ---------
+            category_paths (dict):
+                For each site_id, the path of the file of each category (None for the categories with failed pages).
+        """
+        for retriever in self.retrievers.values():
+            retriever.reset_stats()
+        return self.scheduler.run(products_per_category, check_existence)
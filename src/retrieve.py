@@ -2,17 +2,26 @@
 # Developed by Juan Eduardo Coba Puerto - Based on the documentation available at https://developers.mercadolibre.com.co
 
 import os
+import json
 import time
-import requests
-import pandas as pd
-from tqdm import tqdm 
-from progressbar import progressbar
-from collections import defaultdict
-from joblib import Parallel, delayed
+import threading
+from collections import deque
+from .throttle import shared_throttle
+from .flatten import PageFlattener
+from .site_catalog import SiteCatalog, BUNDLED_CATALOG, BUNDLED_API_URL
+from .sharding import ShardPlanner, page_key, page_keys, price_filter, shard_label
+from .metrics import CrawlMetrics, request_endpoint
+from .token_manager import TokenManager
 
 class CountryNotFound(Exception):
     pass
 
+class PageFetchError(Exception):
+    pass
+
+# Fields compared to detect the products that changed since the last extraction.
+DELTA_FIELDS = ['price', 'sold_quantity', 'available_quantity']
+
 class meliRetriever:
     """
     It's a class that allows the user to donwload the information of all the listed
@@ -25,17 +34,25 @@ class meliRetriever:
 
         >>> retriever.create_dataset(file_name = 'data/ColombianData.csv', products_per_category = 10000)
 
+        >>> retriever.throttle.stats() # Target, current and achieved requests per second
+
+        >>> print(retriever.metrics.summary()) # Requests, latency and bytes by endpoint, products per second
+
     """
 
-    def __init__(self, site_name, token, folder = 'data', keep_individual_memory = False, parallel = True, n_jobs = -1):
+    def __init__(self, site_name, token, folder = 'data', keep_individual_memory = False, parallel = True, n_jobs = -1, requests_per_second = 10, max_retries = 5, 
+                 pool_size = 10, api_url = 'https://api.mercadolibre.com', multiget_batch_size = None, cache = None, 
+                 resume = True, max_page_retries = 3, storage = None, schedule = 'pages', metrics_file = None, metrics_interval = 60,
+                 site_catalog = None, refresh_catalog = False, max_search_offset = None, item_index = None):
         """
         Params:
         --------
             site_id (str):
                 A site name from which list MELI's products (https://api.mercadolibre.com/sites#json)
         
-            token (string):
-                MELI's API Token to make
+            token (string or token_manager.TokenManager):
+                MELI's API Token to make. With a TokenManager, the token is refreshed before it expires (and after a 401),
+                and the refreshed token is shared by all the workers.
 
             folder (string):
                 Folder where the data is going to be stored.
@@ -49,18 +66,104 @@ class meliRetriever:
             n_jobs (int):
                 (Default -1) Number of concurrent threads for parallel retrieving. If -1 uses all available.
 
+            requests_per_second (float):
+                (Default 10) Target requests per second for the token, shared by all the workers. The actual rate
+                             adapts to the responses of the API (see throttle.AdaptiveThrottle).
+
+            max_retries (int):
+                (Default 5) Number of times a request rejected by the API (429 or 5xx) is retried.
+
+            pool_size (int):
+                (Default 10) Number of keep-alive connections of the HTTP session of each worker.
+
+            api_url (string):
+                (Default https://api.mercadolibre.com) Base URL of MELI's API. Useful to point the retriever to a mock server.
+
+            multiget_batch_size (int):
+                (Default None) If given, the item and seller details of each page are refreshed with the multiget
+                               endpoints (/items?ids= and /users?ids=), requesting this many ids at once (20 at most).
+                               If None, the details included in the search results are used.
+
+            cache (cache.ResponseCache):
+                (Default None) On-disk cache of the API responses. If given, reruns are served from the cache.
+
+            resume (bool):
+                (Default True) If an extraction of a category was interrupted, only its missing pages are requested.
+                               If False, the category is extracted again from the first page.
+
+            max_page_retries (int):
+                (Default 3) Number of times a failed page is queued again before it is recorded as failed.
+
+            storage (storage.CSVStorage or storage.ParquetStorage):
+                (Default None) Where the products of each category are stored. If None, a CSV for each category
+                               is written in folder.
+
+            schedule (string):
+                (Default pages) Unit of parallel work. With 'pages', the workers request single pages from a shared
+                                queue of all the categories, and this process writes them (see scheduler.PageScheduler),
+                                so no worker is idle while a large category finishes. With 'categories', each worker
+                                extracts a whole category.
+
+            metrics_file (string):
+                (Default None) File where the metrics of the extraction (see metrics.CrawlMetrics) are exported while
+                               it runs, in the Prometheus text format if it ends with .prom, or as JSON otherwise.
+
+            metrics_interval (float):
+                (Default 60) Seconds between the summaries of the metrics printed during an extraction (and exports
+                             to metrics_file). If None, the summary is only printed at the end.
+
+            site_catalog (site_catalog.SiteCatalog):
+                (Default None) Where the site ID and the categories are looked up, the first time they're used. If None,
+                               the cache folder/.site_catalog.json and the catalog bundled with the package (only for
+                               MELI's API) are used, and the API is only requested for the sites and categories missing
+                               from both.
+
+            refresh_catalog (bool):
+                (Default False) Requests the site ID and the categories to the API, and updates the cache of site_catalog.
+
+            max_search_offset (int):
+                (Default None) Products of a search that can be reached by its offset (e.g. 1000 for a token without
+                               access to deeper pages). If given, the categories with more products are split into shards
+                               by their children categories and by price ranges (see sharding.ShardPlanner), whose pages
+                               are crawled like the rest. If None, each category is requested as a single stream of offsets.
+
+            item_index (item_index.ItemIndex):
+                (Default None) Index of the products already retrieved, shared by all the workers. If given, a product
+                               listed by several categories or pages is only enriched (questions and multiget) and
+                               written once, by the first page that lists it.
         """
         
         self.site_name = site_name.capitalize()
-        self.authorization_token =  {
-                            'Authorization': f'Bearer {token}' 
-                        }
-        self.site_id = self.__retrieve_site_id(self.site_name)
-        self.available_categories = self.__retrieve_categories_ids()
+        self.token = token
+        self.throttle = shared_throttle(token.client_id if isinstance(token, TokenManager) else token, requests_per_second)
+        self.max_retries = max_retries
+        self.pool_size = pool_size
+        self.api_url = api_url
+        self.multiget_batch_size = multiget_batch_size
+        self.cache = cache
+        self.resume = resume
+        self.max_page_retries = max_page_retries
+        self._sessions = {}
+        self._session_pid = None
+        self.metrics = CrawlMetrics()
+        if site_catalog is None: # The bundled catalog describes MELI's API, not the mocks
+            site_catalog = SiteCatalog(os.path.join(folder, '.site_catalog.json'), refresh = refresh_catalog,
+                                       bundled_path = BUNDLED_CATALOG if api_url == BUNDLED_API_URL else None)
+        self.site_catalog = site_catalog
+        self._site_id = None
+        self._available_categories = None
         self.folder = folder
+        self._storage = storage
+        self.flattener = PageFlattener()
         self.keep_individual_memory = keep_individual_memory
         self.parallel = parallel
         self.n_jobs = n_jobs
+        self.schedule = schedule
+        self.metrics_file = metrics_file
+        self.metrics_interval = metrics_interval
+        self.max_search_offset = max_search_offset
+        self.coverage = {}
+        self.item_index = item_index
 
     def create_dataset(self, export_file = False, file_name = 'results.csv', products_per_category = 5000, export_individual = True, check_existence = True):
         """
@@ -70,16 +173,18 @@ class meliRetriever:
         --------
             export_file (bool): 
                 (Default False) Defines wheter to export a final dataset containing the information
-                                of each category. If keep_individual_memory = False, this parameter is ignored.
+                                of each category. The file is built by merging the category files on disk.
 
             file_name (string):
-                (Default results.csv) Defines the output name of the extraction. 
+                (Default results.csv) Defines the output name of the extraction. It's a Parquet file if the
+                                      storage is a ParquetStorage.
             
             products_per_category (int):
                 (Default 5000) Specifies the maximum number of product requests for each category. 
             
             export_individual (bool):
-                (Default True) If true, a dataset for each category is going to be exported. 
+                (Default True) If true, a dataset for each category is going to be exported. If False, the
+                               category files written in this run are removed after building the final dataset.
             
             check_existence (bool):
                 (Default True) Verifies the existence of a CSV file containing the information of the category. 
@@ -93,23 +198,318 @@ class meliRetriever:
                                    as specified by the user.
 
         """
+        existing_categories = {category_id for category_id in self.available_categories 
+                                        if check_existence and self.storage.exists(category_id)}
+        self.reset_stats()
+        with self.metrics.reporting(self.metrics_file, self.metrics_interval):
+            category_paths = self.retrieve_categories(products_per_category, check_existence)
+        complete_categories = [category_id for category_id, path in zip(self.available_categories, category_paths) 
+                                        if path is not None]
+
+        complete_site_df = None
+        if export_file:
+            self.storage.merge(complete_categories, file_name)
+        if self.keep_individual_memory:
+            complete_site_df = self.storage.load(complete_categories)
+
+        if not export_individual:
+            for category_id in complete_categories:
+                if category_id not in existing_categories:
+                    self.storage.remove(category_id)
+        return complete_site_df
+
+    @property
+    def site_id(self):
+        """
+        The ID of the site, resolved the first time it's used (see site_catalog.SiteCatalog).
+        """
+        if self._site_id is None:
+            self._site_id = self.__retrieve_site_id(self.site_name)
+        return self._site_id
+
+    @property
+    def available_categories(self):
+        """
+        The {category_id: category_name} of the site to extract, resolved the first time they're used.
+        """
+        if self._available_categories is None:
+            self._available_categories = self.__retrieve_categories_ids()
+        return self._available_categories
+
+    @available_categories.setter
+    def available_categories(self, categories_dictionary):
+        self._available_categories = categories_dictionary
+
+    @property
+    def storage(self):
+        """
+        Where the products of each category are stored. The default CSVStorage is created the first time it's
+        used, so pandas is only imported when there's something to store.
+        """
+        if self._storage is None:
+            from .storage import CSVStorage
+            self._storage = CSVStorage(self.folder)
+        return self._storage
+
+    @storage.setter
+    def storage(self, storage):
+        self._storage = storage
+
+    def retrieve_categories(self, products_per_category, check_existence = True):
+        """
+        Lists the products of every available category, in parallel if requested.
 
-        if self.parallel:
-            category_dataframes = Parallel(n_jobs=self.n_jobs, backend = 'multiprocessing', verbose = 5)(delayed(self.iterate_through_category)(category_id, self.site_id, export_individual, check_existence, products_per_category) 
-                                        for category_id in self.available_categories.keys())          
+        Returns
+        ---------
+            category_paths (list):
+                The path of the file of each category (None for the categories with failed pages).
+        """
+        if self.parallel and self.schedule == 'pages':
+            from .scheduler import PageScheduler # scheduler imports this module
+            category_paths = PageScheduler({self.site_id: self}, n_jobs = self.n_jobs).run(products_per_category, check_existence)
+            category_paths = [category_paths[self.site_id].get(category_id) for category_id in self.available_categories]
+        elif self.parallel:
+            from joblib import Parallel, delayed, effective_n_jobs
+            with self.throttle.shared_between(effective_n_jobs(self.n_jobs)):
+                category_results = Parallel(n_jobs=self.n_jobs, backend = 'multiprocessing', verbose = 5)(delayed(self.iterate_with_stats)(category_id, self.site_id, check_existence, products_per_category) 
+                                        for category_id in self.available_categories.keys())
+            category_paths = []
+            for category_path, worker_stats in category_results:
+                self.merge_stats(worker_stats)
+                category_paths.append(category_path)
         else:
-            category_dataframes = [self.iterate_through_category(category_id, self.site_id, export_individual, check_existence, products_per_category) 
+            from progressbar import progressbar
+            category_paths = [self.iterate_through_category(category_id, self.site_id, check_existence, products_per_category) 
                                         for category_id in progressbar(self.available_categories.keys())]
+        return category_paths
 
-        if self.keep_individual_memory:
-            complete_site_df = pd.concat(category_dataframes, axis = 0, ignore_index=True)
-            if export_file:
-                complete_site_df.to_csv(file_name, sep = ';', index = False)
-            return complete_site_df
+    def iterate_with_stats(self, *args):
+        """
+        Runs iterate_through_category in a worker process, and returns the counters of its copies of the throttle and the cache.
+        """
+        category_path = self.iterate_through_category(*args)
+        return category_path, self.worker_stats()
+
+    def refresh_dataset(self, products_per_category = 5000, sort = 'start_time_desc'):
+        """
+        Updates the stored categories with the products published or changed since the last extraction.
+        Every search page of each category is requested (a change in an old product can be anywhere in the
+        results), but only the new products, and the ones whose price, sold_quantity or available_quantity changed,
+        are enriched (questions and multiget details) and upserted in the storage. Categories that aren't stored
+        yet are extracted completely. If a request fails, the refresh stops with its error and nothing is upserted
+        for the category.
+
+        Params
+        --------
+            products_per_category (int):
+                (Default 5000) Maximum number of products requested for each category.
+
+            sort (string):
+                (Default start_time_desc) Sort of the search results. The pages are requested in this order.
+
+        Returns
+        ---------
+            refresh_summary (dict):
+                For each category, the pages requested and the number of new and changed products
+                (None if the category was extracted completely).
+        """
+        self.reset_stats()
+        with self.metrics.reporting(self.metrics_file, self.metrics_interval):
+            if self.parallel:
+                from joblib import Parallel, delayed, effective_n_jobs
+                with self.throttle.shared_between(effective_n_jobs(self.n_jobs)):
+                    category_results = Parallel(n_jobs=self.n_jobs, backend = 'multiprocessing', verbose = 5)(delayed(self.refresh_with_stats)(category_id, products_per_category, sort) 
+                                            for category_id in self.available_categories.keys())
+                category_summaries = []
+                for category_summary, worker_stats in category_results:
+                    self.merge_stats(worker_stats)
+                    category_summaries.append(category_summary)
+            else:
+                from progressbar import progressbar
+                category_summaries = [self.refresh_category(category_id, products_per_category, sort) 
+                                            for category_id in progressbar(self.available_categories.keys())]
+        return dict(zip(self.available_categories.keys(), category_summaries))
+
+    def refresh_with_stats(self, *args):
+        """
+        Runs refresh_category in a worker process, and returns the counters of its copies of the throttle and the cache.
+        """
+        category_summary = self.refresh_category(*args)
+        return category_summary, self.worker_stats()
+
+    def refresh_category(self, category_id, products_per_category = 5000, sort = 'start_time_desc'):
+        """
+        Upserts the new and changed products of a stored category (see refresh_dataset).
+
+        Returns
+        --------
+            category_summary (dict):
+                The pages requested and the number of new and changed products [None if the category wasn't stored].
+        """
+        if not self.storage.exists(category_id):
+            self.iterate_through_category(category_id, self.site_id, True, products_per_category)
+            return None
+
+        stored_values = self.stored_delta_values(category_id)
+        category_summary = {'pages': 0, 'new': 0, 'changed': 0}
+        updated_pages = []
+        # The search pages (and the total of the category) are requested fresh: a cached page would hide the
+        # products listed or changed since it was stored.
+        for offset in self.category_offsets(category_id, products_per_category, use_cache = False):
+            product_json = self.get_json(self.page_url(self.site_id, category_id, offset, sort), use_cache = False)['results']
+            category_summary['pages'] += 1
+            new_products = [product for product in product_json if product['id'] not in stored_values]
+            changed_products = [product for product in product_json if product['id'] in stored_values 
+                                    and stored_values[product['id']] != self.delta_values(product)]
+            for product in new_products + changed_products:
+                stored_values[product['id']] = self.delta_values(product)
+            category_summary['new'] += len(new_products)
+            category_summary['changed'] += len(changed_products)
+
+            updated_products = new_products + changed_products
+            if updated_products:
+                if self.multiget_batch_size:
+                    updated_products = self.enrich_with_multiget(updated_products)
+                updated_pages.append(self.label_page(category_id, self.build_page_df(updated_products)))
+                self.metrics.record_page(len(updated_products))
+        if updated_pages:
+            import pandas as pd
+            self.storage.upsert(category_id, pd.concat(updated_pages, axis = 0, ignore_index = True))
+        return category_summary
+
+    def stored_delta_values(self, category_id):
+        """
+        The DELTA_FIELDS of the stored products of a category, by id.
+        """
+        stored_df = self.storage.read(category_id, columns = ['id'] + DELTA_FIELDS)
+        return {row[0]: self.delta_values(dict(zip(DELTA_FIELDS, row[1:]))) 
+                        for row in stored_df[['id'] + DELTA_FIELDS].itertuples(index = False)}
+
+    def delta_values(self, product):
+        """
+        The DELTA_FIELDS of a product, as floats (None if missing).
+        """
+        import pandas as pd
+        return tuple(None if pd.isna(product.get(field)) else float(product.get(field)) for field in DELTA_FIELDS)
+
+    def reset_stats(self):
+        """
+        Restarts the counters of the throttle, the cache, the metrics and the coverage of the shards.
+        """
+        self.throttle.reset_stats()
+        self.metrics.reset_stats()
+        self.coverage = {}
+        if self.cache is not None:
+            self.cache.reset_stats()
+
+    def worker_stats(self):
+        """
+        The counters of the throttle, the cache, the metrics and the coverage of the shards of the current process.
+        """
+        return {
+            'throttle': self.throttle.stats(),
+            'cache': self.cache.stats() if self.cache is not None else None,
+            'metrics': self.metrics.stats(),
+            'coverage': self.coverage
+        }
+
+    def merge_stats(self, worker_stats):
+        """
+        Adds the counters returned by a worker process to the ones of this process.
+        """
+        self.throttle.merge(worker_stats['throttle'])
+        self.metrics.merge(worker_stats['metrics'])
+        self.coverage.update(worker_stats['coverage'])
+        if self.cache is not None:
+            self.cache.merge(worker_stats['cache'])
+
+    @property
+    def session(self):
+        """
+        The connection pooled HTTP session of the current thread. Each worker process and thread (e.g. the
+        threads that plan the shards of asyncMeliRetriever) creates its own session, since requests.Session
+        isn't thread safe and the connections of a pool can't be shared between processes.
+        """
+        if self._session_pid != os.getpid():
+            self._sessions = {}
+            self._session_pid = os.getpid()
+        thread_id = threading.get_ident()
+        if thread_id not in self._sessions:
+            from .session import create_session
+            self._sessions[thread_id] = create_session(self.pool_size)
+        return self._sessions[thread_id]
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_sessions'] = {}
+        return state
+
+    @property
+    def authorization_token(self):
+        """
+        The Authorization header of the requests, with a valid token.
+        """
+        token = self.token.access_token() if isinstance(self.token, TokenManager) else self.token
+        return {'Authorization': f'Bearer {token}'}
+
+    def get_json(self, url, use_cache = True):
+        """
+        Sends a GET request to MELI's API through the throttle of the token. Requests rejected 
+        by the API (429 or 5xx) are retried up to max_retries times, as well as requests rejected with 401 when 
+        the token is a TokenManager (after refreshing it). If the retriever has a cache, stored responses are 
+        returned without a request. Every response is recorded in self.metrics.
+
+        Params:
+        ---------
+            url (string):
+                The URL of the request.
+
+            use_cache (bool):
+                (Default True) If False, the request is sent even if the cache has a stored response,
+                               and the stored response is replaced by the new one.
+
+        Returns
+        ---------
+            response_json (dict or list):
+                The JSON response of the API.
+
+        Raises
+        ---------
+            requests.HTTPError:
+                If the request was still rejected after max_retries retries.
+        """
+        endpoint = request_endpoint(url)
+        if self.cache is not None and use_cache:
+            cached_body = self.cache.get(url)
+            if cached_body is not None:
+                self.metrics.record_cache_hit(endpoint)
+                return json.loads(cached_body)
+
+        for attempt in range(self.max_retries + 1):
+            waiting_since = time.perf_counter()
+            self.throttle.acquire()
+            sent_at = time.perf_counter()
+            headers = self.authorization_token
+            response = self.session.get(url = url, headers = headers)
+            retry = self.throttle.record(response.status_code, response.headers)
+            if response.status_code == 401 and isinstance(self.token, TokenManager):
+                self.token.refresh(expired_token = headers['Authorization'][len('Bearer '):])
+                retry = True
+            self.metrics.record_sleep(sent_at - waiting_since)
+            self.metrics.record_request(endpoint, time.perf_counter() - sent_at, response.status_code, len(response.content),
+                                        retry = retry and attempt < self.max_retries)
+            if not retry:
+                break
+        if retry:
+            response.raise_for_status()
+
+        if self.cache is not None and response.status_code == 200:
+            self.cache.set(url, response.text)
+        return response.json()
 
     def __retrieve_site_id(self, site_name):
         """
-        Retrieves the site_id of the selected country.
+        Retrieves the site_id of the selected country from the site_catalog (from the API if it isn't there).
 
         Params:
         ---------
@@ -121,33 +521,31 @@ class meliRetriever:
             site_id (string):
                 The site ID based on MELI's definition. 
         """
-        sites_url = "https://api.mercadolibre.com/sites"
-        response = requests.get(url = sites_url, headers = self.authorization_token)
-        sites_list = response.json()
-        site_dictionary = next((site for site in sites_list if site["name"] == site_name), None)
-        if site_dictionary is None:
+        site_id = self.site_catalog.site_id(site_name, self.request_catalog)
+        if site_id is None:
             raise CountryNotFound(f'The country {site_name} is not available. See available countries at https://api.mercadolibre.com/sites') # exception
         else:
-            return site_dictionary['id']
+            return site_id
 
     def __retrieve_categories_ids(self):
         """
-        Retrieves all categories and their IDs available at a certain country.
+        Retrieves all categories and their IDs available at a certain country, from the site_catalog
+        (from the API if they aren't there).
 
         Returns
         ---------
             categories_dictionary (dict):
                 A dictionary containing {category_id: category_name}
         """
-        categories_url = f'https://api.mercadolibre.com/sites/{self.site_id}/categories'
-        response = requests.get(url = categories_url, headers = self.authorization_token)
-        categories_list = response.json()
-        categories_dictionary = {categories_list[i]['id']: categories_list[i]['name'] 
-                                                                        for i in range(len(categories_list))}
+        return self.site_catalog.categories(self.site_id, self.request_catalog)
 
-        return categories_dictionary
+    def request_catalog(self, path):
+        """
+        Requests the metadata missing from the site_catalog (e.g. /sites) to the API.
+        """
+        return self.get_json(f'{self.api_url}{path}')
 
-    def list_marketplace_products(self, site_id, category_id, offset):
+    def list_marketplace_products(self, site_id, category_id, offset, shard = None):
         """
         Retrieves a fraction of the listed products.
 
@@ -162,258 +560,375 @@ class meliRetriever:
             offset (integer):
                 Starting point of the request.
 
+            shard (dict):
+                (Default None) The shard of the category the offset belongs to (see sharding.ShardPlanner).
+                               If None, the offset is in the search of the whole category.
+
         Returns
         ---------
             product_df (pandas.DataFrame):
                 A DataFrame containing all the single-valued information for each product.
+
+        Raises
+        ---------
+            PageFetchError:
+                If the page or the information of its products couldn't be retrieved.
         """
-        page_url = f'https://api.mercadolibre.com/sites/{site_id}/search?category={category_id}&offset={offset}'
-        product_request = requests.get(url = page_url, headers = self.authorization_token).json()
-        #total_products = product_request['paging']['total'] Maximum 1000 without access key
+        page_url = self.page_url(site_id, category_id, offset, shard = shard)
         try:
-            
-            product_json = product_request['results']
-            product_df = self.single_attribute_keys_df(product_json)
-            nested_df = self.multiple_attribute_keys_df(product_json)
-
-            product_df = product_df.merge(nested_df, on = 'id')
-            return product_df
+            product_request = self.get_json(page_url)
+            #total_products = product_request['paging']['total'] (see max_search_offset)
+            product_json = self.skip_duplicates(product_request['results'], *self.index_page(site_id, category_id, offset, shard))
+            if self.multiget_batch_size:
+                product_json = self.enrich_with_multiget(product_json)
+            return self.build_page_df(product_json)
         except Exception as e:
-            print(e)
+            raise PageFetchError(f'Page {offset} of {shard_label(shard) or category_id} failed: {e!r}') from e
 
-    def iterate_through_category(self, category_id, site_id, export_individual = True, check_existence = True, products_per_category = 5000):
+    def page_url(self, site_id, category_id, offset, sort = None, shard = None):
         """
-        Lists all the products in a given category.
+        Builds the URL of the search page of a category (or of one of its shards) starting at offset.
+        """
+        if shard is None:
+            page_url = f'{self.api_url}/sites/{site_id}/search?category={category_id}&offset={offset}'
+        else:
+            page_url = f"{self.api_url}/sites/{site_id}/search?category={shard['category_id']}&offset={offset}"
+            if shard['price_range'] is not None:
+                page_url = f"{page_url}&price={price_filter(shard['price_range'])}"
+        return f'{page_url}&sort={sort}' if sort is not None else page_url
 
-        Params
-        --------
-            category_id (string):
-                The ID of the category of interest.
+    def index_page(self, site_id, category_id, offset, shard = None):
+        """
+        Identifies a page in the item_index: its category (e.g. MCO/MCO1000) and its key in the checkpoint of the
+        category (see sharding.page_key).
+        """
+        key = offset if shard is None else page_key(category_id, shard, offset)
+        return f'{site_id}/{category_id}', str(key)
 
-            site_id (string):
-                The ID of the country of interest.
-            
-            export_individual (bool):
-                (Default True) If true, a dataset ef the category is exported after completition.
-            
-            check_existence (bool):
-                (Default True) Verifies the existence of a CSV file containing the information of the category. 
-                               If a CSV exists, then the retriever loads the file and skips this extraction.
-            
+    def skip_duplicates(self, product_json, category, page):
+        """
+        Removes from the results of a page the products written by other pages (see item_index.ItemIndex), and the
+        ones repeated within the page, before their details and questions are requested.
 
-        
         Returns
+        ---------
+            product_json (list):
+                The results of the page that have to be retrieved.
+        """
+        if self.item_index is None:
+            return product_json
+        skipped_ids = self.item_index.written([product['id'] for product in product_json], category, page)
+        unique_json = []
+        for product in product_json:
+            if product['id'] not in skipped_ids:
+                unique_json.append(product)
+                skipped_ids.add(product['id'])
+        skipped = len(product_json) - len(unique_json)
+        self.metrics.record_duplicates(skipped, saved_requests = skipped)
+        return unique_json
+
+    def write_page(self, checkpoint, category_id, page, page_df):
+        """
+        Writes a page to the checkpoint of its category. With an item_index, its ids are recorded in the same step,
+        and the products written by other pages in the meantime (e.g. by a page requested at the same time) are dropped.
+
+        Params:
         --------
-            complete_category_df (pandas.DataFrame):
-                A DataFrame containing all the retrieved information for a given category
-        """
-        path = os.path.join(self.folder, f'{category_id}.csv')
-        max_value = self.find_maximum_value(category_id, products_per_category)
-        if check_existence:
-            try:
-                complete_category_df = pd.read_csv(path, sep = ";")
-            except:
-                time.sleep(0.05)
-                page_df_by_offset = [self.list_marketplace_products(self.site_id, category_id, offset) 
-                                            for offset in range(0, max_value, 50)]
-
-                #page_df_by_offset = []
-                #for offset in range(0, 101, 50):
-                #    tmp_df = self.list_marketplace_products(self.site_id, category_id, offset)
-                #    page_df_by_offset.append(tmp_df)
-
-                complete_category_df = pd.concat(page_df_by_offset, axis = 0, ignore_index=True)
-                complete_category_df['category_name'] = self.available_categories[category_id]
-                if export_individual:
-                    complete_category_df.to_csv(path, sep = ';', index = False)
-        if self.keep_individual_memory:
-            return complete_category_df
+            page (tuple):
+                (key, shard, offset) of the page (see category_pages).
 
-    def find_maximum_value(self, category_id, products_per_category):
+            page_df (pandas.DataFrame):
+                The products of the page (see list_marketplace_products).
         """
-        Finds the maximum value of products allowed for retrieving. 
-        It corresponds to the minimum between the available products of the category 
-        and the products requested by the user.
+        key, shard, offset = page
+        if self.item_index is not None and len(page_df):
+            duplicated_ids = self.item_index.commit(list(page_df['id']), *self.index_page(self.site_id, category_id, offset, shard))
+            unique_df = page_df[~page_df['id'].isin(duplicated_ids)].drop_duplicates('id')
+            self.metrics.record_duplicates(len(page_df) - len(unique_df))
+            page_df = unique_df
+        checkpoint.write_page(key, self.label_page(category_id, page_df))
+        self.record_page(category_id, shard, len(page_df))
+
+    def build_page_df(self, product_json, question_json = None):
         """
-        url = f'https://api.mercadolibre.com/categories/{category_id}'
-        r = requests.get(url = url, headers = self.authorization_token)
-        category_info = r.json()
-        total_items_in_this_category = category_info['total_items_in_this_category']
-        maximum_allowed = min(products_per_category, total_items_in_this_category)
-        return maximum_allowed
+        Flattens the single-valued and nested information of the products in a search page
+        (see flatten.PRODUCT_FIELDS and flatten.QUESTION_FIELDS).
 
+        Params
+        --------
+            product_json (list):
+                The 'results' of a search response.
 
+            question_json (list):
+                (Default None) The questions responses of each product. If None, they are requested to the API.
 
+        Returns
+        ---------
+            product_df (pandas.DataFrame):
+                A DataFrame with one row for each product of the page.
+        """
+        if question_json is None:
+            question_json = [self.get_json(self.questions_url(product['id'])) for product in product_json]
+        return self.flattener.frame(product_json, question_json)
 
-    def multiple_attribute_keys_df(self, product_json):
+    def enrich_with_multiget(self, product_json):
         """
-        This function extract the nested attributes. 
+        Refreshes the item and seller details of the products of a page with the multiget endpoints. 
+        A page of 50 products costs ceil(50/multiget_batch_size) requests for each endpoint, instead of 50.
 
         Params
         --------
-            product_json (dict):
-                A dictionary containing the response from the API.
+            product_json (list):
+                The 'results' of a search response.
 
         Returns
+        ---------
+            product_json (list):
+                The products with the item and seller details replaced by the multiget responses.
+        """
+        product_ids = [product['id'] for product in product_json]
+        item_details = self.retrieve_multiget('items', product_ids)
+        seller_ids = self.seller_ids(product_json, item_details)
+        seller_details = self.retrieve_multiget('users', seller_ids)
+        return self.combine_multiget_details(product_json, item_details, seller_details)
+
+    def retrieve_multiget(self, resource, ids):
+        """
+        Retrieves the details of several items or users, in batches of multiget_batch_size ids.
+
+        Params
         --------
-            result_df (pandas.DataFrame)
-                A pandas DataFrame with the information of each product.
+            resource (string):
+                'items' or 'users'.
+
+            ids (list):
+                The IDs of interest.
+
+        Returns
+        ---------
+            details (dict):
+                A dictionary containing {id: details} for every ID found.
         """
-        
-        seller_attributes = self.iterate_and_combine(product_json, self.extract_seller_attributes)
-        product_info = self.iterate_and_combine(product_json, self.extract_nested_product_info)    
-        update_info = self.iterate_and_combine(product_json, self.date_information)
-        question_info = self.iterate_and_combine(product_json, self.retrieve_date_and_questions)
+        details = {}
+        for batch in self.multiget_batches(ids):
+            details.update(self.parse_multiget(self.get_json(self.multiget_url(resource, batch))))
+        return details
 
-        list_of_features = [product_info, update_info, question_info]
-        for information in list_of_features:
-            seller_attributes.update(information)
+    def multiget_batches(self, ids):
+        """
+        Splits the IDs in batches of multiget_batch_size.
+        """
+        return [ids[i:i + self.multiget_batch_size] for i in range(0, len(ids), self.multiget_batch_size)]
 
-        result_df = pd.DataFrame.from_dict(seller_attributes)
-        return result_df
+    def multiget_url(self, resource, ids):
+        """
+        Builds the URL of a multiget request (e.g. /items?ids=MCO1,MCO2).
+        """
+        ids = ','.join(str(resource_id) for resource_id in ids)
+        return f'{self.api_url}/{resource}?ids={ids}'
 
-    def iterate_and_combine(self, product_json, function):
+    def parse_multiget(self, multiget_json):
+        """
+        Extracts the body of each successful response of a multiget request.
         """
-        Iterates through the JSON and retrieves the fields based on the function of interest.
+        return {str(response['body']['id']): response['body'] for response in multiget_json
+                                                            if response.get('code') == 200}
+
+    def seller_ids(self, product_json, item_details):
+        """
+        The unique IDs of the sellers of the products of a page.
+        """
+        seller_ids = []
+        for product in product_json:
+            seller_id = product.get('seller', {}).get('id') or item_details.get(product['id'], {}).get('seller_id')
+            if seller_id is not None and seller_id not in seller_ids:
+                seller_ids.append(seller_id)
+        return seller_ids
+
+    def combine_multiget_details(self, product_json, item_details, seller_details):
+        """
+        Replaces the item and seller information of the search results with the multiget details,
+        keeping the structure of a search result expected by the PageFlattener (see flatten.PRODUCT_FIELDS).
+        """
+        combined_json = []
+        for product in product_json:
+            item = item_details.get(product['id'], {})
+            combined = {**product, **{key: item[key] for key in ['shipping', 'tags', 'official_store_id'] if key in item}}
+            seller = product.get('seller', {})
+            seller_id = seller.get('id') or item.get('seller_id')
+            combined['seller'] = {**seller, **seller_details.get(str(seller_id), {})}
+            combined_json.append(combined)
+        return combined_json
+
+    def iterate_through_category(self, category_id, site_id, check_existence = True, products_per_category = 5000):
+        """
+        Lists all the products in a given category.
 
         Params
         --------
-            product_json (dictionary):
-                A dictionary containing the 'results' response from MELI's API.
+            category_id (string):
+                The ID of the category of interest.
 
-            function (function):
-                A function that performs extraction of fields.
+            site_id (string):
+                The ID of the country of interest.
+            
+            check_existence (bool):
+                (Default True) Verifies the existence of a CSV file containing the information of the category. 
+                               If a CSV exists, then the retriever skips this extraction.
+            
 
+        
         Returns
         --------
-            merge_dictionary (dictionary):
-                A dictionary containing a list of all results from the function of interest.
+            category_path (string):
+                The path of the CSV with all the retrieved information for a given category.
+                None if some pages failed (they are requested again in the next run).
+        """
+        if check_existence and self.storage.exists(category_id):
+            category_path = self.category_path(category_id)
+        else:
+            pages = self.category_pages(category_id, products_per_category)
+            checkpoint = self.storage.writer(category_id, resume = self.resume)
+            retry_queue = deque((page, 0) for page in self.pending_pages(category_id, checkpoint, pages))
+            while retry_queue: # Failed pages go to the end of the queue, up to max_page_retries times.
+                (key, shard, offset), attempts = retry_queue.popleft()
+                try:
+                    page_df = self.list_marketplace_products(self.site_id, category_id, offset, shard)
+                except PageFetchError as e:
+                    if attempts < self.max_page_retries:
+                        retry_queue.append(((key, shard, offset), attempts + 1))
+                    else:
+                        print(e)
+                        checkpoint.mark_failed(key, attempts + 1, e)
+                        self.metrics.record_failed_page()
+                else:
+                    self.write_page(checkpoint, category_id, (key, shard, offset), page_df)
+            category_path = self.finish_category(category_id, checkpoint, pages)
+        return category_path
+
+    def category_offsets(self, category_id, products_per_category, use_cache = True):
+        """
+        The offsets of the pages to request for a category (use_cache is passed to get_json).
+        """
+        max_value = self.find_maximum_value(category_id, products_per_category, use_cache)
+        return list(range(0, max_value, 50))
 
+    def category_pages(self, category_id, products_per_category):
         """
-        n_elements = len(product_json)
-        dictionary_list = [function(product_json, idx) for idx in range(n_elements)]
+        The pages to request for a category, split into shards if it's larger than max_search_offset.
 
-        merge_dictionary = defaultdict(list)
+        Returns
+        --------
+            pages (list):
+                (key, shard, offset) of each page (see sharding.ShardPlanner.pages).
+        """
+        return ShardPlanner(self, max_offset = self.max_search_offset).pages(category_id, products_per_category)
 
-        for dictionary in dictionary_list: # Combines the values of each key into a list.
-            for key, value in dictionary.items():
-                merge_dictionary[key].append(value)
-        
-        return merge_dictionary
-    
-    def single_attribute_keys_df(self, product_json):
+    def pending_pages(self, category_id, checkpoint, pages):
         """
-        This function combines the information retrieved by product json. Selects specific attributes
-        that are easy to extract.
+        The pages of a category that are not written to disk yet. Their shards are added to the coverage, and the
+        ids of the item_index written by other pages of the category (failed, interrupted or no longer planned)
+        are released, so they can be written again.
+        """
+        pending_keys = set(checkpoint.pending(page_keys(pages)))
+        if self.item_index is not None:
+            written_keys = [key for key in page_keys(pages) if key not in pending_keys]
+            self.item_index.release(f'{self.site_id}/{category_id}', written_keys)
+        pending_pages = [page for page in pages if page[0] in pending_keys]
+        category_coverage = self.coverage.setdefault(category_id, {})
+        for key, shard, offset in pending_pages:
+            category_coverage.setdefault(shard_label(shard), {**shard, 'retrieved': 0})
+        return pending_pages
+
+    def record_page(self, category_id, shard, products):
+        """
+        Records a page written to disk in the metrics and in the coverage of its shard.
+        """
+        self.metrics.record_page(products)
+        self.coverage[category_id][shard_label(shard)]['retrieved'] += products
 
-        Params
-        --------
-            product_json (dict):
-                A dictionary containing the response from the API.
+    def coverage_report(self):
+        """
+        The products retrieved from each shard in the last extraction, against the total reported by the API.
+        Shards whose pages were all stored by a previous (interrupted) extraction aren't included.
 
         Returns
         --------
-            result_df (pandas.DataFrame)
-                A pandas DataFrame with the information of each product.
+            coverage_df (pandas.DataFrame):
+                For each category and shard, its total, planned and retrieved products, the coverage
+                (retrieved / total) and whether the shard was truncated (still larger than max_search_offset).
+        """
+        import pandas as pd
+        coverage_df = pd.DataFrame([{'category_id': category_id, 'shard': label, 'total': shard['total'],
+                                     'planned': shard['planned'], 'retrieved': shard['retrieved']}
+                                        for category_id, category_coverage in self.coverage.items()
+                                        for label, shard in category_coverage.items()],
+                                   columns = ['category_id', 'shard', 'total', 'planned', 'retrieved'])
+        coverage_df['coverage'] = coverage_df['retrieved']/coverage_df['total']
+        coverage_df['truncated'] = coverage_df['total'] > (self.max_search_offset or float('inf'))
+        return coverage_df
+
+    def category_path(self, category_id):
         """
-        single_attribute_keys = ['id', 'category_id', 'title', 'price', 'available_quantity', 'sold_quantity', 
-                                 'buying_mode', 'listing_type_id', 'accepts_mercadopago',
-                                 'original_price', 'condition']
+        Path of the CSV file that stores the products of a category.
+        """
+        return self.storage.path(category_id)
 
-        merge_dictionary = defaultdict(list)
+    def label_page(self, category_id, page_df):
+        """
+        Adds the name of the category to a page of products.
+        """
+        page_df['category_name'] = self.available_categories[category_id]
+        return page_df
 
-        for dictionary in product_json: # Combines the values of each key into a list.
-            for key, value in dictionary.items():
-                merge_dictionary[key].append(value)
+    def finish_category(self, category_id, checkpoint, pages):
+        """
+        Assembles the CSV of a category once all its pages are on disk.
 
-        selected_features = {k:v for (k,v) in merge_dictionary.items() if k in single_attribute_keys}
-        result_df = pd.DataFrame.from_dict(selected_features)
-        return result_df
+        Params
+        --------
+            pages (list):
+                (key, shard, offset) of each page of the category (see category_pages).
 
-    def extract_seller_attributes(self, product_json, idx):
+        Returns
+        --------
+            category_path (string):
+                The path of the CSV of the category [None if some pages failed].
         """
-        Extract information about the reputation of the seller in the Marketplace
+        missing_pages = checkpoint.pending(page_keys(pages))
+        if missing_pages:
+            print(f'{len(missing_pages)} pages of category {category_id} failed. Run the extraction again to resume them.')
+            return None
+
+        checkpoint.finalize(page_keys(pages)) # Pages of a previous plan aren't in the current one
+        return self.category_path(category_id)
+
+    def find_maximum_value(self, category_id, products_per_category, use_cache = True):
         """
-        seller_info = product_json[idx]['seller']
-        seller_registration = seller_info.get('registration_date')
-        seller_level_id = seller_info.get('seller_reputation', {}).get('level_id')
-        seller_powerseller = seller_info.get('seller_reputation', {}).get('power_seller_status')
-        positive_rating = seller_info.get('seller_reputation', {}).get('transactions', {}).get('ratings', {}).get('positive') # Computar un NPS
-        negative_rating = seller_info.get('seller_reputation', {}).get('transactions', {}).get('ratings', {}).get('negative')
-        neutral_rating = seller_info.get('seller_reputation', {}).get('transactions', {}).get('ratings', {}).get('neutral')
-        
-        seller_attributes_dict = {
-            'seller_level_id': seller_level_id,
-            'seller_powerseller': seller_powerseller,
-            'positive_rating': positive_rating,
-            'negative_rating': negative_rating,
-            'neutral_rating': neutral_rating
-        }
-        
-        return seller_attributes_dict
+        Finds the maximum value of products allowed for retrieving. 
+        It corresponds to the minimum between the available products of the category 
+        and the products requested by the user (use_cache is passed to get_json).
+        """
+        url = self.category_url(category_id)
+        category_info = self.get_json(url, use_cache = use_cache)
+        return self.maximum_from_category_info(category_info, products_per_category)
 
-    def extract_nested_product_info(self, product_json, idx):
+    def category_url(self, category_id):
         """
-        Extracts additional information of the product, such as shipping and tags.
+        Builds the URL with the information of a category.
         """
-        product_info = product_json[idx]
-        product_id = product_info['id']
-        free_shipping = product_info['shipping']['free_shipping']
-        store_pickup = product_info['shipping']['store_pick_up']
-        number_of_tags = len(product_info['tags'])
-        is_official_store = (product_info['official_store_id'] is not None)
-        
-        product_information_dict = {
-            'id' : product_id,
-            'free_shipping' : free_shipping, 
-            'store_pickup' : store_pickup,
-            'number_of_tags' : number_of_tags,
-            'is_official_store': is_official_store        
-        }
-        
-        return product_information_dict
-        
+        return f'{self.api_url}/categories/{category_id}'
 
-    def date_information(self, product_json, idx):
+    def maximum_from_category_info(self, category_info, products_per_category):
         """
-        Extract the last time of product updating based on thumbnail information
+        Computes the maximum value of products allowed for retrieving from the category information.
         """
-        thumbnail_info = product_json[idx].get('thumbnail')
-        if thumbnail_info is not None:
-            thumbnail_date = thumbnail_info.split('_')[-1]
-            month_update = thumbnail_date[:2]
-            year_update = thumbnail_date[2:6]
-        else:
-            month_update, year_update = None, None
-        
-        update_info = {
-            'month_update' : month_update,
-            'year_update' : year_update
-        }
-        
-        return update_info 
-
-    def retrieve_date_and_questions(self, product_json, idx):
-        """
-        Retrieves the date of the number of questions made, and the date of the first one.        
-        """
-        time.sleep(0.5)
-        product_id = product_json[idx]['id']
-        url = f'https://api.mercadolibre.com/questions/search?item={product_id}&sort_fields=date_created&limit=1'
-        r = requests.get(url = url, headers = self.authorization_token)
-        question_json = r.json()
-        total = question_json.get('total')
-        questions = question_json.get('questions', [])
-        if questions:
-            fecha_primera = questions[0]['date_created'].split('-')
-            year_created, month_created = fecha_primera[0], fecha_primera[1]
-        else:
-            year_created, month_created = None, None
-        
-        question_date = {
-            'year_created' : year_created,
-            'month_created' : month_created,
-            'total_questions': total
-        }
-        return question_date
+        total_items_in_this_category = category_info['total_items_in_this_category']
+        maximum_allowed = min(products_per_category, total_items_in_this_category)
+        return maximum_allowed
 
+    def questions_url(self, product_id):
+        """
+        Builds the URL that lists the first question made about a product.
+        """
+        return f'{self.api_url}/questions/search?item={product_id}&sort_fields=date_created&limit=1'
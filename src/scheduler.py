@@ -0,0 +1,190 @@
+# Page level scheduling of the extraction of several sites on one pool of worker processes.
+# The work units are the pages (site, category, page) of every category: the workers request and flatten them,
+# and the parent process writes each page to the checkpoint of its category as soon as it arrives, so no
+# worker waits for a whole category. The largest categories are scheduled first to shorten the tail of the run.
+
+from contextlib import ExitStack
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from collections import deque
+from joblib import effective_n_jobs
+from tqdm import tqdm
+from .retrieve import PageFetchError
+
+# The retrievers of the current worker process, by site_id (see _initialize_worker).
+_worker_retrievers = {}
+
+def _initialize_worker(retrievers):
+    """
+    Keeps the retrievers in the worker process, so each work unit only sends its site, category and offset.
+    """
+    _worker_retrievers.update(retrievers)
+
+def _worker_stats(retriever):
+    """
+    The counters of the throttle, the cache and the metrics since the previous work unit of this worker.
+    """
+    worker_stats = retriever.worker_stats()
+    retriever.reset_stats()
+    return worker_stats
+
+def _plan_category(site_id, category_id, products_per_category):
+    """
+    The pages (key, shard, offset) of a category, split into shards if it's too large (see sharding.ShardPlanner).
+    """
+    retriever = _worker_retrievers[site_id]
+    try:
+        pages = retriever.category_pages(category_id, products_per_category)
+    except Exception as e:
+        pages = PageFetchError(f'The shards of category {category_id} could not be planned: {e!r}')
+    return pages, _worker_stats(retriever)
+
+def _fetch_page(site_id, category_id, page):
+    """
+    Requests and flattens a page. Returns the page, or the PageFetchError that stopped it.
+    """
+    retriever = _worker_retrievers[site_id]
+    key, shard, offset = page
+    try:
+        page_df = retriever.list_marketplace_products(site_id, category_id, offset, shard)
+    except PageFetchError as e:
+        page_df = e
+    return page_df, _worker_stats(retriever)
+
+
+class PageScheduler:
+    """
+    Extracts the categories of several meliRetrievers with a single pool of processes, one page at a time.
+
+    Example:
+        >>> scheduler = PageScheduler({'MCO': colombia_retriever, 'MLA': argentina_retriever}, n_jobs = 8)
+        >>> category_paths = scheduler.run(products_per_category = 10000)
+        >>> category_paths['MCO']['MCO1000'] # The file of the category (None if some pages failed)
+    """
+
+    def __init__(self, retrievers, n_jobs = -1, max_in_flight = None, verbose = True):
+        """
+        Params:
+        --------
+            retrievers (dict):
+                A meliRetriever for each site_id. Their pages are written to their storages.
+
+            n_jobs (int):
+                (Default -1) Number of worker processes shared by all the sites. If -1 uses all available.
+
+            max_in_flight (int):
+                (Default None) Maximum number of work units sent to the pool at once. If None, twice the workers.
+
+            verbose (bool):
+                (Default True) Shows the progress of the pages.
+        """
+        self.retrievers = retrievers
+        self.n_jobs = effective_n_jobs(n_jobs)
+        self.max_in_flight = max_in_flight or 2*self.n_jobs
+        self.verbose = verbose
+
+    def run(self, products_per_category = 5000, check_existence = True):
+        """
+        Extracts every available category of every site.
+
+        Params
+        --------
+            products_per_category (int):
+                (Default 5000) Maximum number of products requested for each category.
+
+            check_existence (bool):
+                (Default True) Skips the categories already stored.
+
+        Returns
+        ---------
+            category_paths (dict):
+                For each site_id, the path of the file of each category (None for the categories with failed pages).
+        """
+        category_paths = {site_id: {} for site_id in self.retrievers}
+        pending_categories = []
+        for site_id, retriever in self.retrievers.items():
+            for category_id in retriever.available_categories:
+                if check_existence and retriever.storage.exists(category_id):
+                    category_paths[site_id][category_id] = retriever.category_path(category_id)
+                else:
+                    pending_categories.append((site_id, category_id))
+
+        throttles = {id(retriever.throttle): retriever.throttle for retriever in self.retrievers.values()}
+        with ExitStack() as stack:
+            for throttle in throttles.values():
+                stack.enter_context(throttle.shared_between(self.n_jobs))
+            executor = stack.enter_context(ProcessPoolExecutor(max_workers = self.n_jobs, initializer = _initialize_worker,
+                                                               initargs = (self.retrievers,)))
+            categories = self.plan(executor, pending_categories, products_per_category, category_paths)
+            self.fetch(executor, categories, category_paths)
+        return category_paths
+
+    def plan(self, executor, pending_categories, products_per_category, category_paths):
+        """
+        Plans the pages of the pending categories (in the workers, since large categories need several requests),
+        and opens their checkpoints.
+
+        Returns
+        ---------
+            categories (list):
+                (site_id, category_id, checkpoint, pages, pending_pages) of each category, from the one with most pending pages.
+        """
+        futures = [executor.submit(_plan_category, site_id, category_id, products_per_category)
+                        for site_id, category_id in pending_categories]
+        categories = []
+        for (site_id, category_id), future in zip(pending_categories, futures):
+            retriever = self.retrievers[site_id]
+            pages, worker_stats = future.result()
+            retriever.merge_stats(worker_stats)
+            if isinstance(pages, Exception):
+                print(pages)
+                category_paths[site_id][category_id] = None
+                continue
+            checkpoint = retriever.storage.writer(category_id, resume = retriever.resume)
+            categories.append((site_id, category_id, checkpoint, pages, retriever.pending_pages(category_id, checkpoint, pages)))
+        return sorted(categories, key = lambda category: -len(category[4]))
+
+    def fetch(self, executor, categories, category_paths):
+        """
+        Sends the pages of the categories to the pool, and writes each one to its checkpoint when it arrives.
+        Failed pages go to the end of the queue, up to max_page_retries times. Each category is finished
+        as soon as its last page is written.
+        """
+        queue = deque((site_id, category_id, page, 0) for site_id, category_id, checkpoint, pages, pending_pages in categories
+                                                            for page in pending_pages)
+        checkpoints = {(site_id, category_id): (checkpoint, pages) for site_id, category_id, checkpoint, pages, pending_pages in categories}
+        remaining = {(site_id, category_id): len(pending_pages) for site_id, category_id, checkpoint, pages, pending_pages in categories}
+        for (site_id, category_id), pending in remaining.items():
+            if not pending:
+                category_paths[site_id][category_id] = self.finish(site_id, category_id, *checkpoints[(site_id, category_id)])
+
+        progress = tqdm(total = len(queue), disable = not self.verbose)
+        in_flight = {}
+        while queue or in_flight:
+            while queue and len(in_flight) < self.max_in_flight:
+                site_id, category_id, page, attempts = unit = queue.popleft()
+                in_flight[executor.submit(_fetch_page, site_id, category_id, page)] = unit
+            done, _ = wait(in_flight, return_when = FIRST_COMPLETED)
+            for future in done:
+                site_id, category_id, page, attempts = in_flight.pop(future)
+                retriever = self.retrievers[site_id]
+                checkpoint, pages = checkpoints[(site_id, category_id)]
+                key, shard, offset = page
+                page_df, worker_stats = future.result()
+                retriever.merge_stats(worker_stats)
+                if isinstance(page_df, PageFetchError):
+                    if attempts < retriever.max_page_retries:
+                        queue.append((site_id, category_id, page, attempts + 1))
+                        continue
+                    print(page_df)
+                    checkpoint.mark_failed(key, attempts + 1, page_df)
+                    retriever.metrics.record_failed_page()
+                else:
+                    retriever.write_page(checkpoint, category_id, page, page_df)
+                progress.update()
+                remaining[(site_id, category_id)] -= 1
+                if not remaining[(site_id, category_id)]:
+                    category_paths[site_id][category_id] = self.finish(site_id, category_id, checkpoint, pages)
+        progress.close()
+
+    def finish(self, site_id, category_id, checkpoint, pages):
+        return self.retrievers[site_id].finish_category(category_id, checkpoint, pages)
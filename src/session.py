@@ -0,0 +1,27 @@
+# Connection pooled HTTP sessions for the Mercado Libre API.
+# A session keeps its TCP+TLS connections alive between requests, so a crawl opens a handful of
+# connections per worker instead of one for every request.
+
+import requests
+from requests.adapters import HTTPAdapter
+
+def create_session(pool_size = 10):
+    """
+    Creates a requests.Session with a pool of keep-alive connections.
+
+    Params
+    --------
+        pool_size (int):
+            (Default 10) Maximum number of connections kept alive for each host.
+
+    Returns
+    ---------
+        session (requests.Session):
+            A session that reuses its connections between requests.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections = pool_size, pool_maxsize = pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update({'Connection': 'keep-alive'})
+    return session
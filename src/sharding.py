@@ -0,0 +1,185 @@
+# Splits the categories larger than the offset limit of the search API into shards that fit under it.
+# The search only pages up to max_offset products (1000 without special access), so a category with more products
+# can't be listed with a single stream of offsets. The planner walks the children of the category (/categories/{id})
+# and, when a leaf is still too large, splits it by price ranges (&price=low-high), bisecting each range until
+# the products of every shard can be paged. The pages of all the shards are then crawled like any other page.
+# The bounds of the price filter are inclusive, so the ranges of a split never share a bound: the upper range
+# starts one price_step (a cent) above the lower one.
+
+import warnings
+
+SEARCH_PAGE_SIZE = 50
+
+def price_filter(price_range):
+    """
+    The value of the price parameter of the search for a (low, high) range. None is an open end (*).
+    """
+    low, high = price_range
+    return f"{'*' if low is None else low}-{'*' if high is None else high}"
+
+def shard_label(shard):
+    """
+    A readable name of a shard, e.g. MCO3697 or MCO3697 [0.0-500.0].
+    """
+    if shard is None:
+        return None
+    if shard['price_range'] is None:
+        return shard['category_id']
+    return f"{shard['category_id']} [{price_filter(shard['price_range'])}]"
+
+def page_key(category_id, shard, offset):
+    """
+    The key of a page in the checkpoint of its category, e.g. MCO3697 [0.0-500.0] (820)/50. It only depends on the
+    shard (its category, price range and total) and the offset inside it: when the total of a shard changes between
+    an interrupted extraction and its resume, the pages of that shard are requested again (and the previous ones
+    discarded), while the pages of the other shards are kept. The pages of a category that isn't split are keyed
+    by their offset.
+    """
+    if shard['category_id'] == category_id and shard['price_range'] is None:
+        return offset
+    return f"{shard_label(shard)} ({shard['total']})/{offset}"
+
+def page_keys(pages):
+    """
+    The keys of the pages of a category, used by its checkpoint.
+    """
+    return [key for key, shard, offset in pages]
+
+
+class ShardPlanner:
+    """
+    Plans the pages of a category, with the category tree and price ranges, so no page is beyond max_offset.
+
+    Example:
+        >>> planner = ShardPlanner(retriever, max_offset = 1000)
+        >>> shards = planner.shards('MCO1000') # [{'category_id': 'MCO3697', 'price_range': None, 'total': 820}, ...]
+        >>> pages = planner.pages('MCO1000', products_per_category = 10000) # [(key, shard, offset), ...]
+    """
+
+    def __init__(self, retriever, max_offset = 1000, initial_price = 1000.0, min_price_width = 1.0, price_step = 0.01,
+                 max_split_depth = 50):
+        """
+        Params:
+        --------
+            retriever (retrieve.meliRetriever):
+                Sends the requests (get_json) and builds their URLs.
+
+            max_offset (int):
+                (Default 1000) Number of products of a search that can be reached by its offset. If None, there's
+                               no limit and every category is a single shard.
+
+            initial_price (float):
+                (Default 1000.0) First upper bound tried when a leaf is split by price. The open range above it
+                                 is split by doubling the bound.
+
+            min_price_width (float):
+                (Default 1.0) Price ranges narrower than this aren't split (their products share the price). If they
+                              are still larger than max_offset, only their first max_offset products are requested.
+
+            price_step (float):
+                (Default 0.01) The smallest difference between two prices. Split points are multiples of it, and the
+                               upper range of a split starts at the split point plus price_step.
+
+            max_split_depth (int):
+                (Default 50) Maximum number of nested splits of a price range (the open range above initial_price
+                             is doubled at most this many times). A range that is still too large is kept as a
+                             single shard, and only its first max_offset products are requested.
+        """
+        self.retriever = retriever
+        self.max_offset = max_offset if max_offset is not None else float('inf')
+        self.initial_price = initial_price
+        self.min_price_width = min_price_width
+        self.price_step = price_step
+        self.max_split_depth = max_split_depth
+
+    def shards(self, category_id, category_info = None):
+        """
+        Splits a category into shards with at most max_offset products (when possible).
+
+        Returns
+        ---------
+            shards (list):
+                A dict for each shard with the category_id to search, its price_range ((low, high), or None
+                for the whole category) and the total of products the API reports for it.
+        """
+        if category_info is None:
+            category_info = self.retriever.get_json(self.retriever.category_url(category_id))
+        total = category_info['total_items_in_this_category']
+        if total <= self.max_offset:
+            return [self.shard(category_id, None, total)]
+
+        children = category_info.get('children_categories') or []
+        if not children:
+            return self.split_prices(category_id, (0.0, None), total)
+        shards = []
+        for child in children:
+            if child['total_items_in_this_category'] <= self.max_offset: # The listing of the parent has its total
+                shards.append(self.shard(child['id'], None, child['total_items_in_this_category']))
+            else:
+                shards.extend(self.shards(child['id']))
+        return shards
+
+    def split_prices(self, category_id, price_range, total, depth = 0):
+        """
+        Bisects a price range of a leaf category until each part has at most max_offset products. The range
+        [low, high] is split into [low, middle] and [middle + price_step, high], and each part is counted with
+        the API. An open range (low, None) is split at twice its lower bound. If the range was already split
+        max_split_depth times, or the API doesn't apply the price filter (both parts have the total of the range),
+        the range is kept as a single shard, with a warning.
+        """
+        low, high = price_range
+        if total <= self.max_offset or (high is not None and high - low <= self.min_price_width):
+            return [self.shard(category_id, price_range, total)]
+        if depth >= self.max_split_depth:
+            return [self.capped_shard(category_id, price_range, total, f'after {depth} splits of its price range')]
+
+        middle = self.round_price((low + high)/2 if high is not None else max(2*low, self.initial_price))
+        lower_range, upper_range = (low, middle), (self.round_price(middle + self.price_step), high)
+        lower_total, upper_total = self.count(category_id, lower_range), self.count(category_id, upper_range)
+        if lower_total == total and upper_total == total:
+            return [self.capped_shard(category_id, price_range, total, 'the search ignores its price filter')]
+        return (self.split_prices(category_id, lower_range, lower_total, depth + 1) +
+                self.split_prices(category_id, upper_range, upper_total, depth + 1))
+
+    def capped_shard(self, category_id, price_range, total, reason):
+        """
+        A shard that can't be split further, of which only the first max_offset products are requested.
+        """
+        shard = self.shard(category_id, price_range, total)
+        warnings.warn(f'{shard_label(shard)} still has {total} products ({reason}): only the first '
+                      f'{self.max_offset} are requested')
+        return shard
+
+    def round_price(self, price):
+        return round(round(price/self.price_step)*self.price_step, 6)
+
+    def count(self, category_id, price_range):
+        """
+        The number of products of a category in a price range, from the paging of its first search page.
+        """
+        shard = self.shard(category_id, price_range, None)
+        search_json = self.retriever.get_json(self.retriever.page_url(self.retriever.site_id, category_id, 0, shard = shard))
+        return search_json['paging']['total']
+
+    def shard(self, category_id, price_range, total):
+        return {'category_id': category_id, 'price_range': price_range, 'total': total}
+
+    def pages(self, category_id, products_per_category):
+        """
+        The pages to request for a category, up to products_per_category products, shard by shard.
+
+        Returns
+        ---------
+            pages (list):
+                (key, shard, offset) of each page. The offset is relative to the search of the shard, and the key
+                identifies the page in the checkpoint of the category (see page_key).
+        """
+        pages = []
+        shard_start = 0
+        for shard in self.shards(category_id):
+            if shard_start >= products_per_category:
+                break
+            shard['planned'] = min(shard['total'], self.max_offset, products_per_category - shard_start)
+            pages.extend((page_key(category_id, shard, offset), shard, offset) for offset in range(0, shard['planned'], SEARCH_PAGE_SIZE))
+            shard_start += shard['planned']
+        return pages
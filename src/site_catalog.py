@@ -0,0 +1,130 @@
+# The sites of MELI and the categories of each one, without a request for every retriever.
+# The metadata is looked up in a cache file written by previous runs, then in the catalog bundled with the
+# package (site_catalog.json: the sites and the categories of MCO), and only requested to the API
+# (/sites and /sites/{site_id}/categories) when it's missing from both, or when a refresh is requested.
+
+import os
+import json
+
+BUNDLED_CATALOG = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'site_catalog.json')
+BUNDLED_API_URL = 'https://api.mercadolibre.com' # The API described by the bundled catalog
+
+class SiteCatalog:
+    """
+    Site and category metadata with a local cache.
+
+    Example:
+        >>> catalog = SiteCatalog('data/.site_catalog.json')
+        >>> catalog.site_id('Colombia', request_json) # request_json('/sites') is only called if Colombia isn't known
+        >>> catalog.categories('MCO', request_json) # {category_id: category_name}
+    """
+
+    def __init__(self, path = None, bundled_path = BUNDLED_CATALOG, refresh = False):
+        """
+        Params:
+        --------
+            path (string):
+                (Default None) Cache file where the metadata requested to the API is stored. If None, nothing is stored.
+
+            bundled_path (string):
+                (Default site_catalog.json of the package) Catalog used when the metadata isn't in the cache.
+                                                           If None, only the cache and the API are used.
+
+            refresh (bool):
+                (Default False) Requests the metadata to the API the first time it's used, and updates the cache.
+        """
+        self.path = path
+        self.bundled_path = bundled_path
+        self.refresh = refresh
+        self._catalog = None
+        self._refreshed = set()
+
+    @property
+    def catalog(self):
+        """
+        The bundled catalog updated with the cache, read the first time it's needed.
+        """
+        if self._catalog is None:
+            self._catalog = {'sites': [], 'categories': {}}
+            for path in (self.bundled_path, self.path):
+                stored_catalog = self.read(path)
+                if stored_catalog is not None:
+                    self._catalog['sites'] = stored_catalog.get('sites') or self._catalog['sites']
+                    self._catalog['categories'].update(stored_catalog.get('categories', {}))
+        return self._catalog
+
+    @staticmethod
+    def read(path):
+        if path is None or not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding = 'utf-8') as catalog_file:
+            return json.load(catalog_file)
+
+    def write(self):
+        if self.path is None:
+            return
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok = True)
+        stored_catalog = self.read(self.path) or {'categories': {}} # Keeps the categories stored by other processes
+        catalog = {'sites': self.catalog['sites'], 'categories': {**stored_catalog['categories'], **self.catalog['categories']}}
+        temporary_path = f'{self.path}.{os.getpid()}.tmp'
+        with open(temporary_path, 'w', encoding = 'utf-8') as catalog_file:
+            json.dump(catalog, catalog_file, ensure_ascii = False)
+        os.replace(temporary_path, self.path)
+
+    def needs_request(self, key, known):
+        return not known or (self.refresh and key not in self._refreshed)
+
+    def site_id(self, site_name, request_json):
+        """
+        The ID of a site.
+
+        Params:
+        --------
+            site_name (string):
+                The name of the site (e.g. Colombia).
+
+            request_json (function):
+                Requests a path of the API (e.g. /sites) and returns its JSON. Only called if the site isn't known.
+
+        Returns
+        ---------
+            site_id (string):
+                The site ID, or None if the API doesn't list the site.
+        """
+        site = self.find_site(site_name)
+        if self.needs_request('sites', site is not None):
+            self.catalog['sites'] = request_json('/sites')
+            self._refreshed.add('sites')
+            self.write()
+            site = self.find_site(site_name)
+        return site['id'] if site is not None else None
+
+    def find_site(self, site_name):
+        return next((site for site in self.catalog['sites'] if site['name'] == site_name), None)
+
+    def categories(self, site_id, request_json):
+        """
+        The top level categories of a site.
+
+        Params:
+        --------
+            site_id (string):
+                The ID of the site.
+
+            request_json (function):
+                Requests a path of the API and returns its JSON. Only called if the categories of the site aren't known.
+
+        Returns
+        ---------
+            categories_dictionary (dict):
+                A dictionary containing {category_id: category_name}
+        """
+        categories_list = self.catalog['categories'].get(site_id)
+        if self.needs_request(site_id, categories_list is not None):
+            categories_list = request_json(f'/sites/{site_id}/categories')
+            self.catalog['categories'][site_id] = categories_list
+            self._refreshed.add(site_id)
+            self.write()
+        return {category['id']: category['name'] for category in categories_list}
@@ -0,0 +1,380 @@
+# Storage of the extracted products.
+# The pages of each category are streamed to disk as they arrive (see checkpoint.py), and the dataset of the
+# whole site is produced by merging the category files without loading them in memory.
+# Two backends are available: ';'-separated CSVs (CSVStorage) and typed Parquet files partitioned
+# by site and category (ParquetStorage).
+
+import io
+import os
+import shutil
+import pandas as pd
+from .checkpoint import CategoryCheckpoint, page_csv
+
+# Columns of the CSV of each category, in order.
+OUTPUT_COLUMNS = ['id', 'title', 'price', 'available_quantity', 'sold_quantity', 'buying_mode', 'listing_type_id',
+                  'condition', 'accepts_mercadopago', 'original_price', 'category_id', 'seller_level_id', 'seller_powerseller',
+                  'positive_rating', 'negative_rating', 'neutral_rating', 'free_shipping', 'store_pickup', 'number_of_tags',
+                  'is_official_store', 'month_update', 'year_update', 'year_created', 'month_created', 'total_questions',
+                  'category_name']
+
+# Types of the columns, as built by meliRetriever.build_page_df
+# (names of the pyarrow types, so pyarrow is only imported by ParquetStorage).
+OUTPUT_TYPES = [
+    ('id', 'string'),
+    ('title', 'string'),
+    ('price', 'float64'),
+    ('available_quantity', 'int64'),
+    ('sold_quantity', 'int64'),
+    ('buying_mode', 'string'),
+    ('listing_type_id', 'string'),
+    ('condition', 'string'),
+    ('accepts_mercadopago', 'bool_'),
+    ('original_price', 'float64'),
+    ('category_id', 'string'),
+    ('seller_level_id', 'string'),
+    ('seller_powerseller', 'string'),
+    ('positive_rating', 'float64'),
+    ('negative_rating', 'float64'),
+    ('neutral_rating', 'float64'),
+    ('free_shipping', 'bool_'),
+    ('store_pickup', 'bool_'),
+    ('number_of_tags', 'int32'),
+    ('is_official_store', 'bool_'),
+    ('month_update', 'int8'),
+    ('year_update', 'int16'),
+    ('year_created', 'int16'),
+    ('month_created', 'int8'),
+    ('total_questions', 'int32'),
+    ('category_name', 'string')
+]
+
+def output_schema(types = OUTPUT_TYPES):
+    """
+    The pyarrow.Schema of the columns of the Parquet files (see OUTPUT_TYPES).
+    """
+    import pyarrow as pa
+    return pa.schema([(name, getattr(pa, type_name)()) for name, type_name in types])
+
+def __getattr__(name):
+    if name == 'OUTPUT_SCHEMA': # Built the first time it's used
+        return output_schema()
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+# Counts written as integers by CSVStorage, even on pages where some of them are missing.
+INTEGER_COLUMNS = ['available_quantity', 'sold_quantity', 'number_of_tags', 'total_questions']
+
+# Columns used by the features of the model notebooks (and its target, sold_quantity).
+MODEL_COLUMNS = ['listing_type_id', 'condition', 'total_questions', 'year_created', 'month_created',
+                 'original_price', 'year_update', 'month_update', 'sold_quantity']
+
+class CSVStorage:
+    """
+    Stores the products of each category in a ';'-separated CSV (folder/{category_id}.csv).
+
+    Example:
+        >>> storage = CSVStorage('data')
+        >>> writer = storage.writer('MCO1000')
+        >>> writer.write_page(0, page_df)
+        >>> writer.finalize()
+        >>> storage.merge(['MCO1000', 'MCO1039'], 'data/ColombianData.csv')
+    """
+
+    def __init__(self, folder = 'data', columns = OUTPUT_COLUMNS, integer_columns = INTEGER_COLUMNS):
+        """
+        Params:
+        --------
+            folder (string):
+                (Default data) Folder where the files are stored.
+
+            columns (list):
+                (Default OUTPUT_COLUMNS) The columns of the files, in order.
+
+            integer_columns (list):
+                (Default INTEGER_COLUMNS) Columns written as integers, so a missing value doesn't turn the
+                                          other values of its page into floats (785.0).
+        """
+        self.folder = folder
+        self.columns = list(columns)
+        self.integer_columns = list(integer_columns)
+
+    def path(self, category_id):
+        """
+        Path of the file that stores the products of a category.
+        """
+        return os.path.join(self.folder, f'{category_id}.csv')
+
+    def exists(self, category_id):
+        return os.path.exists(self.path(category_id))
+
+    def writer(self, category_id, resume = True):
+        """
+        A CategoryCheckpoint that appends the pages of a category to disk as they arrive.
+        """
+        os.makedirs(self.folder, exist_ok = True)
+        return CategoryCheckpoint(self.path(category_id), self.columns, resume = resume, integer_columns = self.integer_columns)
+
+    def read(self, category_id, columns = None, **kwargs):
+        """
+        Loads the products of a category. The keyword arguments are passed to pandas.read_csv.
+        """
+        return pd.read_csv(self.path(category_id), sep = ';', usecols = columns, **kwargs)
+
+    def load(self, category_ids, columns = None):
+        """
+        Loads the products of several categories in a single DataFrame.
+
+        Params
+        --------
+            category_ids (list):
+                The categories to load.
+
+            columns (list):
+                (Default None) The columns to load. If None, loads all of them.
+        """
+        category_dataframes = [self.read(category_id, columns = columns) for category_id in category_ids]
+        if not category_dataframes:
+            return pd.DataFrame(columns = columns or self.columns)
+        return pd.concat(category_dataframes, axis = 0, ignore_index = True)
+
+    def iter_chunks(self, category_id, columns = None, chunksize = 50000):
+        """
+        Loads the products of a category in chunks of at most chunksize rows, without loading the whole file.
+        """
+        return self.read(category_id, columns = columns, chunksize = chunksize)
+
+    def remove(self, category_id):
+        os.remove(self.path(category_id))
+
+    def upsert(self, category_id, updates_df):
+        """
+        Replaces the stored products of a category that have the ids of updates_df, and adds the new ones.
+        The stored rows that don't change are copied as they are.
+        """
+        stored_df = self.read(category_id, dtype = str, keep_default_na = False)
+        kept_df = stored_df[~stored_df['id'].isin(updates_df['id'])]
+        temporary_path = f'{self.path(category_id)}.tmp'
+        with open(temporary_path, 'wb') as category_file:
+            category_file.write((';'.join(self.columns) + '\n').encode('utf-8'))
+            for rows_df in [kept_df, updates_df]:
+                category_file.write(page_csv(rows_df, self.columns, self.integer_columns).encode('utf-8'))
+        os.replace(temporary_path, self.path(category_id))
+
+    def merge(self, category_ids, file_name, chunksize = 50000):
+        """
+        Writes the products of several categories into a single CSV, copying the files in blocks
+        instead of loading them in memory. Files with a different header (e.g. written by older versions)
+        are reordered chunk by chunk.
+
+        Params
+        --------
+            category_ids (list):
+                The categories to merge.
+
+            file_name (string):
+                The output CSV.
+
+            chunksize (int):
+                (Default 50000) Rows loaded at once when a file has to be reordered.
+        """
+        header = ';'.join(self.columns) + '\n'
+        with open(file_name, 'wb') as output_file:
+            output_file.write(header.encode('utf-8'))
+            for category_id in category_ids:
+                with open(self.path(category_id), 'rb') as category_file:
+                    if category_file.readline() == header.encode('utf-8'):
+                        shutil.copyfileobj(category_file, output_file)
+                        continue
+                for chunk_df in self.read(category_id, chunksize = chunksize):
+                    output_file.write(page_csv(chunk_df, self.columns, self.integer_columns).encode('utf-8'))
+
+
+class ParquetStorage:
+    """
+    Stores the products of each category in a typed, compressed Parquet file partitioned by site
+    and category (folder/site={site_id}/category={category_id}/part-0.parquet). The site is the prefix
+    of the category ID (e.g. MCO for MCO1000).
+
+    The pages are staged in a CSV while the category is being extracted, so the checkpoints of
+    checkpoint.py work the same for both backends. The staged file is converted once the category is complete.
+
+    Example:
+        >>> storage = ParquetStorage('data/parquet')
+        >>> retriever = meliRetriever(site_name = 'Colombia', token = api_key, storage = storage)
+        >>> retriever.create_dataset()
+        >>> storage.load(columns = MODEL_COLUMNS, filters = [('sold_quantity', '>', 0)])
+    """
+
+    def __init__(self, folder = 'data/parquet', schema = None, compression = 'snappy'):
+        """
+        Params:
+        --------
+            folder (string):
+                (Default data/parquet) Root folder of the dataset.
+
+            schema (pyarrow.Schema):
+                (Default None) The columns of the files and their types. If None, output_schema().
+
+            compression (string):
+                (Default snappy) Compression codec of the Parquet files.
+        """
+        self.folder = folder
+        self.schema = schema if schema is not None else output_schema()
+        self.columns = self.schema.names
+        self.compression = compression
+
+    def partition(self, category_id):
+        """
+        Folder of the partition of a category.
+        """
+        return os.path.join(self.folder, f'site={category_id[:3]}', f'category={category_id}')
+
+    def path(self, category_id):
+        return os.path.join(self.partition(category_id), 'part-0.parquet')
+
+    def staging_path(self, category_id):
+        """
+        CSV where the pages of a category are appended during the extraction. Files starting with '_'
+        are ignored when the dataset is read.
+        """
+        return os.path.join(self.partition(category_id), '_part-0.csv')
+
+    def exists(self, category_id):
+        return os.path.exists(self.path(category_id))
+
+    def writer(self, category_id, resume = True):
+        """
+        A CategoryCheckpoint that appends the pages of a category to its staging CSV, and writes the
+        Parquet file when it is finalized.
+        """
+        os.makedirs(self.partition(category_id), exist_ok = True)
+        return _ParquetCheckpoint(self, category_id, resume = resume)
+
+    def typed_frame(self, category_df):
+        """
+        Casts the columns of a DataFrame read as strings to the types of the schema.
+        Values that can't be converted (e.g. a malformed thumbnail date) are stored as nulls.
+        """
+        import pyarrow as pa
+        category_df = category_df.reindex(columns = self.columns)
+        for field in self.schema:
+            column = category_df[field.name]
+            if pa.types.is_boolean(field.type):
+                category_df[field.name] = column.map({'True': True, 'False': False})
+            elif pa.types.is_integer(field.type) or pa.types.is_floating(field.type):
+                category_df[field.name] = pd.to_numeric(column, errors = 'coerce')
+        return category_df
+
+    def convert(self, category_id, csv_path, chunksize = 50000):
+        """
+        Writes the Parquet file of a category from a ';'-separated CSV (e.g. a file of CSVStorage),
+        loading it in chunks.
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        os.makedirs(self.partition(category_id), exist_ok = True)
+        temporary_path = os.path.join(self.partition(category_id), '_part-0.parquet.tmp')
+        with pq.ParquetWriter(temporary_path, self.schema, compression = self.compression) as parquet_writer:
+            for chunk_df in pd.read_csv(csv_path, sep = ';', dtype = str, chunksize = chunksize):
+                chunk_table = pa.Table.from_pandas(self.typed_frame(chunk_df), schema = self.schema, preserve_index = False)
+                parquet_writer.write_table(chunk_table)
+        os.replace(temporary_path, self.path(category_id))
+
+    def read(self, category_id, columns = None, filters = None):
+        """
+        Loads the products of a category.
+        """
+        import pyarrow.parquet as pq
+        return pq.read_table(self.path(category_id), columns = columns, filters = filters).to_pandas()
+
+    def load(self, category_ids = None, columns = None, filters = None, sites = None):
+        """
+        Loads the products of the dataset. Only the requested columns are read, and the filters are applied
+        while reading (row groups and partitions that don't match are skipped).
+
+        Params
+        --------
+            category_ids (list):
+                (Default None) The categories to load. If None, loads all of them.
+
+            columns (list):
+                (Default None) The columns to load. If None, loads all the columns of the schema.
+
+            filters (list):
+                (Default None) Filters in the format of pyarrow.parquet.read_table, e.g. [('price', '<', 1e6)].
+
+            sites (list):
+                (Default None) The sites to load. If None, loads all of them.
+
+        Returns
+        ---------
+            products_df (pandas.DataFrame):
+                The selected products and columns.
+        """
+        import pyarrow.parquet as pq
+        filters = list(filters or [])
+        if category_ids is not None:
+            if not category_ids:
+                return pd.DataFrame(columns = columns or self.columns)
+            filters.append(('category', 'in', list(category_ids)))
+        if sites is not None:
+            filters.append(('site', 'in', list(sites)))
+        products_table = pq.read_table(self.folder, columns = columns or self.columns, filters = filters or None,
+                                       partitioning = 'hive')
+        return products_table.to_pandas()
+
+    def iter_chunks(self, category_id, columns = None, chunksize = None):
+        """
+        Loads the products of a category one row group at a time (row groups have the chunksize of convert).
+        """
+        import pyarrow.parquet as pq
+        category_file = pq.ParquetFile(self.path(category_id))
+        for row_group in range(category_file.num_row_groups):
+            yield category_file.read_row_group(row_group, columns = columns).to_pandas()
+
+    def remove(self, category_id):
+        shutil.rmtree(self.partition(category_id))
+
+    def upsert(self, category_id, updates_df):
+        """
+        Replaces the stored products of a category that have the ids of updates_df, and adds the new ones.
+        The stored products are filtered in Arrow, without converting them to pandas.
+        """
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        import pyarrow.parquet as pq
+        stored_table = pq.read_table(self.path(category_id))
+        updated_ids = pa.array(updates_df['id'].astype(str).tolist(), type = pa.string())
+        kept_table = stored_table.filter(pc.invert(pc.is_in(stored_table.column('id'), value_set = updated_ids)))
+        updates_csv = updates_df.reindex(columns = self.columns).to_csv(sep = ';', index = False) # Same types as the crawled pages
+        updates_table = pa.Table.from_pandas(self.typed_frame(pd.read_csv(io.StringIO(updates_csv), sep = ';', dtype = str)),
+                                             schema = self.schema, preserve_index = False)
+        temporary_path = os.path.join(self.partition(category_id), '_part-0.parquet.tmp')
+        pq.write_table(pa.concat_tables([kept_table, updates_table]), temporary_path, compression = self.compression)
+        os.replace(temporary_path, self.path(category_id))
+
+    def merge(self, category_ids, file_name):
+        """
+        Writes the products of several categories into a single Parquet file, one row group at a time.
+        """
+        import pyarrow.parquet as pq
+        with pq.ParquetWriter(file_name, self.schema, compression = self.compression) as parquet_writer:
+            for category_id in category_ids:
+                category_file = pq.ParquetFile(self.path(category_id))
+                for row_group in range(category_file.num_row_groups):
+                    parquet_writer.write_table(category_file.read_row_group(row_group))
+
+
+class _ParquetCheckpoint(CategoryCheckpoint):
+    """
+    A CategoryCheckpoint that converts the staged CSV of a category to Parquet when it is finalized.
+    """
+
+    def __init__(self, storage, category_id, resume = True):
+        super().__init__(storage.staging_path(category_id), storage.columns, resume = resume)
+        self.storage = storage
+        self.category_id = category_id
+
+    def finalize(self, offsets = None):
+        super().finalize(offsets)
+        self.storage.convert(self.category_id, self.path)
+        os.remove(self.path)
@@ -0,0 +1,296 @@
+# Rate limiting utilities for the Mercado Libre API.
+# A single throttle is shared by every request made with the same API token, so the
+# limit holds for the token no matter how many coroutines are fetching at the same time.
+
+import time
+import threading
+from contextlib import contextmanager
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+class TokenBucket:
+    """
+    A token bucket that allows at most `rate` requests per second, with bursts of up to `capacity` requests.
+
+    Example:
+        >>> bucket = TokenBucket(rate = 10)
+        >>> bucket.acquire()              # Blocking code
+        >>> await bucket.acquire_async()  # Inside a coroutine
+    """
+
+    def __init__(self, rate, capacity = None):
+        """
+        Params:
+        --------
+            rate (float):
+                Maximum number of requests per second.
+
+            capacity (int):
+                (Default None) Maximum burst size. If None, it is equal to the rate.
+        """
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1, rate))
+        self.tokens = self.capacity
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        """
+        Takes one token from the bucket.
+
+        Returns
+        ---------
+            wait_time (float):
+                Seconds the caller must wait before sending the request.
+        """
+        with self.lock:
+            now = time.monotonic()
+            rate = self.effective_rate()
+            self.tokens = min(self.capacity, self.tokens + (now - self.last_refill)*rate)
+            self.last_refill = now
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens/rate
+
+    def effective_rate(self):
+        """
+        Requests per second allowed to this bucket.
+        """
+        return self.rate
+
+    def acquire(self):
+        """
+        Blocks until a request is allowed.
+
+        Returns
+        ---------
+            wait_time (float):
+                Seconds spent waiting.
+        """
+        wait_time = self.reserve()
+        if wait_time > 0:
+            time.sleep(wait_time)
+        return wait_time
+
+    async def acquire_async(self):
+        """
+        Waits, without blocking the event loop, until a request is allowed.
+
+        Returns
+        ---------
+            wait_time (float):
+                Seconds spent waiting.
+        """
+        wait_time = self.reserve()
+        if wait_time > 0:
+            import asyncio
+            await asyncio.sleep(wait_time)
+        return wait_time
+
+
+class AdaptiveThrottle(TokenBucket):
+    """
+    A token bucket whose rate follows the responses of the API (AIMD): the rate grows additively
+    while requests succeed, up to target_rate, and it is cut multiplicatively when the API answers
+    429 or 5xx. Retry-After and rate limit headers pause the requests until the API allows them again.
+
+    Example:
+        >>> throttle = AdaptiveThrottle(target_rate = 10)
+        >>> throttle.acquire()
+        >>> response = requests.get(url)
+        >>> throttle.record(response.status_code, response.headers)
+        >>> throttle.achieved_rate()
+    """
+
+    def __init__(self, target_rate, initial_rate = None, min_rate = 0.5, increase_step = None, decrease_factor = 0.5, processes = 1):
+        """
+        Params:
+        --------
+            target_rate (float):
+                Maximum number of requests per second for the token.
+
+            initial_rate (float):
+                (Default None) Starting rate. If None, half of target_rate.
+
+            min_rate (float):
+                (Default 0.5) The rate is never decreased below this value.
+
+            increase_step (float):
+                (Default None) Requests per second added to the rate after each second of successful requests.
+                               If None, a tenth of target_rate.
+
+            decrease_factor (float):
+                (Default 0.5) Factor applied to the rate after a 429 or 5xx response.
+
+            processes (int):
+                (Default 1) Number of processes sharing the token. Each one gets an equal share of the rates.
+        """
+        self.configured_min_rate = min_rate
+        self.configured_increase_step = increase_step
+        self.set_target_rate(target_rate)
+        self.decrease_factor = decrease_factor
+        self.processes = processes
+        initial_rate = initial_rate if initial_rate is not None else max(self.min_rate, self.target_rate/2)
+        super().__init__(initial_rate, capacity = 1)
+        self.paused_until = 0.0
+        self.last_decrease = 0.0
+        self.started = None
+        self.requests = 0
+        self.throttled = 0
+
+    def set_target_rate(self, target_rate):
+        """
+        Changes the maximum number of requests per second. The current rate is lowered if it's above it.
+        """
+        self.target_rate = float(target_rate)
+        self.min_rate = float(min(self.configured_min_rate, target_rate))
+        self.increase_step = self.configured_increase_step if self.configured_increase_step is not None else self.target_rate/10
+        if hasattr(self, 'rate'):
+            with self.lock:
+                self.rate = min(self.rate, self.target_rate)
+
+    def effective_rate(self):
+        return self.rate/self.processes
+
+    def reserve(self):
+        wait_time = super().reserve()
+        pause = self.paused_until - time.monotonic()
+        return max(wait_time, pause)
+
+    def record(self, status_code, headers = None):
+        """
+        Updates the rate based on a response of the API.
+
+        Params
+        --------
+            status_code (int):
+                The HTTP status code of the response.
+
+            headers (dict):
+                (Default None) The headers of the response.
+
+        Returns
+        ---------
+            retry (bool):
+                True if the request was rejected by the API and must be retried.
+        """
+        headers = headers or {}
+        with self.lock:
+            now = time.monotonic()
+            if self.started is None:
+                self.started = now
+            self.requests += 1
+            retry_after = self.__retry_after(headers)
+            if retry_after:
+                self.paused_until = max(self.paused_until, now + retry_after)
+
+            if status_code in RETRY_STATUS_CODES:
+                self.throttled += 1
+                if now - self.last_decrease > 1/self.rate: # Only one decrease for a burst of rejections.
+                    self.rate = max(self.min_rate, self.rate*self.decrease_factor)
+                    self.last_decrease = now
+                return True
+
+            self.rate = min(self.target_rate, self.rate + self.increase_step/self.rate)
+            return False
+
+    def __retry_after(self, headers):
+        """
+        Seconds to wait before the next request, based on Retry-After or X-RateLimit-* headers.
+        """
+        retry_after = headers.get('Retry-After')
+        if retry_after is not None:
+            try:
+                return float(retry_after)
+            except ValueError:
+                return None
+        remaining = headers.get('X-RateLimit-Remaining')
+        reset = headers.get('X-RateLimit-Reset')
+        if remaining is not None and reset is not None and float(remaining) <= 0:
+            reset = float(reset)
+            if reset > 1e9: # Epoch timestamp instead of seconds
+                reset = reset - time.time()
+            return max(0.0, reset)
+        return None
+
+    def achieved_rate(self):
+        """
+        Average number of requests per second since the first request.
+        """
+        if self.started is None:
+            return 0.0
+        elapsed = time.monotonic() - self.started
+        return self.requests/elapsed if elapsed > 0 else 0.0
+
+    def stats(self):
+        """
+        Summary of the throttle: target, current and achieved rates, and the rejected requests.
+        """
+        return {
+            'target_rate': self.target_rate,
+            'current_rate': self.rate,
+            'achieved_rate': self.achieved_rate(),
+            'requests': self.requests,
+            'throttled': self.throttled
+        }
+
+    def reset_stats(self):
+        """
+        Restarts the count of requests used to compute the achieved rate.
+        """
+        with self.lock:
+            self.started = time.monotonic()
+            self.requests = 0
+            self.throttled = 0
+
+    def merge(self, stats):
+        """
+        Adds the requests made by a copy of this throttle (e.g. in a worker process).
+        """
+        with self.lock:
+            if self.started is None:
+                self.started = time.monotonic()
+            self.requests += stats['requests']
+            self.throttled += stats['throttled']
+
+    @contextmanager
+    def shared_between(self, processes):
+        """
+        Splits the rates between processes while the context is active, so the token limit
+        holds when the throttle is copied to several worker processes.
+        """
+        previous = self.processes
+        self.processes = processes
+        try:
+            yield self
+        finally:
+            self.processes = previous
+
+
+_shared_throttles = {}
+_shared_throttles_lock = threading.Lock()
+
+def shared_throttle(key, target_rate, **kwargs):
+    """
+    Returns the AdaptiveThrottle associated with `key` (usually the API token), creating it if needed.
+    Every caller using the same key is limited by the same throttle. If the throttle exists with another
+    target_rate, the new target_rate is applied to it (the last caller sets the limit of the token).
+    """
+    with _shared_throttles_lock:
+        throttle = _shared_throttles.get(key)
+        if throttle is None:
+            throttle = AdaptiveThrottle(target_rate, **kwargs)
+            _shared_throttles[key] = throttle
+        elif throttle.target_rate != float(target_rate):
+            throttle.set_target_rate(target_rate)
+        return throttle
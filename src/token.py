@@ -6,16 +6,24 @@
 # The provided API Key will die after 6 hourse (based on the documentation)
 
 import time
-import meli
-from meli.rest import ApiException
 from pprint import pprint
-import urllib
+import urllib.parse
 from getpass import getpass
-# Defining the host, defaults to https://api.mercadolibre.com
-# See configuration.py for a list of all supported configuration parameters.
-configuration = meli.Configuration(
-    host = "https://api.mercadolibre.com"
-)
+
+def __getattr__(name):
+    """
+    The module attribute configuration (the configuration of the meli SDK) is created the first time it's used,
+    so importing this module doesn't import the SDK.
+    """
+    if name == 'configuration':
+        import meli
+        # Defining the host, defaults to https://api.mercadolibre.com
+        # See configuration.py for a list of all supported configuration parameters.
+        globals()['configuration'] = meli.Configuration(
+            host = "https://api.mercadolibre.com"
+        )
+        return globals()['configuration']
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
 
 class getAPIkey:
 
@@ -30,6 +38,7 @@ class getAPIkey:
                                             'client_id':'4892726125387151', 
                                             'redirect_uri':'https://www.mercadolibre.com.co/'
                                         })
+        import urllib.request
         f = urllib.request.urlopen("https://auth.mercadolibre.com.co/authorization?%s" % params)
 
         print(f.geturl())
@@ -38,6 +47,8 @@ class getAPIkey:
         return getpass('Please write the code:')
 
     def APIKey(self):
+        import meli
+        from meli.rest import ApiException
         with meli.ApiClient() as api_client:
         # Create an instance of the API class
             api_instance = meli.OAuth20Api(api_client)
@@ -0,0 +1,192 @@
+# Access tokens of MELI's API that refresh themselves.
+# The tokens last 6 hours and an extraction can take longer. TokenManager keeps the access and refresh tokens
+# in a JSON file shared by every process and thread of the retriever, and refreshes the access token before
+# it expires. A file lock makes sure only one process refreshes it (refresh tokens can only be used once);
+# the others wait and read the new token from the file.
+
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+try:
+    import fcntl
+except ImportError: # Windows: only the threads of a process are coordinated
+    fcntl = None
+
+class TokenRefreshError(Exception):
+    pass
+
+
+class TokenManager:
+    """
+    Provides a valid access token, refreshing it with the OAuth refresh_token grant before it expires.
+
+    Example:
+        >>> manager = TokenManager.from_authorization_code(code, client_id, client_secret, redirect_uri)
+        >>> retriever = meliRetriever('Colombia', token = manager) # Every request uses manager.access_token()
+        >>> manager = TokenManager(client_id, client_secret) # Later runs reuse the stored refresh token
+    """
+
+    def __init__(self, client_id, client_secret, refresh_token = None, access_token = None, expires_at = 0.0,
+                 path = 'data/.token.json', token_url = 'https://api.mercadolibre.com/oauth/token', refresh_margin = 600):
+        """
+        Params:
+        --------
+            client_id, client_secret (string):
+                Credentials of the application.
+
+            refresh_token (string):
+                (Default None) The refresh token. If None, the one stored in path is used.
+
+            access_token (string):
+                (Default None) A current access token, if any.
+
+            expires_at (float):
+                (Default 0.0) Epoch time when access_token expires.
+
+            path (string):
+                (Default data/.token.json) File where the tokens are stored and shared between processes.
+
+            token_url (string):
+                (Default https://api.mercadolibre.com/oauth/token) The OAuth token endpoint.
+
+            refresh_margin (float):
+                (Default 600) Seconds before the expiration when the access token is refreshed.
+        """
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.path = path
+        self.token_url = token_url
+        self.refresh_margin = refresh_margin
+        self.refreshes = 0
+        self.lock = threading.Lock()
+        self.tokens = {'access_token': access_token, 'refresh_token': refresh_token, 'expires_at': expires_at}
+        stored_tokens = self.read()
+        if stored_tokens is not None and (refresh_token is None or stored_tokens['refresh_token'] == refresh_token):
+            self.tokens = stored_tokens
+        elif refresh_token is not None:
+            self.write(self.tokens)
+        if self.tokens['refresh_token'] is None:
+            raise TokenRefreshError(f'There is no refresh token in {path}. Use TokenManager.from_authorization_code first.')
+
+    @classmethod
+    def from_authorization_code(cls, code, client_id, client_secret, redirect_uri, token_url = 'https://api.mercadolibre.com/oauth/token', **kwargs):
+        """
+        Exchanges the code of the authorization URL (see token.getAPIkey) for the first access and refresh tokens.
+        """
+        tokens = cls.request_tokens(token_url, {'grant_type': 'authorization_code', 'client_id': client_id,
+                                                'client_secret': client_secret, 'code': code, 'redirect_uri': redirect_uri})
+        return cls(client_id, client_secret, token_url = token_url, **tokens, **kwargs)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def read(self):
+        """
+        The tokens stored in the shared file, or None if there isn't one.
+        """
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, 'r') as token_file:
+            return json.load(token_file)
+
+    def write(self, tokens):
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok = True)
+        temporary_path = f'{self.path}.{os.getpid()}.tmp'
+        with open(temporary_path, 'w') as token_file:
+            json.dump(tokens, token_file)
+        os.replace(temporary_path, self.path)
+
+    @contextmanager
+    def file_lock(self):
+        """
+        Exclusive lock of the token file between processes.
+        """
+        if fcntl is None:
+            yield
+            return
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok = True)
+        with open(f'{self.path}.lock', 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def is_fresh(self, tokens):
+        return tokens['access_token'] is not None and tokens['expires_at'] - self.refresh_margin > time.time()
+
+    def cached_token(self):
+        """
+        The access token in memory if it's fresh, or None if it has to be refreshed (see access_token).
+        Never blocks, so it can be used inside a coroutine.
+        """
+        tokens = self.tokens
+        return tokens['access_token'] if self.is_fresh(tokens) else None
+
+    def access_token(self):
+        """
+        A valid access token. If it expires in less than refresh_margin seconds, it is refreshed first, unless
+        another process or thread already did it.
+        """
+        if self.is_fresh(self.tokens):
+            return self.tokens['access_token']
+        return self.refresh(self.tokens['access_token'])
+
+    def refresh(self, expired_token = None):
+        """
+        Refreshes the access token. The refresh is skipped if the token stored in the file is fresh and isn't
+        expired_token (e.g. another worker refreshed it while this one waited for the lock).
+
+        Params
+        --------
+            expired_token (string):
+                (Default None) The token that was found expired or was rejected by the API (401).
+
+        Returns
+        ---------
+            access_token (string):
+                The new access token.
+        """
+        with self.lock, self.file_lock():
+            stored_tokens = self.read() or self.tokens
+            if self.is_fresh(stored_tokens) and stored_tokens['access_token'] != expired_token:
+                self.tokens = stored_tokens
+                return self.tokens['access_token']
+
+            tokens = self.request_tokens(self.token_url, {'grant_type': 'refresh_token', 'client_id': self.client_id,
+                                                          'client_secret': self.client_secret,
+                                                          'refresh_token': stored_tokens['refresh_token']})
+            self.write(tokens)
+            self.tokens = tokens
+            self.refreshes += 1
+            return self.tokens['access_token']
+
+    @staticmethod
+    def request_tokens(token_url, data):
+        """
+        Sends a grant to the OAuth endpoint.
+
+        Returns
+        ---------
+            tokens (dict):
+                access_token, refresh_token and expires_at (epoch time).
+        """
+        import requests
+        response = requests.post(token_url, data = data, headers = {'Accept': 'application/json'})
+        if response.status_code != 200:
+            raise TokenRefreshError(f'The {data["grant_type"]} grant failed with status {response.status_code}: {response.text}')
+        token_json = response.json()
+        return {'access_token': token_json['access_token'], 'refresh_token': token_json['refresh_token'],
+                'expires_at': time.time() + token_json['expires_in']}